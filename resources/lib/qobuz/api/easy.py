@@ -4,18 +4,26 @@
 
     Add 'get' to qobuz.api.raw, All requests made trough this method are
     cached (see qobuz.cache.qobuz)
+    Reachability of the api drive the cache offline mode (see
+    qobuz.cache.connectivity), pinned entries are refreshed by the kooli
+    cache warmer when it's back
+    Fetched items are added to the local search index (see
+    qobuz.cache.search_index)
 
     :part_of: kodi-qobuz
     :copyright: (c) 2012-2018 by Joachim Basmaison, Cyril Leclerc
     :license: GPLv3, see LICENSE for more details.
 '''
+
 from qobuz import config
 from qobuz.api.raw import RawApi
+from qobuz.api.session import session
 from qobuz.api.user import current as current_user
 from qobuz.cache import cache
 from qobuz.debug import getLogger
 from qobuz.gui.util import notify_error
 from qobuz.util import common
+from qobuz.util.trace import tracer
 
 logger = getLogger(__name__)
 
@@ -35,6 +43,7 @@ class EasyApi(RawApi):
 
     notify = property(is_notification_enabled)
 
+    @tracer.traced('api.get')
     @cache.cached
     def get(self, *a, **ka):
         """Wrapper that cache query to our raw api. We are enforcing format
@@ -57,7 +66,8 @@ class EasyApi(RawApi):
             Pyton Dictionary on success
             None on error
 
-        ::note api.error will contain last error message
+        ::note api.error (or api.last_response) will contain last error
+        message for the current thread
         """
         key_to_del = []
         for key, value in ka.items():
@@ -81,18 +91,30 @@ class EasyApi(RawApi):
         # Passing user_id create different key for the cache...
         for label in self.__clean_ka(xpath[0], xpath[1], **ka):
             del ka[label]
-        response = getattr(self, methname)(**ka)
-        if self.status_code != 200:
+        self._local.response = None
+        data = getattr(self, methname)(**ka)
+        response = self.last_response
+        if response is not None:
+            self._update_connectivity(response)
+        if response is not None and not response.ok:
             logger.warn('Method: %s/%s: %s',
                         methname,
-                        self.error,
-                        self.status_code)
+                        response.error,
+                        response.status_code)
             if self.notify:
                 notify_error(
                     'API Error/{method} {status_code}'.format(
-                        method=methname, status_code=self.status_code),
-                    '{error}'.format(error=self.error))
-        return response
+                        method=methname, status_code=response.status_code),
+                    '{error}'.format(error=response.error))
+        if data is not None and cache.search.enabled:
+            cache.search.add_payload('/%s' % path, data)
+        return data
+
+    def _update_connectivity(self, response):
+        if response.unreachable:
+            cache.connectivity.set_unreachable()
+        else:
+            cache.connectivity.set_reachable()
 
     @classmethod
     def __clean_ka(cls, endpoint, method, **ka):
@@ -110,15 +132,20 @@ class EasyApi(RawApi):
 
     def login(self, username, password):
         """We are storing our authentication token back to our raw api on
-        success.
+        success. A persisted session is used when available so we don't
+        hit the network (see qobuz.api.session)
 
         ::return
             True on success, else False
         """
         if common.is_empty(username) and common.is_empty(password):
             return True
-        current_user.set_credentials(username, password)
-        if not current_user.login(api=self):
+        if session.restore(self, current_user, username, password):
+            return True
+        if not session.login(self, current_user, username, password):
             logger.error('Cannot login with current credentials')
             return False
         return True
+
+    def reauthenticate(self):
+        return session.reauthenticate(self, current_user)
@@ -10,22 +10,47 @@
     :license: GPLv3, see LICENSE for more details.
 '''
 import binascii
-import copy
 import hashlib
 import math
-import socket
 import sys
+import threading
 from itertools import izip, cycle
 from time import time
 
-import requests
-
 from qobuz import exception
 from qobuz.api.user import current as user
 from qobuz.debug import getLogger
+from qobuz.util.metrics import metrics
+from qobuz.util.trace import tracer
 
 logger = getLogger(__name__)
-socket.timeout = 5
+# (connect, read) seconds, a network accepting connections then hanging
+# must end as unreachable (offline mode, see qobuz.cache.connectivity)
+REQUEST_TIMEOUT = (5, 20)
+request_seconds = metrics.histogram(
+    'qobuz_api_request_seconds', 'Qobuz API request latency', ['endpoint'])
+request_total = metrics.counter(
+    'qobuz_api_requests_total', 'Qobuz API requests', ['endpoint', 'status'])
+
+
+class ApiResponse(object):
+    '''Outcome of one API call (payload, status, error, timing, bytes)'''
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.data = None
+        self.status_code = None
+        self.status = None
+        self.error = None
+        self.elapsed = 0.0
+        self.size = 0
+        # No answer at all (dns, connection, timeout...)
+        self.unreachable = False
+
+    def is_ok(self):
+        return self.status_code == 200
+
+    ok = property(is_ok)
 
 
 class RawApi(object):
@@ -33,21 +58,75 @@ class RawApi(object):
         self.appid = '285473059'  # XBMC
         self.version = '0.2'
         self.baseUrl = 'http://www.qobuz.com/api.json'
-        self.error = None
-        self.status_code = None
-        self.status = None
+        self._local = threading.local()
+        self.lock = threading.Lock()
         self._baseUrl = '%s/%s' % (self.baseUrl, self.version)
-        self.session = requests.Session()
+        self._session = None
         self.statContentSizeTotal = 0
         self.statTotalRequest = 0
         self.__set_s4()
 
-    def _api_error_string(self, request, _url='', _params=None, _json=''):
-        # params = {} if params is None else params
+    def get_session(self):
+        '''requests is imported on first network access, a listing served
+        from cache doesn't pay for it'''
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        return self._session
+
+    def set_session(self, session):
+        self._session = session
+
+    session = property(get_session, set_session)
+
+    def get_last_response(self):
+        return getattr(self._local, 'response', None)
+
+    last_response = property(get_last_response)
+
+    def _get_state(self, name):
+        response = self.get_last_response()
+        if response is None:
+            return None
+        return getattr(response, name)
+
+    def _set_state(self, name, value):
+        if self.get_last_response() is None:
+            self._local.response = ApiResponse(None)
+        setattr(self._local.response, name, value)
+
+    # error, status_code and status of the last call made by current thread,
+    # kept for code written before ApiResponse
+    def get_error(self):
+        return self._get_state('error')
+
+    def set_error(self, value):
+        self._set_state('error', value)
+
+    error = property(get_error, set_error)
+
+    def get_status_code(self):
+        return self._get_state('status_code')
+
+    def set_status_code(self, value):
+        self._set_state('status_code', value)
+
+    status_code = property(get_status_code, set_status_code)
+
+    def get_status(self):
+        return self._get_state('status')
+
+    def set_status(self, value):
+        self._set_state('status', value)
+
+    status = property(get_status, set_status)
+
+    @classmethod
+    def _api_error_string(cls, request, response):
         return '{reason} ({status_code}): {error}'.format(
             reason=request.reason,
-            status_code=self.status_code,
-            error=self.error)
+            status_code=response.status_code,
+            error=response.error)
 
     @classmethod
     def _check_ka(cls, ka, mandatory, allowed=None):
@@ -88,7 +167,8 @@ class RawApi(object):
             Return None if something went wrong
             Return raw data from qobuz on success as dictionary
 
-            * on error you can check error and status_code
+            * on error you can check error and status_code (per thread,
+              see last_response)
 
             Example:
 
@@ -101,60 +181,80 @@ class RawApi(object):
             Error: [200]
             Error: Bad Request [400]
         '''
-        self.statTotalRequest += 1
-        self.error = None
-        self.status_code = None
-        self.status = None
+        return self.request(params, uri, **opt).data
+
+    def request(self, params, uri, **opt):
+        '''Same as _api_request but return an ApiResponse, it's also
+        available as last_response (per thread) until next call
+        '''
+        response = ApiResponse(uri)
+        self._local.response = response
+        with self.lock:
+            self.statTotalRequest += 1
         url = self._baseUrl + uri
         useToken = False if (opt and 'noToken' in opt) else True
         headers = {}
         if useToken and user.get_token():
             headers['x-user-auth-token'] = user.get_token()
         headers['x-app-id'] = self.appid
-        # DEBUG
-        _copy_params = copy.deepcopy(params)
-        if 'password' in _copy_params:
-            _copy_params['password'] = '***'
-        # END / DEBUG
-
+        started = time()
         try:
-            r = self.session.post(url, data=params, headers=headers)
+            with tracer.span('api.http'):
+                r = self.session.post(url, data=params, headers=headers,
+                                      timeout=REQUEST_TIMEOUT)
         except Exception as e:
-            self.status_code = 500
-            self.error = 'Post request fail: %s' % e
-            return None
-        self.status_code = int(r.status_code)
-        if self.status_code != 200:
-            self.error = self._api_error_string(r, url, _copy_params)
-            return None
+            response.status_code = 500
+            response.error = 'Post request fail: %s' % e
+            response.unreachable = True
+            response.elapsed = time() - started
+            request_total.inc(endpoint=uri, status='error')
+            return response
+        response.elapsed = time() - started
+        request_seconds.observe(response.elapsed, endpoint=uri)
+        request_total.inc(endpoint=uri, status=r.status_code)
+        response.status_code = int(r.status_code)
+        if response.status_code == 401 and useToken and 'retry' not in opt:
+            if self.reauthenticate():
+                return self.request(params, uri, retry=True, **opt)
+            self._local.response = response
+        if response.status_code != 200:
+            response.error = self._api_error_string(r, response)
+            return response
         if not r.content:
-            self.error = 'Request return no content'
-            self.status_code = 500
-            logger.error('%s', self.error)
-            return None
-        self.statContentSizeTotal += sys.getsizeof(r.content)
+            response.error = 'Request return no content'
+            response.status_code = 500
+            logger.error('%s', response.error)
+            return response
+        response.size = sys.getsizeof(r.content)
+        with self.lock:
+            self.statContentSizeTotal += response.size
         # Retry get if connexion fail
         try:
-            response_json = r.json()
+            with tracer.span('api.json'):
+                response_json = r.json()
         except Exception as e:
             logger.warn('Json loads failed to load... retrying!\n %s', repr(e))
             try:
                 response_json = r.json()
             except Exception as e:
-                self.error = "Failed to load json two times...abort"
-                logger.warn('%s (%s)', self.error, e)
-                return None
+                response.error = "Failed to load json two times...abort"
+                logger.warn('%s (%s)', response.error, e)
+                return response
         if 'status' in response_json:
-            self.status = response_json['status']
-        if self.status == 'error':
-            self.error = self._api_error_string(r, url, _copy_params,
-                                                response_json)
-            self.status_code = 500
-            logger.warn('%s', self.error)
-            return None
-        if not response_json:
-            return None
-        return response_json
+            response.status = response_json['status']
+        if response.status == 'error':
+            response.error = self._api_error_string(r, response)
+            response.status_code = 500
+            logger.warn('%s', response.error)
+            return response
+        if response_json:
+            response.data = response_json
+        return response
+
+    def reauthenticate(self):
+        '''Called when our token is rejected (401), return True when a new
+        token is available and the request can be retried'''
+        return False
 
     def user_login(self, **ka):
         data = self._user_login(**ka)
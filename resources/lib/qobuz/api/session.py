@@ -0,0 +1,131 @@
+'''
+    qobuz.api.session
+    ~~~~~~~~~~~~~~~~~
+
+    Persist authentication token and user id between plugin invocations so
+    we don't login on every navigation.
+
+    The user payload (id, credential parameters...) is persisted with the
+    token, so no property needs a login. Session is trusted until it
+    expires or the API answer 401, then we login again (see
+    RawApi.reauthenticate).
+
+    ::example
+        from qobuz.api import api
+        from qobuz.api.session import session
+        from qobuz.api.user import current as user
+        if not session.restore(api, user, username, password):
+            session.login(api, user, username, password)
+
+    :part_of: kodi-qobuz
+    :copyright: (c) 2012-2018 by Joachim Basmaison, Cyril Leclerc
+    :license: GPLv3, see LICENSE for more details.
+'''
+import os
+from time import time
+
+from qobuz import config
+from qobuz.debug import getLogger
+from qobuz.util.hash import hashit
+
+logger = getLogger(__name__)
+
+SESSION_TTL = 60 * 60 * 24
+
+
+def make_owner(username, password):
+    '''Session is bound to credentials, changing them force a login'''
+    return hashit('%s/%s' % (username, password))
+
+
+class SessionManager(object):
+    def __init__(self, filename=None, ttl=SESSION_TTL):
+        self._filename = filename
+        self.ttl = ttl
+        self.statRestore = 0
+        self.statLogin = 0
+        self.statInvalidate = 0
+
+    def get_filename(self):
+        if self._filename is None:
+            self._filename = os.path.join(config.path.profile,
+                                          'session.local')
+        return self._filename
+
+    filename = property(get_filename)
+
+    def _storage(self):
+        from qobuz.storage import Storage
+        return Storage(self.filename)
+
+    def load(self, username, password):
+        '''Return persisted session (dict) or None when missing, expired or
+        bound to other credentials'''
+        try:
+            entry = dict(self._storage())
+        except Exception as e:
+            logger.warn('SessionLoadError %s', e)
+            return None
+        if entry.get('owner') != make_owner(username, password):
+            return None
+        user = entry.get('user')
+        if not entry.get('token') or not isinstance(user, dict) \
+                or not user.get('id'):
+            return None
+        if entry.get('created_on', 0) + self.ttl < time():
+            return None
+        return entry
+
+    def save(self, username, password, user_data, token):
+        try:
+            with self._storage() as storage:
+                storage.clear()
+                storage.update({
+                    'owner': make_owner(username, password),
+                    'user': user_data,
+                    'token': token,
+                    'created_on': time()
+                })
+            return True
+        except Exception as e:
+            logger.warn('SessionSaveError %s', e)
+            return False
+
+    def clear(self):
+        self.statInvalidate += 1
+        if os.path.exists(self.filename):
+            os.unlink(self.filename)
+
+    def restore(self, api, user, username, password):
+        '''Fill user from persisted session, False when a login is needed'''
+        entry = self.load(username, password)
+        if entry is None:
+            return False
+        self.statRestore += 1
+        user.set_credentials(username, password)
+        user.restore(entry['user'], entry['token'], api=api)
+        return True
+
+    def login(self, api, user, username, password, fresh=False):
+        '''Login and persist session, when fresh is True cached login
+        payload is dropped so we get a new token from remote'''
+        from qobuz.cache import cache
+        self.statLogin += 1
+        if fresh and cache.base_path is not None:
+            cache.forget('/user/login', username=username, password=password)
+        user.set_credentials(username, password)
+        if not user.login(api=api):
+            return False
+        self.save(username, password, user.get_property('user'),
+                  user.get_token())
+        return True
+
+    def reauthenticate(self, api, user):
+        '''Token rejected by remote (401)'''
+        logger.info('Session rejected, login again')
+        self.clear()
+        return self.login(api, user, user.username, user.password,
+                          fresh=True)
+
+
+session = SessionManager()
@@ -8,6 +8,17 @@ audio_format = {
     'hires_hsr': (27, 'stream', 'FLAC Hi-Res 24 bit >96 kHz & =< 192 kHz')
 }
 
+format_mimetype = {
+    5: 'audio/mpeg',
+    6: 'audio/flac',
+    7: 'audio/flac',
+    27: 'audio/flac'
+}
+
+
+def get_format_mimetype(format_id, default='audio/mpeg'):
+    return format_mimetype.get(int(format_id), default)
+
 
 def search(src, node, kind='tracks'):
     for n in src.data[kind]['items']:
@@ -90,6 +101,14 @@ class User(object):
     def get_token(self, default=None):
         return self.get_property('user_auth_token', default=default)
 
+    def restore(self, user_data, token, api=None):
+        '''Logged from a persisted session (see qobuz.api.session)'''
+        if api is not None:
+            self.api = api
+        self.init_states()
+        self.data = {'user': user_data, 'user_auth_token': token}
+        self.logged = True
+
     def login(self, api=None):
         if api is not None:
             self.api = api
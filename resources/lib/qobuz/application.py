@@ -6,11 +6,17 @@
     :copyright: (c) 2012-2018 by Joachim Basmaison, Cyril Leclerc
     :license: GPLv3, see LICENSE for more details.
 '''
+import os
 import sys
+import time
 
 from qobuz import config
 from qobuz.bootstrap import Bootstrap
+from qobuz.debug import getLogger
 from qobuz.registry import Registry
+from qobuz.util.trace import tracer
+
+logger = getLogger(__name__)
 
 
 class Application(object):
@@ -37,5 +43,21 @@ class Application(object):
     addon = property(get_addon)
 
     def start(self):
-        self.bootstrap.init_app()
-        self.bootstrap.dispatch()
+        if self.registry.get('debug', to='bool'):
+            tracer.enable()
+        try:
+            self.bootstrap.init_app()
+            self.bootstrap.dispatch()
+        finally:
+            if tracer.enabled:
+                self.report_trace()
+
+    def report_trace(self):
+        tracer.disable()
+        logger.info(tracer.format_summary(' '.join(sys.argv[2:])))
+        if config.path is not None and self.registry.get(
+                'debug_trace_file', to='bool'):
+            path = os.path.join(config.path.profile, 'trace-%s.json'
+                                % time.strftime('%Y%m%d-%H%M%S'))
+            if tracer.dump(path):
+                logger.info('Chrome trace written to %s', path)
@@ -11,14 +11,13 @@ import sys
 from kodi_six import xbmc
 
 from qobuz import exception
-from qobuz.cache import cache
+from qobuz import route
+from qobuz.cache import cache, cover_cache
 from qobuz.constants import Mode
 from qobuz.debug import getLogger
-from qobuz.dog import dog
 from qobuz.gui.util import dialogLoginFailure, containerRefresh
 from qobuz.gui.util import dialogServiceTemporarilyUnavailable
 from qobuz.node import Flag
-from qobuz.renderer import renderer
 import qobuz.config as config
 
 logger = getLogger(__name__)
@@ -27,25 +26,9 @@ logger = getLogger(__name__)
 def get_checked_parameters():
     '''Parse parameters passed to xbmc plugin as sys.argv
     '''
-    d = dog()
-    rparam = {}
-    if len(sys.argv) <= 1:
-        return rparam
-    paramstring = sys.argv[2]
-    if len(paramstring) >= 2:
-        params = sys.argv[2]
-        cleanedparams = params.replace('?', '')
-        pairsofparams = cleanedparams.split('&')
-
-        for i, _item in enumerate(pairsofparams):
-            splitparams = pairsofparams[i].split('=')
-            if (len(splitparams)) == 2:
-                if d.kv_is_ok(splitparams[0], splitparams[1]):
-                    rparam[splitparams[0]] = splitparams[1]
-                else:
-                    logger.warn('--- Invalid key: %s / value: %s' %
-                                (splitparams[0], splitparams[1]))
-    return rparam
+    if len(sys.argv) <= 2:
+        return {}
+    return route.parse(sys.argv[2])
 
 
 class MinimalBootstrap(object):
@@ -63,6 +46,27 @@ class MinimalBootstrap(object):
     @classmethod
     def init_cache(cls):
         cache.base_path = config.path.cache
+        # Plugin, kooli service and context scripts share this directory
+        cache.shared = True
+        cache.tags.base_path = config.path.tags
+        cache.pins_path = os.path.join(config.path.profile, 'pins.local')
+        cache.connectivity.path = os.path.join(config.path.cache,
+                                               'offline.marker')
+        cache.connectivity.forced = config.app.registry.get('offline_mode',
+                                                            to='bool')
+        if config.app.registry.get('cache_entities', to='bool'):
+            from qobuz.cache.entity_cache import EntityStore
+            # Entities outlive responses referencing them
+            cache.entities = EntityStore(
+                config.path.entities,
+                ttl=config.app.registry.get(
+                    'cache_duration_long', to='int') * 60 * 2)
+            # Search results are rebuilt from entities
+            if config.app.registry.get('search_local', to='bool'):
+                cache.search.base_path = config.path.search
+        cover_cache.base_path = config.path.combined_covers
+        cover_cache.budget = config.app.registry.get(
+            'image_cache_size', to='int', default=100) * 1024 * 1024
 
     @classmethod
     def bootstrap_registry(cls):
@@ -95,6 +99,10 @@ class MinimalBootstrap(object):
                                  'default'))
                 self.combined_covers = os.path.join(self.profile,
                                                     'combined_covers')
+                self.segments = os.path.join(self.profile, 'segments')
+                self.entities = os.path.join(self.cache, 'entities')
+                self.tags = os.path.join(self.cache, 'tags')
+                self.search = os.path.join(self.cache, 'search')
 
             def to_s(self):
                 out = 'profile : ' + self.profile + "\n"
@@ -117,6 +125,8 @@ class MinimalBootstrap(object):
         config.path._set_dir()
         config.path.mkdir(config.path.cache)
         config.path.mkdir(config.path.combined_covers)
+        config.path.mkdir(config.path.segments)
+        config.path.mkdir(config.path.entities)
 
     def bootstrap_sys_args(self):
         '''Store sys arguments'''
@@ -144,9 +154,11 @@ class MinimalBootstrap(object):
                 return True
             return False
         elif self.MODE == Mode.VIEW:
+            from qobuz.renderer import renderer
             r = renderer(self.nodeType, self.params)
             return r.run()
         elif self.MODE == Mode.VIEW_BIG_DIR:
+            from qobuz.renderer import renderer
             r = renderer(
                 self.nodeType,
                 parameters=self.params,
@@ -154,6 +166,7 @@ class MinimalBootstrap(object):
                 depth=-1)
             return r.run()
         elif self.MODE == Mode.SCAN:
+            from qobuz.renderer import renderer
             r = renderer(
                 self.nodeType,
                 parameters=self.params,
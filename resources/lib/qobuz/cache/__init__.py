@@ -9,6 +9,8 @@
     :license: GPLv3, see LICENSE for more details.
 '''
 
+from qobuz.cache.image_cache import ImageCache
 from qobuz.cache.qobuz_cache import QobuzCache
 
 cache = QobuzCache()
+cover_cache = ImageCache()
@@ -6,6 +6,9 @@
 
     ::cached decorator that will cache a function call based on his
     positional and named parameter
+        noRemote=True: only return cached data
+        forceRemote=True: fetch even when cached data is fresh, cached data
+                          stay when remote fail
 
     :part_of: kodi-qobuz
     :copyright: (c) 2012-2018 by Joachim Basmaison, Cyril Leclerc
@@ -13,6 +16,8 @@
 '''
 from time import time
 
+from qobuz.util.trace import tracer
+
 __seed__ = __name__ + '0.0.1'
 __magic__ = 0
 pos = 0
@@ -26,6 +31,17 @@ StoreError = 1 << 4
 DeleteError = 1 << 5
 
 
+class _NoLock(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a):
+        return False
+
+
+NO_LOCK = _NoLock()
+
+
 class BaseCache(object):
     """A base class for caching
     """
@@ -34,6 +50,17 @@ class BaseCache(object):
         self.cached_function_name = __name__
         if 'black_keys' not in self.__dict__:
             self.black_keys = []
+        self.statHit = 0
+        self.statMiss = 0
+        self.statDelete = 0
+        self.statSharedHit = 0
+        self.statStale = 0
+        self.statStaleHit = 0
+        # Cache used by many processes, fills are locked (see lock)
+        self.shared = False
+        # Serve stale entries without remote while offline
+        # (see qobuz.cache.connectivity)
+        self.connectivity = None
 
     def cached(self, f, *a, **ka):
         """Decorator
@@ -47,43 +74,124 @@ class BaseCache(object):
             if 'noRemote' in ka:
                 noRemote = bool(ka['noRemote'])
                 del ka['noRemote']
+            forceRemote = False
+            if 'forceRemote' in ka:
+                forceRemote = bool(ka['forceRemote'])
+                del ka['forceRemote']
             that.error = 0
             key = that.make_key(*a, **ka)
-            data = that.load(key, *a, **ka)
-            if data:
-                if not that.check_magic(data, *a, **ka):
-                    that.error &= BadMagic
-                elif not that.check_key(data, key, *a, **ka):
-                    that.error &= BadKey
-                elif that.is_fresh(key, data, *a, **ka):
-                    return data['data']
-                if not that.delete(key):
-                    that.error = DeleteError
+            if not forceRemote:
+                data = that.load_fresh(key, *a, **ka)
+                if data is not None:
+                    that.statHit += 1
+                    return data
+            that.statMiss += 1
+            if that.is_offline():
+                return that.load_stale(key, *a, **ka)
             if noRemote:
                 return None
-            data = f(self, *a, **ka)
-            if data is None or not data:
-                that.error &= NoData
-                return None
-            for black_key in that.black_keys:
-                if black_key in ka:
-                    del ka[black_key]
-            entry = {
-                'updated_on': time(),
-                'data': data,
-                'ttl': that.get_ttl(key, *a, **ka),
-                'pa': a,
-                'ka': ka,
-                'magic': __magic__,
-                'key': key
-            }
-            if not that.sync(key, entry):
-                that.error &= StoreError
-                return None
+            with that.lock(key):
+                if that.shared and not forceRemote:
+                    # Filled by another process while we were waiting
+                    data = that.load_fresh(key, *a, **ka)
+                    if data is not None:
+                        that.statSharedHit += 1
+                        return data
+                data = that.fill(key, f(self, *a, **ka), *a, **ka)
+            if data is None and that.is_offline():
+                # Remote became unreachable during this call
+                return that.load_stale(key, *a, **ka)
             return data
 
         return wrapped_function
 
+    def is_offline(self):
+        return self.connectivity is not None and self.connectivity.offline
+
+    def load_valid(self, key, *a, **ka):
+        """Return cache entry when valid (fresh or not), invalid entry is
+        deleted
+        """
+        with tracer.span('cache.load'):
+            data = self.load(key, *a, **ka)
+        if not data:
+            return None
+        with tracer.span('cache.check'):
+            if not self.check_magic(data, *a, **ka):
+                self.error &= BadMagic
+            elif not self.check_key(data, key, *a, **ka):
+                self.error &= BadKey
+            else:
+                return data
+        self.statDelete += 1
+        if not self.delete(key):
+            self.error = DeleteError
+        return None
+
+    def load_fresh(self, key, *a, **ka):
+        """Return cached data when entry is valid and fresh, else None (stale
+        entry is kept, served while offline and replaced by next fill)
+        """
+        data = self.load_valid(key, *a, **ka)
+        if data is None:
+            return None
+        if self.is_fresh(key, data, *a, **ka):
+            return data['data']
+        self.statStale += 1
+        return None
+
+    def load_stale(self, key, *a, **ka):
+        """Return cached data when entry is valid, fresh or not"""
+        data = self.load_valid(key, *a, **ka)
+        if data is None:
+            return None
+        self.statStaleHit += 1
+        return data['data']
+
+    def fill(self, key, data, *a, **ka):
+        if data is None or not data:
+            self.error &= NoData
+            return None
+        for black_key in self.black_keys:
+            if black_key in ka:
+                del ka[black_key]
+        entry = {
+            'updated_on': time(),
+            'data': data,
+            'ttl': self.get_ttl(key, *a, **ka),
+            'pa': a,
+            'ka': ka,
+            'magic': __magic__,
+            'key': key
+        }
+        with tracer.span('cache.sync'):
+            synced = self.sync(key, entry)
+        if not synced:
+            self.error &= StoreError
+            return None
+        return data
+
+    def lock(self, key):
+        """Context manager held while filling key, see shared"""
+        return NO_LOCK
+
+    def get_entry(self, *a, **ka):
+        """Return cache entry (data, updated_on, ttl...) for this call
+        without fetching it, None when not cached
+        """
+        key = self.make_key(*a, **ka)
+        return self.load(key, *a, **ka)
+
+    def get_pinned_keys(self):
+        """Keys never evicted by cache_util.clean_old"""
+        return set()
+
+    def forget(self, *a, **ka):
+        """Delete cache entry for this call, next call will hit remote
+        """
+        key = self.make_key(*a, **ka)
+        return self.delete(key, *a, **ka)
+
     @classmethod
     def is_fresh(cls, key, data, *a, **ka):
         if 'updated_on' not in data:
@@ -8,28 +8,83 @@
     :copyright: (c) 2012-2018 by Joachim Basmaison, Cyril Leclerc
     :license: GPLv3, see LICENSE for more details.
 '''
+import os
+import re
 
+from qobuz.cache.file_cache import LOCK_DIR
 from qobuz.debug import getLogger
-from qobuz.util.file import find, unlink
+from qobuz.util.file import FileLock, find, unlink
 
 logger = getLogger(__name__)
 
 
 def clean_old(cache):
-    def delete_one(filename):
-        data = cache.load_from_store(filename)
-        if not cache.check_magic(data):
-            raise TypeError('magic mismatch')
-        ttl = cache.is_fresh(data['key'], data)
-        if ttl:
-            return True
-        cache.delete(data['key'])
-        return True
-
-    find(cache.base_path, '^.*\.dat$', delete_one)
+    for _ in iter_clean_old(cache):
+        pass
     return True
 
 
+def iter_clean_old(cache):
+    '''Delete expired entries, yield after each file so the work can be
+    spread (see kooli warmer)'''
+    pinned = cache.get_pinned_keys()
+    pattern = re.compile(r'^.*\.dat$')
+    for dirname, _dirnames, filenames in os.walk(cache.base_path):
+        for filename in filenames:
+            if not pattern.match(filename):
+                continue
+            path = os.path.join(dirname, filename)
+            try:
+                _clean_one(cache, path, pinned)
+            except Exception as e:
+                logger.warn('CleanOldError %s %s', path, e)
+            yield path
+    for path in _iter_orphan_locks(cache):
+        yield path
+
+
+def _iter_orphan_locks(cache):
+    '''Remove lock files of keys without entry. A key being filled has no
+    entry yet, held lock files are skipped; a process that opened the file
+    just before we removed it may fetch the key twice, no more'''
+    lock_path = os.path.join(cache.base_path, LOCK_DIR)
+    try:
+        names = os.listdir(lock_path)
+    except OSError:
+        return
+    for name in names:
+        if not name.endswith('.lock'):
+            continue
+        key = name[:-len('.lock')]
+        if os.path.exists(os.path.join(cache.base_path, '%s.dat' % key)):
+            continue
+        path = os.path.join(lock_path, name)
+        lock = FileLock(path)
+        try:
+            if not lock.try_acquire():
+                continue  # Being filled
+            os.unlink(path)
+        except (IOError, OSError):  # Removed by another process
+            continue
+        finally:
+            lock.release()
+        yield path
+
+
+def _clean_one(cache, filename, pinned):
+    data = cache.load_from_store(filename)
+    if not data:  # Deleted meanwhile or corrupted (unlinked by load)
+        return False
+    if not cache.check_magic(data):
+        raise TypeError('magic mismatch')
+    if data['key'] in pinned:
+        return False
+    if cache.is_fresh(data['key'], data):
+        return False
+    # By path, entries can live in a sub directory (entities)
+    return unlink(filename)
+
+
 def clean_all(cache):
     def _delete_nocheck(filename):
         return unlink(filename)
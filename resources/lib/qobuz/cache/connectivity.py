@@ -0,0 +1,87 @@
+'''
+    qobuz.cache.connectivity
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Offline state of the cache, forced by the user or degraded when the api
+    is unreachable
+
+    While offline every cached call is made with noRemote and stale entries
+    are served. Degraded state is shared with other processes through a
+    marker file (its mtime), remote is tried again after retry_after
+    seconds so we don't wait for a network timeout on every call.
+
+    ::example
+        connectivity = Connectivity('/tmp/cache/offline.marker')
+        connectivity.set_unreachable()
+        connectivity.offline
+        True
+
+    :part_of: kodi-qobuz
+    :copyright: (c) 2012-2018 by Joachim Basmaison, Cyril Leclerc
+    :license: GPLv3, see LICENSE for more details.
+'''
+import os
+import time
+
+from qobuz.debug import getLogger
+from qobuz.util.file import unlink
+
+logger = getLogger(__name__)
+
+RETRY_AFTER = 60
+
+
+class Connectivity(object):
+    def __init__(self, path=None, retry_after=RETRY_AFTER):
+        self.path = path
+        self.retry_after = retry_after
+        self.forced = False
+        self._degraded_on = None
+        self.statUnreachable = 0
+        self.statRecover = 0
+
+    def get_degraded_on(self):
+        if self.path is None:
+            return self._degraded_on
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    def is_degraded(self):
+        degraded_on = self.get_degraded_on()
+        if degraded_on is None:
+            return False
+        return time.time() - degraded_on < self.retry_after
+
+    degraded = property(is_degraded)
+
+    def is_offline(self):
+        return self.forced or self.is_degraded()
+
+    offline = property(is_offline)
+
+    def set_unreachable(self):
+        self.statUnreachable += 1
+        if not self.is_degraded():
+            logger.warn('Api unreachable, serving cache for %ss',
+                        self.retry_after)
+        self._degraded_on = time.time()
+        if self.path is not None:
+            try:
+                with open(self.path, 'a'):
+                    os.utime(self.path, None)
+            except (IOError, OSError) as e:
+                logger.warn('OfflineMarkerError %s', e)
+
+    def set_reachable(self):
+        '''Return True when we were degraded (connectivity is back)'''
+        if self.get_degraded_on() is None:
+            return False
+        self._degraded_on = None
+        if self.path is not None and not unlink(self.path):
+            # Removed by another process, it handles the recovery
+            return False
+        self.statRecover += 1
+        logger.info('Api reachable again')
+        return True
@@ -0,0 +1,186 @@
+'''
+    qobuz.cache.entity_cache
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Normalized store for albums, tracks, artists and playlists
+
+    The same track is returned by /album/get, /playlist/get, favorites,
+    purchases and search. Before a response is cached, items of its lists
+    are stored once by (kind, id) and replaced by references, the response
+    is rebuilt from the store when loaded. When an entity is missing or
+    expired the whole response is a miss and is fetched again.
+
+    Fields bound to the list (playlist_track_id, position...) are kept in
+    the reference, the same track can be twice in a playlist.
+    Entities read or written are kept in memory, least recently used ones
+    are dropped past store_size (kooli runs for days).
+
+    ::example
+        entities = EntityStore('/tmp/entities', ttl=3600)
+        skeleton = entities.normalize(response)
+        response = entities.denormalize(skeleton)
+
+    :part_of: kodi-qobuz
+    :copyright: (c) 2012-2018 by Joachim Basmaison, Cyril Leclerc
+    :license: GPLv3, see LICENSE for more details.
+'''
+from collections import OrderedDict
+import threading
+
+from qobuz.cache.file_cache import FileCache
+from qobuz.debug import getLogger
+
+logger = getLogger(__name__)
+
+REF = '$ref'
+LIST_PATHS = [
+    ('albums', 'album'),
+    ('tracks', 'track'),
+    ('artists', 'artist'),
+    ('playlists', 'playlist'),
+]
+RELATION_FIELDS = ['playlist_track_id', 'position', 'created_at']
+SKIP_ENDPOINTS = ['/user/login', '/track/getFileUrl']
+STORE_SIZE = 4096
+
+
+class EntityCache(FileCache):
+    def __init__(self, ttl):
+        super(EntityCache, self).__init__()
+        self.ttl = ttl
+        # Entities can be fetched again, don't pay a fsync per item
+        self.durable = False
+
+    def get_ttl(self, *a, **ka):
+        return self.ttl
+
+
+class EntityStore(object):
+    def __init__(self, base_path=None, ttl=3600, store_size=STORE_SIZE):
+        self.cache = EntityCache(ttl)
+        self.cache.base_path = base_path
+        self.store_size = store_size
+        self.lock = threading.Lock()
+        self.store = OrderedDict()
+        self.statHit = 0
+        self.statMiss = 0
+        self.statWrite = 0
+
+    def get_base_path(self):
+        return self.cache.base_path
+
+    def set_base_path(self, path):
+        self.cache.base_path = path
+
+    base_path = property(get_base_path, set_base_path)
+
+    @classmethod
+    def handles(cls, endpoint):
+        return endpoint not in SKIP_ENDPOINTS
+
+    @classmethod
+    def _path(cls, kind, nid):
+        return '/%s/%s' % (kind, nid)
+
+    def _remember(self, ref, entity):
+        with self.lock:
+            self.store.pop(ref, None)
+            self.store[ref] = entity
+            while len(self.store) > self.store_size:
+                self.store.popitem(last=False)
+
+    def get(self, kind, nid, stale=False):
+        ref = (kind, str(nid))
+        with self.lock:
+            entity = self.store.pop(ref, None)
+            if entity is not None:
+                self.store[ref] = entity
+                self.statHit += 1
+                return entity
+        path = self._path(kind, nid)
+        load = self.cache.load_stale if stale else self.cache.load_fresh
+        entity = load(self.cache.make_key(path), path)
+        if entity is None:
+            self.statMiss += 1
+            return None
+        self.statHit += 1
+        self._remember(ref, entity)
+        return entity
+
+    def put(self, kind, item):
+        '''Merge item into stored entity, written only when it changed'''
+        nid = str(item['id'])
+        old = self.get(kind, nid)
+        entity = dict(old) if old is not None else {}
+        for key, value in item.items():
+            if key not in RELATION_FIELDS:
+                entity[key] = value
+        if entity != old:
+            path = self._path(kind, nid)
+            self.cache.fill(self.cache.make_key(path), entity, path)
+            self.statWrite += 1
+        self._remember((kind, nid), entity)
+        return entity
+
+    def _lists(self, data):
+        for name, kind in LIST_PATHS:
+            container = data.get(name)
+            if not isinstance(container, dict):
+                continue
+            items = container.get('items')
+            if not isinstance(items, list):
+                continue
+            yield name, kind, container, items
+
+    def normalize(self, data):
+        '''Store list items, return a copy of data referencing them'''
+        if not isinstance(data, dict):
+            return data
+        skeleton = dict(data)
+        for name, kind, container, items in self._lists(data):
+            refs = []
+            for item in items:
+                if not isinstance(item, dict) or item.get('id') is None:
+                    refs.append(item)
+                    continue
+                self.put(kind, item)
+                ref = {REF: '%s/%s' % (kind, item['id'])}
+                for key in RELATION_FIELDS:
+                    if key in item:
+                        ref[key] = item[key]
+                refs.append(ref)
+            skeleton[name] = dict(container, items=refs)
+        return skeleton
+
+    def denormalize(self, skeleton, stale=False):
+        '''Rebuild response, None when an entity is missing or expired
+        (missing only when stale)'''
+        if not isinstance(skeleton, dict):
+            return skeleton
+        data = dict(skeleton)
+        for name, _kind, container, refs in self._lists(skeleton):
+            items = []
+            for ref in refs:
+                if not isinstance(ref, dict) or REF not in ref:
+                    items.append(ref)
+                    continue
+                kind, nid = ref[REF].split('/', 1)
+                entity = self.get(kind, nid, stale=stale)
+                if entity is None:
+                    return None
+                item = dict(entity)
+                for key, value in ref.items():
+                    if key != REF:
+                        item[key] = value
+                items.append(item)
+            data[name] = dict(container, items=items)
+        return data
+
+    def references(self, skeleton):
+        '''Yield cache keys of entities referenced by skeleton'''
+        if not isinstance(skeleton, dict):
+            return
+        for _name, _kind, _container, refs in self._lists(skeleton):
+            for ref in refs:
+                if isinstance(ref, dict) and REF in ref:
+                    yield self.cache.make_key('/%s' % ref[REF])
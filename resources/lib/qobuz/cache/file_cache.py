@@ -10,22 +10,46 @@
 '''
 import json
 import os
+import threading
 import zlib
 
-from qobuz.cache.base_cache import BaseCache
+from qobuz.cache.base_cache import BaseCache, NO_LOCK
 from qobuz.debug import getLogger
 from qobuz.util.common import json_dumps
-from qobuz.util.file import RenamedTemporaryFile, unlink
+from qobuz.util.file import FileLock, RenamedTemporaryFile, unlink
 from qobuz.util.hash import hashit
 
 
 logger = getLogger(__name__)
 
+LOCK_DIR = 'locks'
+
+
+class KeyLock(FileLock):
+    '''FileLock taken once per thread, a nested call filling the same key
+    (login again on 401 while logging in) doesn't wait for itself'''
+
+    def __init__(self, path, held):
+        super(KeyLock, self).__init__(path)
+        self.held = held
+
+    def acquire(self):
+        self.held.add(self.path)
+        return super(KeyLock, self).acquire()
+
+    def release(self):
+        try:
+            super(KeyLock, self).release()
+        finally:
+            self.held.discard(self.path)
+
 
 class FileCache(BaseCache):
     def __init__(self):
         self.base_path = None
         self.ventile = False
+        self.durable = True
+        self._local = threading.local()
         super(FileCache, self).__init__()
 
     def load(self, key, *a, **ka):
@@ -40,26 +64,49 @@ class FileCache(BaseCache):
     def _make_path(self, key):
         return os.path.join(self.base_path, '%s.dat' % key)
 
+    def lock(self, key):
+        '''One lock file per key, so only one process fetch a key and slow
+        fetches of other keys don't wait (lock files of removed entries are
+        removed by cache_util.iter_clean_old)'''
+        if not self.shared:
+            return super(FileCache, self).lock(key)
+        lock_path = os.path.join(self.base_path, LOCK_DIR)
+        if not os.path.isdir(lock_path):
+            try:
+                os.makedirs(lock_path)
+            except OSError:  # Created by another process
+                pass
+        path = os.path.join(lock_path, '%s.lock' % key)
+        held = getattr(self._local, 'held', None)
+        if held is None:
+            held = self._local.held = set()
+        if path in held:
+            return NO_LOCK
+        return KeyLock(path, held)
+
     def sync(self, key, data, *a, **ka):
+        '''Atomic replace, concurrent readers get the old or the new entry'''
         filename = self._make_path(key)
-        unlink(filename)
         try:
             with RenamedTemporaryFile(filename) as wh:
                 wh.write(zlib.compress(json_dumps(data)))
                 wh.flush()
-                os.fsync(wh)
+                if self.durable:
+                    os.fsync(wh)
         except Exception as e:
-            unlink(filename)
             logger.error('Error: writing failed %s\nMessage %s', filename, e.__str__)
             return False
         return True
 
     def load_from_store(self, path):
         item_path = os.path.join(self.base_path, path)
-        if not os.path.exists(item_path):
+        try:
+            rh = open(item_path, 'rb')
+        except (IOError, OSError):
+            # Missing or deleted by another process
             return None
         do_unlink = False
-        with open(item_path, 'rb') as rh:
+        with rh:
             try:
                 return json.loads(zlib.decompress(rh.read()))
             except Exception as e:
@@ -0,0 +1,297 @@
+'''
+    qobuz.cache.image_cache
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    Disk cache for remote images (album covers), images made from them
+    (thumbnails, mosaics) are added to the same budget
+
+    An index (url -> file, size, access time, hits, validators) is kept
+    in memory and persisted next to the images so lookups don't touch the
+    filesystem. When the disk budget is exceeded least recently (lru) or
+    least frequently (lfu) used images are evicted. Stale entries are
+    revalidated with conditional requests (ETag / Last-Modified).
+    The plugin and kooli share the directory: entries each process touched
+    are merged into the index on disk under a lock. Hits trust the index,
+    a file evicted by the other process meanwhile is fetched again when
+    opening it fails (see recover) or when it's revalidated.
+
+    :part_of: kodi-qobuz
+    :copyright: (c) 2012-2018 by Joachim Basmaison, Cyril Leclerc
+    :license: GPLv3, see LICENSE for more details.
+'''
+import atexit
+import os
+import re
+import threading
+import time
+
+from qobuz.debug import getLogger
+from qobuz.storage import Storage
+from qobuz.util.file import FileLock, RenamedTemporaryFile, find, unlink
+from qobuz.util.hash import hashit
+
+logger = getLogger(__name__)
+
+IMAGE_FMT = 'cache-album-cover-{}.jpg'
+IMAGE_RE = '^%s$' % re.escape(IMAGE_FMT).replace(r'\{\}', '(.*)')
+INDEX_FILENAME = 'image-index.local'
+REVALIDATE_AFTER = 7 * 24 * 3600
+CHUNK_SIZE = 16 * 1024
+
+
+def _lru(entry):
+    return entry['atime']
+
+
+def _lfu(entry):
+    return (entry['hits'], entry['atime'])
+
+
+_policies = {'lru': _lru, 'lfu': _lfu}
+
+
+class ImageCache(object):
+    def __init__(self, base_path=None, budget=100 * 1024 * 1024,
+                 policy='lru'):
+        self.base_path = base_path
+        self.budget = budget
+        self.policy = policy
+        self._session = None
+        self.lock = threading.RLock()
+        self._index = None
+        self._total = 0
+        self._dirty = False
+        # Keys set or removed since last sync, merged with other processes
+        self._changed = set()
+        self._removed = set()
+        self.statHit = 0
+        self.statMiss = 0
+        self.statEvict = 0
+        atexit.register(self.sync)
+
+    def get_session(self):
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        return self._session
+
+    def set_session(self, session):
+        self._session = session
+
+    session = property(get_session, set_session)
+
+    def _make_path(self, key):
+        return os.path.join(self.base_path, IMAGE_FMT.format(key))
+
+    def get_index(self):
+        with self.lock:
+            if self._index is None:
+                self._index = Storage(
+                    os.path.join(self.base_path, INDEX_FILENAME))
+                if not len(self._index):
+                    self._rebuild()
+                self._total = sum(e['size'] for e in self._index.values())
+            return self._index
+
+    index = property(get_index)
+
+    def _rebuild(self):
+        '''Register images already on disk (index lost or first run)'''
+        for path in find(self.base_path, IMAGE_RE):
+            key = re.match(IMAGE_RE, os.path.basename(path)).group(1)
+            stat = os.stat(path)
+            self._index[key] = self._new_entry(None, path, stat.st_size,
+                                               stat.st_mtime)
+            self._changed.add(key)
+        self._dirty = True
+
+    @classmethod
+    def _new_entry(cls, url, path, size, now, response=None):
+        headers = response.headers if response is not None else {}
+        return {
+            'url': url,
+            'path': path,
+            'size': size,
+            'atime': now,
+            'hits': 0,
+            'checked': now,
+            'etag': headers.get('etag'),
+            'modified': headers.get('last-modified')
+        }
+
+    def get(self, url):
+        '''Return local path for url, downloading it when needed'''
+        key = hashit(url)
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is not None:
+                now = time.time()
+                entry['atime'] = now
+                entry['hits'] += 1
+                self._changed.add(key)
+                self._dirty = True
+                if now - entry['checked'] < REVALIDATE_AFTER:
+                    self.statHit += 1
+                    return entry['path']
+                if not os.path.exists(entry['path']):
+                    # Evicted by another process, no conditional request
+                    self._forget(key)
+                    entry = None
+            self.statMiss += 1
+        return self._fetch(key, url, entry)
+
+    def recover(self, path):
+        '''Fetch again an image returned by get that can't be opened
+        (evicted by another process), return its new path or None'''
+        match = re.match(IMAGE_RE, os.path.basename(path))
+        if match is None:
+            return None
+        key = match.group(1)
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None or entry['url'] is None:
+                return None
+            self._forget(key)
+        return self._fetch(key, entry['url'])
+
+    def _fetch(self, key, url, entry=None):
+        from qobuz.api.raw import REQUEST_TIMEOUT
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('modified'):
+                headers['If-Modified-Since'] = entry['modified']
+        try:
+            response = self.session.get(url, headers=headers, stream=True,
+                                        timeout=REQUEST_TIMEOUT)
+        except Exception as e:
+            logger.warn('GetRemoteImageError %s', e)
+            return entry['path'] if entry is not None else None
+        if response.status_code == 304 and entry is not None:
+            with self.lock:
+                entry['checked'] = time.time()
+                self._changed.add(key)
+                self._dirty = True
+            return entry['path']
+        if response.status_code != 200:
+            logger.warn('GetRemoteImageError %s', response.status_code)
+            return entry['path'] if entry is not None else None
+        path = self._make_path(key)
+        size = 0
+        try:
+            with RenamedTemporaryFile(path) as write_handle:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    write_handle.write(chunk)
+                    size += len(chunk)
+        except Exception as e:
+            logger.error('StoreImageError %s %s', path, e)
+            return None
+        with self.lock:
+            if entry is not None:
+                self._total -= entry['size']
+            self.index[key] = self._new_entry(url, path, size, time.time(),
+                                              response=response)
+            self._total += size
+            self._changed.add(key)
+            self._removed.discard(key)
+            self._dirty = True
+            self.evict()
+        self.sync()
+        return path
+
+    def add(self, path):
+        '''Count a file made from cached images (thumbnail, mosaic) in our
+        budget, it's evicted like them'''
+        key = hashit(path)
+        try:
+            size = os.path.getsize(path)
+        except OSError as e:
+            logger.warn('AddImageError %s', e)
+            return False
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is not None:
+                self._total -= entry['size']
+            self.index[key] = self._new_entry(None, path, size, time.time())
+            self._total += size
+            self._changed.add(key)
+            self._removed.discard(key)
+            self._dirty = True
+            self.evict()
+        return True
+
+    def touch(self, path):
+        '''Return True when a file added with add is still there'''
+        key = hashit(path)
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None:
+                return False
+            if not os.path.exists(entry['path']):
+                self._forget(key)
+                return False
+            entry['atime'] = time.time()
+            entry['hits'] += 1
+            self._changed.add(key)
+            self._dirty = True
+            return True
+
+    def evict(self, budget=None):
+        '''Remove images until we are under our budget'''
+        budget = self.budget if budget is None else budget
+        with self.lock:
+            if self._total <= budget:
+                return 0
+            policy = _policies.get(self.policy, _lru)
+            count = 0
+            for key, entry in sorted(self.index.items(),
+                                     key=lambda item: policy(item[1])):
+                if self._total <= budget:
+                    break
+                if os.path.exists(entry['path']):
+                    unlink(entry['path'])
+                self._forget(key)
+                count += 1
+            self.statEvict += count
+            self._dirty = True
+            return count
+
+    def _forget(self, key):
+        entry = self._index.pop(key)
+        self._total -= entry['size']
+        self._changed.discard(key)
+        self._removed.add(key)
+        self._dirty = True
+
+    def _merge(self):
+        '''Apply our changes over the index synced by other processes'''
+        disk = Storage(self._index.filename)
+        merged = dict((key, entry) for key, entry in disk.items()
+                      if key not in self._removed)
+        for key in self._changed:
+            merged[key] = self._index[key]
+        self._index.clear()
+        self._index.update(merged)
+        self._total = sum(e['size'] for e in merged.values())
+
+    def clear(self):
+        with self.lock:
+            self.evict(budget=-1)
+            self.sync()
+
+    def sync(self):
+        with self.lock:
+            if self._index is None or not self._dirty:
+                return True
+            try:
+                with FileLock(self._index.filename + '.lock'):
+                    self._merge()
+                    self.evict()
+                    self._dirty = False
+                    self._changed.clear()
+                    self._removed.clear()
+                    return self._index.sync()
+            except Exception as e:
+                logger.error('ImageIndexSyncError %s', e)
+                return False
@@ -5,23 +5,58 @@
     We are setting ttl here based on key type
     We are caching key who return data in dictionary so further request of
     the same key return data from memory.
+    When entities is set, responses are stored normalized (see
+    qobuz.cache.entity_cache)
+    Responses about user collections are tagged so edits only invalidate
+    what depends on them (see TAGS and invalidate)
+    Tags can be pinned, pinned entries (and entities they reference) are
+    never evicted and refreshed together when connectivity is back (see
+    qobuz.cache.connectivity)
+    Entities can be searched without request (see search_local and
+    qobuz.cache.search_index)
 
     :part_of: kodi-qobuz
     :copyright: (c) 2012-2018 by Joachim Basmaison, Cyril Leclerc
     :license: GPLv3, see LICENSE for more details.
 '''
+import time
+
 from qobuz import config
+from qobuz.cache.connectivity import Connectivity
 from qobuz.cache.file_cache import FileCache
+from qobuz.cache.search_index import SearchIndex
+from qobuz.cache.tag_index import TagIndex
+from qobuz.debug import getLogger
+
+logger = getLogger(__name__)
+
+# endpoint: (tag name, parameter holding the tagged id)
+TAGS = {
+    '/album/get': ('album', 'album_id'),
+    '/album/getFeatured': ('featured', 'type'),
+    '/playlist/get': ('playlist', 'playlist_id'),
+    '/playlist/getUserPlaylists': ('playlists', 'user_id'),
+    '/favorite/getUserFavorites': ('favorites', 'user_id'),
+    '/purchase/getUserPurchases': ('purchases', 'user_id'),
+}
 
 
 class QobuzCache(FileCache):
     def __init__(self, *a, **ka):
         self.store = {}
         self.black_keys = ['password']
+        self.statMemoryHit = 0
+        self.entities = None
+        self.tags = TagIndex()
+        self.search = SearchIndex()
+        self.pins_path = None
+        self._pins = None
         super(QobuzCache, self).__init__()
+        self.connectivity = Connectivity()
 
     def load(self, key, *a, **ka):
         if key in self.store:
+            self.statMemoryHit += 1
             return self.store[key]
         data = super(QobuzCache, self).load(key, *a, **ka)
         if not data:
@@ -29,6 +64,130 @@ class QobuzCache(FileCache):
         self.store[key] = data
         return data
 
+    def load_fresh(self, key, *a, **ka):
+        data = super(QobuzCache, self).load_fresh(key, *a, **ka)
+        if data is None or not self._normalized(a):
+            return data
+        return self.entities.denormalize(data)
+
+    def load_stale(self, key, *a, **ka):
+        data = super(QobuzCache, self).load_stale(key, *a, **ka)
+        if data is None or not self._normalized(a):
+            return data
+        return self.entities.denormalize(data, stale=True)
+
+    def fill(self, key, data, *a, **ka):
+        tags = self.get_tags(*a, **ka)
+        if not data or not self._normalized(a):
+            data = super(QobuzCache, self).fill(key, data, *a, **ka)
+        elif super(QobuzCache, self).fill(
+                key, self.entities.normalize(data), *a, **ka) is None:
+            data = None
+        if data is not None:
+            for tag in tags:
+                self.tags.add(tag, key)
+        return data
+
+    @classmethod
+    def get_tags(cls, *a, **ka):
+        if len(a) == 0 or a[0] not in TAGS:
+            return []
+        name, parameter = TAGS[a[0]]
+        if ka.get(parameter) is None:
+            return []
+        return ['%s:%s' % (name, ka[parameter])]
+
+    def invalidate(self, *tags):
+        '''Delete every entry tagged with one of tags'''
+        count = 0
+        for tag in tags:
+            for key in self.tags.pop(tag):
+                if self.delete(key):
+                    count += 1
+        return count
+
+    def get_pins(self):
+        '''Pinned tags (tag: pinned on), kept out of the cache directory so
+        cleaning the cache doesn't unpin'''
+        if self._pins is None:
+            if self.pins_path is None:
+                self._pins = {}
+            else:
+                from qobuz.storage import get_shared
+                self._pins = get_shared(self.pins_path)
+        return self._pins
+
+    pins = property(get_pins)
+
+    def pin(self, *tags):
+        for tag in tags:
+            self.pins[tag] = int(time.time())
+        return self._sync_pins()
+
+    def unpin(self, *tags):
+        for tag in tags:
+            self.pins.pop(tag, None)
+        return self._sync_pins()
+
+    def is_pinned(self, tag):
+        return tag in self.pins
+
+    def _sync_pins(self):
+        sync = getattr(self.pins, 'sync', None)
+        return sync() if sync is not None else True
+
+    def get_pinned_entries(self):
+        '''Return {key: entry} of entries tagged with a pinned tag'''
+        entries = {}
+        for tag in list(self.pins):
+            for key in self.tags.keys(tag):
+                entry = self.load(key)
+                if entry and self.check_magic(entry):
+                    entries[key] = entry
+        return entries
+
+    def get_pinned_keys(self):
+        entries = self.get_pinned_entries()
+        keys = set(entries)
+        if self.entities is not None:
+            for entry in entries.values():
+                keys.update(self.entities.references(entry['data']))
+        return keys
+
+    def get_stale_pinned(self):
+        '''Return [(a, ka)] of pinned calls to make again'''
+        return [(entry['pa'], entry['ka'])
+                for key, entry in self.get_pinned_entries().items()
+                if not self.is_fresh(key, entry)]
+
+    def search_local(self, kind, query, limit=50, owned=False):
+        '''Return items matching query from the search index, rebuilt from
+        entities (expired ones too)'''
+        if self.entities is None or not self.search.enabled:
+            return []
+        items = []
+        for kind, nid in self.search.search(query, kind=kind, limit=limit,
+                                            owned=owned):
+            item = self.entities.get(kind, nid, stale=True)
+            if item is not None:  # Removed by clean_all
+                items.append(item)
+        return items
+
+    def _normalized(self, a):
+        return self.entities is not None and len(a) > 0 \
+            and self.entities.handles(a[0])
+
+    def sync(self, key, data, *a, **ka):
+        if not super(QobuzCache, self).sync(key, data, *a, **ka):
+            return False
+        # Stale entries are not deleted anymore, replace what we loaded
+        self.store[key] = data
+        return True
+
+    def delete(self, key, *a, **ka):
+        self.store.pop(key, None)
+        return super(QobuzCache, self).delete(key, *a, **ka)
+
     @classmethod
     def get_ttl(cls, *a, **ka):
         if len(a) > 0:
@@ -0,0 +1,397 @@
+'''
+    qobuz.cache.search_index
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Local full text index of albums, tracks and artists seen in api
+    responses, search results come without any request
+
+    Titles, artists, composers and labels are tokenized and accent folded
+    (accents dropped). Query words must all match, the last one as a
+    prefix so a partial query already give results. Items are only
+    referenced by (kind, id), they are rebuilt from the entity store (see
+    qobuz.cache.entity_cache).
+
+    The index is a marshal snapshot plus an append only journal of json
+    lines: plugin runs only append what they fetched, the whole index is
+    loaded only when searching, the journal is merged into the snapshot
+    when it gets long.
+
+    Each compaction bumps the generation written at the head of the
+    snapshot. Other processes check it (under the journal lock) before
+    reading the journal, when it changed their journal offset is stale:
+    they reload the snapshot and replay the journal from the start.
+
+    ::example
+        index = SearchIndex('/tmp/cache/search')
+        index.add_payload('/album/get', data)
+        index.search('beatl abbey', kind='album')
+        [('album', '0094638246817')]
+
+    :part_of: kodi-qobuz
+    :copyright: (c) 2012-2018 by Joachim Basmaison, Cyril Leclerc
+    :license: GPLv3, see LICENSE for more details.
+'''
+from bisect import bisect_left
+import heapq
+import json
+import marshal
+import os
+import re
+import threading
+import unicodedata
+
+from qobuz.cache.entity_cache import LIST_PATHS
+from qobuz.debug import getLogger
+from qobuz.util.common import json_dumps
+from qobuz.util.file import FileLock, RenamedTemporaryFile
+
+logger = getLogger(__name__)
+
+SNAPSHOT_FILENAME = 'index.snapshot'
+JOURNAL_FILENAME = 'index.journal'
+SNAPSHOT_VERSION = 2
+COMPACT_LINES = 5000  # Journal merged into snapshot when longer
+MIN_PREFIX = 2  # Shorter last word must match a whole token
+MAX_EXPANSIONS = 64  # Tokens a lone prefix expand to, shortest first
+INDEXED_KINDS = ['album', 'track', 'artist']
+# Items listed by these endpoints belong to the user (see Node_collection)
+OWNED_ENDPOINTS = [
+    '/favorite/getUserFavorites',
+    '/purchase/getUserPurchases',
+    '/collection/getAlbums',
+    '/collection/getArtists',
+    '/collection/getTracks',
+]
+_word = re.compile(r'\w+', re.UNICODE)
+_combining = re.compile(u'[\u0300-\u036f]')
+
+
+def fold(text):
+    '''Lower case without accents'''
+    if not isinstance(text, unicode):
+        text = text.decode('utf8', 'replace')
+    try:
+        text.encode('ascii')
+    except UnicodeEncodeError:
+        text = _combining.sub(u'', unicodedata.normalize('NFKD', text))
+    return text.lower()
+
+
+def tokenize(text):
+    return _word.findall(fold(text))
+
+
+def _name(item, *path):
+    for key in path:
+        if not isinstance(item, dict):
+            return None
+        item = item.get(key)
+    return item if isinstance(item, basestring) else None
+
+
+def make_record(kind, item, owned=False):
+    '''Return [kind, id, title, other texts, owned] or None'''
+    if not isinstance(item, dict) or item.get('id') is None:
+        return None
+    if kind == 'artist':
+        title = _name(item, 'name')
+        others = []
+    else:
+        title = _name(item, 'title')
+        others = [
+            _name(item, 'performer', 'name'),
+            _name(item, 'artist', 'name'),
+            _name(item, 'composer', 'name'),
+            _name(item, 'label', 'name'),
+            _name(item, 'album', 'title'),
+            _name(item, 'album', 'artist', 'name'),
+            _name(item, 'album', 'label', 'name'),
+        ]
+    if not title:
+        return None
+    return [kind, str(item['id']), title,
+            [text for text in others if text], bool(owned)]
+
+
+class SearchIndex(object):
+    def __init__(self, base_path=None, compact_lines=COMPACT_LINES):
+        self.base_path = base_path
+        self.compact_lines = compact_lines
+        self.lock = threading.Lock()
+        self.loaded = False
+        # Snapshot generation our journal offset belongs to
+        self._generation = None
+        # Records appended by this process, not written twice
+        self._written = set()
+        self._reset()
+        self.statAdd = 0
+        self.statSearch = 0
+        self.statCompact = 0
+
+    def _reset(self):
+        self.kinds = []
+        self.ids = []
+        self.titles = []
+        self.owned = set()
+        self.refs = {}
+        self.postings = {}
+        self.tokens = []
+        self._journal_offset = 0
+        self._journal_lines = 0
+
+    def get_enabled(self):
+        return self.base_path is not None
+
+    enabled = property(get_enabled)
+
+    def _path(self, filename):
+        return os.path.join(self.base_path, filename)
+
+    def get_lock(self):
+        return FileLock(self._path(JOURNAL_FILENAME) + '.lock')
+
+    def add_payload(self, endpoint, data):
+        '''Index items listed in an api response, return how many records
+        were written'''
+        if not self.enabled or not isinstance(data, dict):
+            return 0
+        owned = endpoint in OWNED_ENDPOINTS
+        records = []
+        # Same lists as the entity store, so items can be rebuilt
+        for name, kind in LIST_PATHS:
+            container = data.get(name)
+            if kind not in INDEXED_KINDS or not isinstance(container, dict):
+                continue
+            items = container.get('items')
+            if not isinstance(items, list):
+                continue
+            for item in items:
+                record = make_record(kind, item, owned)
+                if record is not None:
+                    records.append(record)
+        return self.add(records)
+
+    def add(self, records):
+        lines = []
+        added = []
+        with self.lock:
+            for record in records:
+                line = json_dumps(record)
+                if line in self._written:
+                    continue
+                self._written.add(line)
+                lines.append(line)
+                added.append(record)
+        if not lines:
+            return 0
+        if not os.path.isdir(self.base_path):
+            try:
+                os.makedirs(self.base_path)
+            except OSError:  # Created by another process
+                pass
+        path = self._path(JOURNAL_FILENAME)
+        try:
+            with self.get_lock():
+                with self.lock:
+                    if self.loaded:  # Lines of other processes first
+                        self._refresh()
+                with open(path, 'ab') as handle:
+                    handle.write(''.join('%s\n' % line for line in lines))
+                with self.lock:
+                    # Indexed now, don't replay our own lines
+                    if self.loaded:
+                        self._journal_offset = os.path.getsize(path)
+                        self._journal_lines += len(lines)
+                        for record in added:
+                            self._index(record)
+        except (IOError, OSError) as e:
+            logger.warn('SearchIndexWriteError %s', e)
+            return 0
+        self.statAdd += len(lines)
+        return len(lines)
+
+    def _index(self, record):
+        kind, nid, title, others, owned = record
+        ref = '%s/%s' % (kind, nid)
+        title = fold(title)
+        doc = self.refs.get(ref)
+        if doc is None:
+            doc = self.refs[ref] = len(self.ids)
+            self.kinds.append(kind)
+            self.ids.append(nid)
+            self.titles.append(title)
+        else:
+            # Changed fields, old tokens stay until compaction
+            self.titles[doc] = title
+        if owned:
+            self.owned.add(doc)
+        for text in [title] + others:
+            for token in tokenize(text):
+                docs = self.postings.get(token)
+                if docs is None:
+                    docs = self.postings[token] = set()
+                    position = bisect_left(self.tokens, token)
+                    self.tokens.insert(position, token)
+                docs.add(doc)
+
+    def load(self):
+        '''Load snapshot and replay journal, then only what other
+        processes appended (or compacted) since'''
+        if not self.enabled:
+            return False
+        with self.get_lock():
+            with self.lock:
+                self._refresh()
+        if self._journal_lines > self.compact_lines:
+            self.compact()
+        return True
+
+    def _refresh(self):
+        '''Replay new journal lines, reload everything when another
+        process compacted meanwhile. Hold both locks'''
+        if not self.loaded or self._read_generation() != self._generation:
+            self._reset()
+            self._load_snapshot()
+        self._replay()
+        self.loaded = True
+
+    def _read_generation(self):
+        try:
+            with open(self._path(SNAPSHOT_FILENAME), 'rb') as handle:
+                header = marshal.load(handle)
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            return None
+        if not isinstance(header, dict):
+            return None
+        return header.get('generation')
+
+    def _load_snapshot(self):
+        self._generation = None
+        try:
+            with open(self._path(SNAPSHOT_FILENAME), 'rb') as handle:
+                header = marshal.load(handle)
+                if not isinstance(header, dict) or header.get(
+                        'version') != SNAPSHOT_VERSION:
+                    return False
+                self._generation = header.get('generation')
+                snapshot = marshal.load(handle)
+        except (IOError, OSError):
+            return False
+        except (EOFError, ValueError, TypeError) as e:
+            logger.warn('SearchIndexSnapshotError %s', e)
+            return False
+        self.kinds = snapshot['kinds']
+        self.ids = snapshot['ids']
+        self.titles = snapshot['titles']
+        self.owned = set(snapshot['owned'])
+        self.postings = dict((token, set(docs)) for token, docs in
+                             snapshot['postings'].iteritems())
+        self.tokens = sorted(self.postings)
+        self.refs = dict(('%s/%s' % ref, doc) for doc, ref in
+                         enumerate(zip(self.kinds, self.ids)))
+        return True
+
+    def _replay(self):
+        '''Index journal lines not read yet'''
+        try:
+            handle = open(self._path(JOURNAL_FILENAME), 'rb')
+        except (IOError, OSError):
+            return 0
+        count = 0
+        with handle:
+            handle.seek(self._journal_offset)
+            for line in handle:
+                if not line.endswith('\n'):
+                    break  # Being written by another process
+                self._journal_offset += len(line)
+                try:
+                    self._index(json.loads(line))
+                except (ValueError, TypeError) as e:
+                    logger.warn('SearchIndexBadLine %s', e)
+                count += 1
+        self._journal_lines += count
+        return count
+
+    def compact(self):
+        '''Merge journal into a new snapshot'''
+        with self.get_lock():
+            with self.lock:
+                self._refresh()
+                header = {
+                    'version': SNAPSHOT_VERSION,
+                    'generation': (self._generation or 0) + 1,
+                }
+                snapshot = {
+                    'kinds': self.kinds,
+                    'ids': self.ids,
+                    'titles': self.titles,
+                    'owned': list(self.owned),
+                    'postings': dict((token, list(docs)) for token, docs in
+                                     self.postings.iteritems()),
+                }
+                with RenamedTemporaryFile(
+                        self._path(SNAPSHOT_FILENAME)) as handle:
+                    handle.write(marshal.dumps(header))
+                    handle.write(marshal.dumps(snapshot))
+                # Every line is in the snapshot now
+                open(self._path(JOURNAL_FILENAME), 'wb').close()
+                self._generation = header['generation']
+                self._journal_offset = 0
+                self._journal_lines = 0
+        self.statCompact += 1
+        return True
+
+    def _prefixed(self, prefix, among=None):
+        '''Docs having a token starting with prefix, among docs matching
+        the other words'''
+        if len(prefix) < MIN_PREFIX:
+            docs = self.postings.get(prefix, set())
+            return docs if among is None else docs & among
+        start = bisect_left(self.tokens, prefix)
+        end = bisect_left(self.tokens, prefix + u'\uffff', start)
+        tokens = self.tokens[start:end]
+        if among is None and len(tokens) > MAX_EXPANSIONS:
+            tokens = heapq.nsmallest(MAX_EXPANSIONS, tokens, key=len)
+        docs = set()
+        for token in tokens:
+            if among is None:
+                docs.update(self.postings[token])
+            else:
+                docs.update(among & self.postings[token])
+        return docs
+
+    def search(self, query, kind=None, limit=50, owned=False):
+        '''Return [(kind, id)], titles equal to or starting with the query
+        first'''
+        words = tokenize(query)
+        if not words or not self.load():
+            return []
+        self.statSearch += 1
+        docs = None
+        for word in sorted(words[:-1], key=lambda w: len(
+                self.postings.get(w, ()))):
+            matches = self.postings.get(word)
+            docs = matches if docs is None else docs & matches
+            if not docs:
+                return []
+        docs = self._prefixed(words[-1], among=docs)
+        if not docs:
+            return []
+        if owned:
+            docs = docs & self.owned
+        kinds = self.kinds
+        if kind is not None:
+            docs = [doc for doc in docs if kinds[doc] == kind]
+        phrase = u' '.join(words)
+        titles = self.titles
+
+        def rank(doc):
+            title = titles[doc]
+            if title == phrase:
+                return (0, doc)
+            if title.startswith(phrase):
+                return (1, doc)
+            return (2, doc)
+
+        return [(kinds[doc], self.ids[doc])
+                for doc in heapq.nsmallest(limit, docs, key=rank)]
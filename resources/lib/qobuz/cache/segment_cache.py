@@ -0,0 +1,312 @@
+'''
+    qobuz.cache.segment_cache
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Disk cache for proxied audio (kooli)
+
+    Tracks are stored as fixed size segments keyed by track id, format id
+    and segment size (segments of a previous httpd_segment_size are never
+    served, just evicted), so a partial play is reusable and a seek only
+    downloads missing
+    segments. While a segment is served the next ones are fetched in the
+    background (read ahead). Segments are read with mmap and the least
+    recently used ones are evicted when the disk budget is exceeded, a
+    segment evicted before a reader opened it is fetched again.
+    Tracks whose upstream ignores Range are not cached (SegmentError, the
+    caller proxy them).
+
+    :part_of: kodi-qobuz
+    :copyright: (c) 2012-2018 by Joachim Basmaison, Cyril Leclerc
+    :license: GPLv3, see LICENSE for more details.
+'''
+from collections import OrderedDict
+import mmap
+import os
+import re
+import threading
+
+import requests
+
+from qobuz.debug import getLogger
+from qobuz.storage import Storage
+from qobuz.util.file import RenamedTemporaryFile, unlink
+from qobuz.util.pool import WorkerPool
+
+logger = getLogger(__name__)
+
+META_FILENAME = 'segment-meta.local'
+SEGMENT_FMT = 'segment-{track_id}-{format_id}-{size}-{index}.seg'
+# Any segment counts in our budget, whatever its size or name version
+SEGMENT_RE = re.compile(r'^segment-[\w-]+\.seg$')
+DEFAULT_SEGMENT_SIZE = 1024 * 1024
+DEFAULT_BUDGET = 512 * 1024 * 1024
+DEFAULT_READ_AHEAD = 2
+CHUNK_SIZE = 64 * 1024
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+
+class SegmentError(Exception):
+    pass
+
+
+class RangeNotSupported(SegmentError):
+    pass
+
+
+class SegmentCache(object):
+    def __init__(self, base_path=None, segment_size=DEFAULT_SEGMENT_SIZE,
+                 budget=DEFAULT_BUDGET, read_ahead=DEFAULT_READ_AHEAD):
+        self.base_path = base_path
+        self.segment_size = segment_size
+        self.budget = budget
+        self.read_ahead = read_ahead
+        self.session = requests.Session()
+        self.lock = threading.RLock()
+        self.pool = WorkerPool(size=2, name='segment')
+        self._segments = None
+        self._meta = None
+        self._inflight = {}
+        self._total = 0
+        self.statHit = 0
+        self.statMiss = 0
+        self.statEvict = 0
+
+    def _make_path(self, track_id, format_id, index):
+        return os.path.join(self.base_path, SEGMENT_FMT.format(
+            track_id=track_id, format_id=format_id, size=self.segment_size,
+            index=index))
+
+    def get_segments(self):
+        '''LRU ordered {path: size}, rebuilt from disk on first use'''
+        with self.lock:
+            if self._segments is None:
+                self._segments = OrderedDict()
+                found = []
+                for name in os.listdir(self.base_path):
+                    if SEGMENT_RE.match(name) is None:
+                        continue
+                    path = os.path.join(self.base_path, name)
+                    stat = os.stat(path)
+                    found.append((stat.st_mtime, path, stat.st_size))
+                for _mtime, path, size in sorted(found):
+                    self._segments[path] = size
+                    self._total += size
+            return self._segments
+
+    segments = property(get_segments)
+
+    def get_metas(self):
+        '''Track size and content type, persisted so segments already on
+        disk are usable after a restart'''
+        with self.lock:
+            if self._meta is None:
+                self._meta = Storage(
+                    os.path.join(self.base_path, META_FILENAME))
+            return self._meta
+
+    metas = property(get_metas)
+
+    def get_meta(self, track_id, format_id):
+        return self.metas.get('%s-%s' % (track_id, format_id))
+
+    def _touch(self, path):
+        with self.lock:
+            size = self.segments.pop(path, None)
+            if size is None:
+                return False
+            self.segments[path] = size
+            return True
+
+    def _add(self, path, size):
+        with self.lock:
+            if path in self.segments:
+                self._total -= self.segments.pop(path)
+            self.segments[path] = size
+            self._total += size
+            self.evict()
+
+    def evict(self, budget=None):
+        '''Remove least recently used segments until we are under budget'''
+        budget = self.budget if budget is None else budget
+        count = 0
+        with self.lock:
+            while self._total > budget and self.segments:
+                path, size = self.segments.popitem(last=False)
+                self._total -= size
+                if os.path.exists(path):
+                    unlink(path)
+                count += 1
+            self.statEvict += count
+        return count
+
+    def clear(self):
+        with self.lock:
+            self.evict(budget=-1)
+            self.metas.clear()
+            self.metas.sync()
+
+    def _set_meta(self, track_id, format_id, response):
+        match = CONTENT_RANGE_RE.match(
+            response.headers.get('content-range', ''))
+        if match is not None and match.group(3) != '*':
+            size = int(match.group(3))
+        elif response.status_code == 200 \
+                and response.headers.get('content-length'):
+            size = int(response.headers['content-length'])
+        else:
+            return None
+        meta = {'size': size,
+                'content_type': response.headers.get('content-type'),
+                'ranges': response.status_code == 206}
+        with self.lock:
+            self.metas['%s-%s' % (track_id, format_id)] = meta
+            self.metas.sync()
+        return meta
+
+    def _download(self, url, track_id, format_id, index):
+        '''Fetch one segment, RangeNotSupported when upstream send the
+        whole track'''
+        from qobuz.api.raw import REQUEST_TIMEOUT
+        start = index * self.segment_size
+        end = start + self.segment_size - 1
+        meta = self.get_meta(track_id, format_id)
+        if meta is not None:
+            end = min(end, meta['size'] - 1)
+        response = self.session.get(
+            url, headers={'Range': 'bytes=%s-%s' % (start, end)},
+            stream=True, timeout=REQUEST_TIMEOUT)
+        try:
+            if response.status_code not in (200, 206):
+                raise SegmentError('upstream status %s'
+                                   % response.status_code)
+            meta = self._set_meta(track_id, format_id, response)
+            if response.status_code == 200 and (
+                    meta is None or meta['size'] > self.segment_size):
+                # Not downloaded inline, the caller proxy the track
+                raise RangeNotSupported('no range for track %s' % track_id)
+            self._store(response, track_id, format_id, index)
+        finally:
+            response.close()
+
+    def _store(self, response, track_id, format_id, index):
+        handle = None
+        size = 0
+        try:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                while chunk:
+                    if handle is None:
+                        handle = RenamedTemporaryFile(
+                            self._make_path(track_id, format_id, index))
+                        size = 0
+                    part = chunk[:self.segment_size - size]
+                    chunk = chunk[len(part):]
+                    handle.write(part)
+                    size += len(part)
+                    if size == self.segment_size:
+                        handle.__exit__(None, None, None)
+                        self._add(handle.final_path, size)
+                        handle = None
+                        index += 1
+            if handle is not None:
+                handle.__exit__(None, None, None)
+                self._add(handle.final_path, size)
+        except Exception:
+            if handle is not None:
+                handle.tmpfile.close()
+                unlink(handle.tmpfile.name)
+            raise
+
+    def ensure(self, url, track_id, format_id, index):
+        '''Return segment path, downloading it once even when requested by
+        concurrent readers'''
+        path = self._make_path(track_id, format_id, index)
+        with self.lock:
+            if self._touch(path) and os.path.exists(path):
+                self.statHit += 1
+                return path
+            event = self._inflight.get(path)
+            owner = event is None
+            if owner:
+                self.statMiss += 1
+                event = self._inflight[path] = threading.Event()
+        if owner:
+            try:
+                self._download(url, track_id, format_id, index)
+            finally:
+                with self.lock:
+                    del self._inflight[path]
+                event.set()
+        else:
+            event.wait()
+        if not os.path.exists(path):
+            raise SegmentError('cannot fetch segment %s' % path)
+        return path
+
+    def prefetch(self, url, track_id, format_id, index):
+        meta = self.get_meta(track_id, format_id)
+        if meta is None:
+            return
+        last = (meta['size'] - 1) // self.segment_size
+        for ahead in range(index + 1, min(index + self.read_ahead, last) + 1):
+            path = self._make_path(track_id, format_id, ahead)
+            with self.lock:
+                if path in self.segments or path in self._inflight:
+                    continue
+            self.pool.submit(self.ensure, url, track_id, format_id, ahead)
+
+    def open(self, url, track_id, format_id, start=0):
+        '''Make sure the segment holding start is cached and return the
+        track meta (size and content type)'''
+        meta = self.get_meta(track_id, format_id)
+        if meta is not None and meta.get('ranges') is False \
+                and meta['size'] > self.segment_size:
+            raise RangeNotSupported('no range for track %s' % track_id)
+        if meta is not None and start >= meta['size']:
+            return meta
+        self.ensure(url, track_id, format_id, start // self.segment_size)
+        meta = self.get_meta(track_id, format_id)
+        if meta is None:
+            raise SegmentError('unknown size for track %s' % track_id)
+        return meta
+
+    def read(self, url, track_id, format_id, start, end,
+             chunk_size=CHUNK_SIZE):
+        '''Yield bytes start..end (inclusive) of the track'''
+        while start <= end:
+            index = start // self.segment_size
+            self.prefetch(url, track_id, format_id, index)
+            path, handle = self._open_segment(url, track_id, format_id,
+                                              index)
+            offset = start - index * self.segment_size
+            stop = min(end - index * self.segment_size + 1,
+                       self.segment_size)
+            for data in self._read_segment(path, handle, offset, stop,
+                                           chunk_size):
+                start += len(data)
+                yield data
+
+    def _open_segment(self, url, track_id, format_id, index):
+        '''Return (path, handle), a segment evicted between ensure and
+        open is fetched again (an open one can be evicted safely)'''
+        for _attempt in range(2):
+            path = self.ensure(url, track_id, format_id, index)
+            try:
+                return path, open(path, 'rb')
+            except IOError as e:
+                logger.info('Segment evicted before read %s %s', path, e)
+        raise SegmentError('cannot open segment %s' % path)
+
+    @classmethod
+    def _read_segment(cls, path, handle, offset, stop, chunk_size):
+        with handle:
+            view = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                stop = min(stop, len(view))
+                if offset >= stop:
+                    raise SegmentError('truncated segment %s' % path)
+                while offset < stop:
+                    data = view[offset:min(offset + chunk_size, stop)]
+                    offset += len(data)
+                    yield data
+            finally:
+                view.close()
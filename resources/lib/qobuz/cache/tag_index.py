@@ -0,0 +1,89 @@
+'''
+    qobuz.cache.tag_index
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    Tag -> cache keys index, so a playlist edit only drops entries that
+    depend on this playlist
+
+    One append only file per tag, appending a line is atomic so processes
+    sharing the cache don't need a lock. A sweep rename the file before
+    reading it, keys tagged meanwhile land in a new file.
+
+    ::example
+        index = TagIndex('/tmp/cache/tags')
+        index.add('playlist:42', key)
+        for key in index.pop('playlist:42'):
+            cache.delete(key)
+
+    :part_of: kodi-qobuz
+    :copyright: (c) 2012-2018 by Joachim Basmaison, Cyril Leclerc
+    :license: GPLv3, see LICENSE for more details.
+'''
+import os
+import re
+
+from qobuz.debug import getLogger
+from qobuz.util.file import RenamedTemporaryFile, unlink
+
+logger = getLogger(__name__)
+
+# Tag file rewritten without duplicates when bigger
+COMPACT_SIZE = 64 * 1024
+_unsafe = re.compile(r'[^\w.-]')
+
+
+class TagIndex(object):
+    def __init__(self, base_path=None):
+        self.base_path = base_path
+        self.statAdd = 0
+        self.statSweep = 0
+
+    def _make_path(self, tag):
+        return os.path.join(self.base_path, '%s.tag' % _unsafe.sub('_', tag))
+
+    def add(self, tag, key):
+        if self.base_path is None:  # Not configured, nothing to track
+            return
+        if not os.path.isdir(self.base_path):
+            try:
+                os.makedirs(self.base_path)
+            except OSError:  # Created by another process
+                pass
+        path = self._make_path(tag)
+        try:
+            with open(path, 'a') as handle:
+                handle.write('%s\n' % key)
+            self.statAdd += 1
+            if os.path.getsize(path) > COMPACT_SIZE:
+                self.compact(tag)
+        except (IOError, OSError) as e:
+            logger.warn('TagAddError %s %s', tag, e)
+
+    def keys(self, tag):
+        return self._read(self._make_path(tag))
+
+    @classmethod
+    def _read(cls, path):
+        try:
+            with open(path) as handle:
+                return set(line.strip() for line in handle if line.strip())
+        except (IOError, OSError):
+            return set()
+
+    def compact(self, tag):
+        keys = self.keys(tag)
+        with RenamedTemporaryFile(self._make_path(tag)) as handle:
+            handle.write(''.join('%s\n' % key for key in sorted(keys)))
+
+    def pop(self, tag):
+        '''Return keys tagged with tag and forget them'''
+        path = self._make_path(tag)
+        sweep_path = '%s.%s.sweep' % (path, os.getpid())
+        try:
+            os.rename(path, sweep_path)
+        except OSError:
+            return set()
+        keys = self._read(sweep_path)
+        unlink(sweep_path)
+        self.statSweep += 1
+        return keys
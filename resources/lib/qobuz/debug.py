@@ -30,8 +30,23 @@ try:
         def __init__(self, *a, **ka):
             super(XbmcLogger, self).__init__(*a, **ka)
             self.fmt = logging.Formatter(FORMAT_KODI)
+            self.enabled = None
+
+        def is_enabled(self):
+            '''Resolved on first record, through the registry when the
+            application is up so we don't create another Addon object'''
+            if self.enabled is None:
+                from qobuz import config
+                if config.app is not None:
+                    self.enabled = config.app.registry.get('debug', to='bool')
+                else:
+                    self.enabled = xbmcaddon.Addon(
+                        id='plugin.audio.qobuz').getSetting('debug') == 'true'
+            return self.enabled
 
         def handle(self, record):
+            if not self.is_enabled():
+                return
             if record.levelname == 'WARNING':
                 xbmc.log(self.fmt.format(record), xbmc.LOGWARNING)
             if record.levelname == 'DEBUG':
@@ -45,10 +60,7 @@ try:
             else:
                 xbmc.log(self.fmt.format(record), xbmc.LOGNOTICE)
 
-    if xbmcaddon.Addon(id='plugin.audio.qobuz').getSetting('debug') == 'true':
-        logger.addHandler(XbmcLogger())
-    else:
-        logger.addHandler(logging.NullHandler(level=logging.NOTSET))
+    logger.addHandler(XbmcLogger())
 
 except Exception as e:
     print('Exception %s' % e)  # pylint: disable=E1601
@@ -7,37 +7,56 @@
     :license: GPLv3, see LICENSE for more details.
 '''
 from datetime import datetime
-from flask import Flask, request, stream_with_context
+from flask import Flask, jsonify, request
 from flask import make_response, render_template
 from flask import redirect
 from functools import wraps, update_wrapper
 from os import path as P
-from flask import request, Response
-import requests
+from werkzeug.http import http_date
 from kooli import kooli_path
+from kooli import prewarm
+from kooli import server
+from kooli import stream
+from kooli.render import RenderCache, make_version
 from qobuz.api import api
+from qobuz.api.user import current as current_user, get_format_mimetype
 from qobuz.application import Application as QobuzApplication
 from qobuz.bootstrap import MinimalBootstrap
+from qobuz.cache import cache, cover_cache
+from qobuz.cache.segment_cache import SegmentCache
+from qobuz import config
 from qobuz.debug import logger
 from qobuz.node import getNode, Flag
 from qobuz.plugin import Plugin
 from qobuz.util.converter import converter
+from qobuz.util.metrics import metrics
+from qobuz.util.profiler import profiler
 
 qobuzApp = QobuzApplication(
     Plugin('plugin.audio.qobuz'),
     bootstrapClass=MinimalBootstrap)
 qobuzApp.bootstrap.init_app()
+segments = SegmentCache(
+    base_path=config.path.segments,
+    segment_size=qobuzApp.registry.get(
+        'httpd_segment_size', to='int', default=1024) * 1024,
+    budget=qobuzApp.registry.get(
+        'httpd_segment_cache_size', to='int', default=512) * 1024 * 1024,
+    read_ahead=qobuzApp.registry.get(
+        'httpd_read_ahead', to='int', default=2))
 kooli_tpl = P.join(kooli_path, 'tpl')
 application = Flask(__name__, template_folder=kooli_tpl)
 
 HEADGET = ['HEAD', 'GET']
+rendered = RenderCache()
+PREWARM_SOURCE_LIMIT = 500
 
 
 def nocache(view):
     @wraps(view)
     def no_cache(*args, **kwargs):
         response = make_response(view(*args, **kwargs))
-        response.headers['Last-Modified'] = datetime.now()
+        response.headers['Last-Modified'] = http_date(datetime.utcnow())
         response.headers[
             'Cache-Control'] = 'no-store, no-cache, must-revalidate, ' \
                                'post-check=0, pre-check=0, max-age=0'
@@ -48,7 +67,8 @@ def nocache(view):
     return update_wrapper(no_cache, view)
 
 
-_http_error = {200: 'Ok', 404: 'Not Found', 500: 'Server Error'}
+_http_error = {200: 'Ok', 404: 'Not Found', 500: 'Server Error',
+               503: 'Service Unavailable'}
 
 
 def http_error(code):
@@ -57,27 +77,106 @@ def http_error(code):
     return _http_error[code], code
 
 
-def shutdown_server():
-    try:
-        func = request.environ.get('werkzeug.server.shutdown')
-        if func is None:
-            raise RuntimeError('Not running with the Werkzeug Server')
-        return func()
-    except Exception as e:
-        logger.error('shutdown server error %s', e)
-    return True
+def register_metrics():
+    '''Expose stat* counters, read at scrape time'''
+    caches = {'api': cache, 'image': cover_cache, 'segment': segments,
+              'render': rendered}
+
+    def by_tier(attribute):
+        return lambda: [({'tier': tier}, getattr(obj, attribute, 0))
+                        for tier, obj in caches.items()]
+
+    metrics.collect('qobuz_cache_hits_total', 'Cache hits',
+                    by_tier('statHit'), kind='counter', labels=['tier'])
+    metrics.collect('qobuz_cache_misses_total', 'Cache misses',
+                    by_tier('statMiss'), kind='counter', labels=['tier'])
+    metrics.collect('qobuz_cache_evictions_total',
+                    'Cache evictions',
+                    by_tier('statEvict'), kind='counter', labels=['tier'])
+    metrics.collect('qobuz_cache_memory_hits_total',
+                    'Api cache hits served from memory',
+                    lambda: [({}, cache.statMemoryHit)], kind='counter')
+    metrics.collect('qobuz_cache_api_deletes_total',
+                    'Api cache stale entries deleted',
+                    lambda: [({}, cache.statDelete)], kind='counter')
+    metrics.collect('qobuz_api_response_bytes_total',
+                    'Qobuz API response size',
+                    lambda: [({}, api.statContentSizeTotal)], kind='counter')
+
+    def server_metric(key):
+        def collect():
+            if server.current is None:
+                return []
+            values = server.current.get_metrics()
+            return [({}, values[key])] if key in values else []
+        return collect
+
+    for key, description in [('queue_depth', 'Connections waiting'),
+                             ('queue_depth_max', 'Highest queue depth'),
+                             ('workers_busy', 'Workers handling a request'),
+                             ('workers_alive', 'Worker threads')]:
+        metrics.collect('kooli_httpd_%s' % key, description,
+                        server_metric(key))
+    for key, description in [('connections', 'Connections accepted'),
+                             ('rejected', 'Connections rejected (busy)')]:
+        metrics.collect('kooli_httpd_%s_total' % key, description,
+                        server_metric(key), kind='counter')
+
+
+register_metrics()
+
+
+@application.route('/qobuz/metrics', methods=HEADGET)
+@nocache
+def route_metrics():
+    response = make_response(metrics.render())
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4'
+    return response
+
+
+@application.route('/qobuz/profile/dump', methods=HEADGET)
+@nocache
+def route_profile_dump():
+    '''Stacks sampled so far in folded format (flamegraph.pl /
+    speedscope)'''
+    if not qobuzApp.registry.get('httpd_profiler', to='bool'):
+        return http_error(404)
+    return profile_response(profiler.dump())
 
 
+@application.route('/qobuz/profile/<string:action>', methods=['POST'])
 @nocache
+def route_profile(action):
+    '''start (?interval=0.01) or stop, stop return the stacks like dump
+    POST only, they change the profiler state'''
+    if not qobuzApp.registry.get('httpd_profiler', to='bool'):
+        return http_error(404)
+    if action == 'start':
+        interval = request.values.get('interval', 0.01, type=float)
+        if not profiler.start(interval=max(interval, 0.001)):
+            return 'already running', 409
+        return 'started', 200
+    if action == 'stop':
+        return profile_response(profiler.stop())
+    return http_error(404)
+
+
+def profile_response(stacks):
+    response = make_response(stacks)
+    response.headers['Content-Type'] = 'text/plain'
+    return response
+
+
 @application.route('/qobuz/ping', methods=HEADGET)
+@nocache
 def route_ping():
     if request.method == 'HEAD':
         return '', 200
     return 'pong', 200
 
 
-@nocache
 @application.route('/qobuz', methods=HEADGET)
+@nocache
 def route_root():
     response = {}
     if request.method == 'HEAD':
@@ -85,24 +184,31 @@ def route_root():
     return render_template('root.htm.j2', **response)
 
 
-@nocache
 @application.route('/qobuz/<string:album_id>/<string:track_id>.mpc', methods=HEADGET)
 def route_track(album_id=None, track_id=None):
     if request.method == 'HEAD':
-        return 'ok', 200
+        format_id, _intent, _description = current_user.stream_format()
+        return stream.head(get_format_mimetype(format_id))
     track = getNode(Flag.TRACK, parameters={'nid': track_id})
     track.data = track.fetch()
     url = track.get_streaming_url()
     if url is None:
         return http_error(404)
-    
-    req = requests.get(url, stream=True)
-    return Response(stream_with_context(req.iter_content(chunk_size=2048)), content_type=req.headers["content-type"])
-    
-    # return redirect(url, code=302)
+    chunk_size = qobuzApp.registry.get(
+        'httpd_chunk_size', to='int', default=256) * 1024
+    response = None
+    if qobuzApp.registry.get('httpd_segment_cache', to='bool'):
+        format_id = track.get_format_id()
+        if format_id is not None:
+            response = stream.cached(segments, url, track_id, format_id,
+                                     request.headers, chunk_size=chunk_size)
+    if response is None:
+        response = stream.proxy(url, request.headers, chunk_size=chunk_size)
+    if response is None:
+        return http_error(500)
+    return response
 
 
-@nocache
 @application.route('/qobuz/<string:album_id>/fanart.jpg', methods=HEADGET)
 @application.route('/qobuz/<string:album_id>/poster.jpg', methods=HEADGET)
 @application.route('/qobuz/<string:album_id>/thumb.jpg', methods=HEADGET)
@@ -114,14 +220,15 @@ def route_track(album_id=None, track_id=None):
 @application.route('/qobuz/<string:album_id>/clearart.png', methods=HEADGET)
 @application.route('/qobuz/banner.jpg', methods=HEADGET)
 @application.route('/qobuz/artist.nfo', methods=HEADGET)
+@nocache
 def route_null(album_id=None, track_id=None):
     return http_error(404)
 
 
-@nocache
 @application.route('/qobuz/<string:album_id>/disc.png', methods=HEADGET)
 @application.route('/qobuz/<string:album_id>/folder.jpg', methods=HEADGET)
 @application.route('/qobuz/<string:album_id>/thumb.jpg', methods=HEADGET)
+@nocache
 def route_disc_image(album_id=None, track_id=None):
     node = getNode(Flag.ALBUM, parameters={'nid': album_id})
     node.data = node.fetch()
@@ -133,29 +240,61 @@ def route_disc_image(album_id=None, track_id=None):
     return redirect(image, code=302)
 
 
-@nocache
+def payload_version(*calls):
+    '''Version (updated_on) of the cached api payloads, None when one of
+    them isn't cached'''
+    versions = []
+    for a, ka in calls:
+        entry = cache.get_entry(*a, **ka)
+        if not entry or 'updated_on' not in entry:
+            return None
+        versions.append(entry['updated_on'])
+    return versions
+
+
+def render_versioned(template, nid, versions, context_factory):
+    return rendered.respond(template, nid, versions,
+                            qobuzApp.registry.get('image_default_size'),
+                            context_factory)
+
+
+def album_context(response, album_id):
+    context = dict(response)
+    context['album_id'] = album_id
+    if 'description' in context:
+        context['description'] = converter.strip_html(
+            context['description'], default='')
+    if 'catchline' in context:
+        context['catchline'] = converter.strip_html(
+            context['catchline'], default='')
+    context['image_default_size'] = qobuzApp.registry.get(
+        'image_default_size')
+    if 'duration' in context:
+        context['duration'] = round(context['duration'])
+    return context
+
+
+def artist_context(response):
+    context = dict(response)
+    if 'biography' in context:
+        context['biography'] = dict(context['biography'])
+        context['biography']['content'] = converter.strip_html(
+            context['biography']['content'], default='')
+    context['image_default_size'] = qobuzApp.registry.get(
+        'image_default_size')
+    return context
+
+
 @application.route('/qobuz/<string:album_id>/album.nfo', methods=HEADGET)
 def route_nfo_album(album_id=None):
     response = api.get('/album/get', album_id=album_id)
     if response is None:
         return http_error(404)
-    response['album_id'] = album_id
-    if request.method == 'HEAD':
-        return '', 200
-    if 'description' in response:
-        response['description'] = converter.strip_html(
-            response['description'], default='')
-    if 'catchline' in response:
-        response['catchline'] = converter.strip_html(
-            response['catchline'], default='')
-    response['image_default_size'] = qobuzApp.registry.get(
-        'image_default_size')
-    if 'duration' in response:
-        response['duration'] = round(response['duration'])
-    return render_template('album.nfo.j2', **response)
+    versions = payload_version((('/album/get', ), {'album_id': album_id}))
+    return render_versioned('album.nfo.j2', album_id, versions,
+                            lambda: album_context(response, album_id))
 
 
-@nocache
 @application.route('/qobuz/<string:album_id>/', methods=HEADGET)
 def route_album(album_id=None, track_id=None):
     response = api.get('/album/get', album_id=album_id)
@@ -163,23 +302,11 @@ def route_album(album_id=None, track_id=None):
         response = api.get('/track/get', track_id=track_id)
     if response is None:
         return http_error(404)
-    response['album_id'] = album_id
-    if request.method == 'HEAD':
-        return '', 200
-    if 'description' in response:
-        response['description'] = converter.strip_html(
-            response['description'], default='')
-    if 'catchline' in response:
-        response['catchline'] = converter.strip_html(
-            response['catchline'], default='')
-    response['image_default_size'] = qobuzApp.registry.get(
-        'image_default_size')
-    if 'duration' in response:
-        response['duration'] = round(response['duration'])
-    return render_template('dir.j2', **response)
+    versions = payload_version((('/album/get', ), {'album_id': album_id}))
+    return render_versioned('dir.j2', album_id, versions,
+                            lambda: album_context(response, album_id))
 
 
-@nocache
 @application.route('/qobuz/<string:album_id>/artist.nfo', methods=HEADGET)
 def route_nfo_artist(album_id=None):
     album = api.get('/album/get', album_id=album_id)
@@ -188,19 +315,88 @@ def route_nfo_artist(album_id=None):
         response = api.get('/artist/get', artist_id=album['artist']['id'])
     if response is None:
         return http_error(404)
-    if 'biography' in response:
-        response['biography']['content'] = converter.strip_html(
-            response['biography']['content'], default='')
-    response['image_default_size'] = qobuzApp.registry.get(
-        'image_default_size')
-    return render_template('artist.nfo.j2', **response)
+    versions = payload_version(
+        (('/album/get', ), {'album_id': album_id}),
+        (('/artist/get', ), {'artist_id': album['artist']['id']}))
+    return render_versioned('artist.nfo.j2', album_id, versions,
+                            lambda: artist_context(response))
 
 
+def warm_album(album_id):
+    '''Fetch album and artist then render their NFOs into the cache'''
+    album = api.get('/album/get', album_id=album_id)
+    if album is None:
+        return False
+    album_call = (('/album/get', ), {'album_id': album_id})
+    calls = [('album.nfo.j2', (album_call, ),
+              lambda: album_context(album, album_id)),
+             ('dir.j2', (album_call, ),
+              lambda: album_context(album, album_id))]
+    artist_id = album.get('artist', {}).get('id')
+    if artist_id is not None:
+        artist = api.get('/artist/get', artist_id=artist_id)
+        if artist is not None:
+            calls.append(('artist.nfo.j2',
+                          (album_call,
+                           (('/artist/get', ), {'artist_id': artist_id})),
+                          lambda: artist_context(artist)))
+    with application.app_context():
+        for template, version_calls, context_factory in calls:
+            versions = payload_version(*version_calls)
+            if versions is not None:
+                rendered.render(template, album_id, make_version(
+                    versions, qobuzApp.registry.get('image_default_size')),
+                    context_factory)
+    return True
+
+
+def prewarm_source(source):
+    '''Album ids from user favorites or purchases'''
+    if source == 'favorites':
+        data = api.get('/favorite/getUserFavorites',
+                       user_id=current_user.get_id(),
+                       type='albums',
+                       limit=PREWARM_SOURCE_LIMIT)
+    elif source == 'purchases':
+        data = api.get('/purchase/getUserPurchases',
+                       user_id=current_user.get_id(),
+                       limit=PREWARM_SOURCE_LIMIT)
+    else:
+        return []
+    if data is None or 'albums' not in data:
+        return []
+    return [album['id'] for album in data['albums'].get('items', [])]
+
+
+@application.route('/qobuz/prewarm', methods=['POST'])
 @nocache
+def route_prewarm():
+    '''album_id (repeated), album_ids (comma separated), a json list or
+    source=favorites|purchases; workers (default 8)
+    POST only, warming fetch and render a lot (no crawler or prefetching
+    browser should trigger it)'''
+    album_ids = request.values.getlist('album_id')
+    for value in request.values.getlist('album_ids'):
+        album_ids += value.split(',')
+    payload = request.get_json(silent=True)
+    if isinstance(payload, list):
+        album_ids += payload
+    for source in request.values.getlist('source'):
+        album_ids += prewarm_source(source)
+    report = prewarm.prewarm(
+        warm_album, album_ids,
+        workers=request.values.get('workers', prewarm.DEFAULT_WORKERS,
+                                   type=int))
+    report['rendered'] = {'hit': rendered.statHit, 'miss': rendered.statMiss,
+                          'size': len(rendered.store)}
+    return jsonify(report)
+
+
 @application.route('/qobuz/favorite/', methods=HEADGET)
 @application.route('/qobuz/favorite/<string:search_type>/', methods=HEADGET)
 @application.route('/qobuz/favorite/<string:search_type>/<string:nid>',
                    methods=HEADGET)
+@nocache
 def route_favorite(search_type=None, nid=None):
     if search_type is None:
         if request.method == 'HEAD':
@@ -9,7 +9,8 @@
 import time
 from kodi_six import xbmc  # pylint:disable=E0401
 
-from qobuz.cache import cache_util
+from qobuz import config
+from qobuz.cache import cache, cache_util
 from qobuz.debug import getLogger
 
 logger = getLogger(__name__)
@@ -32,9 +33,11 @@ class Monitor(xbmc.Monitor):
         self.last_garbage_on = time.time() - (self.garbage_refresh + 1)
         self.service = {}
 
-    @staticmethod
-    def onSettingsChanged():
-        logger.info('Setting changed: %s')  # @todo Do Something
+    @classmethod
+    def onSettingsChanged(cls):
+        logger.info('Setting changed, invalidating registry')
+        if config.app is not None:
+            config.app.registry.invalidate()
 
     def onAbortRequested(self):
         self.abortRequested = True
@@ -59,7 +62,7 @@ class Monitor(xbmc.Monitor):
 
     def cache_remove_old(self, **ka):
         self.last_garbage_on = time.time()
-        cache_util.clean_old(self)
+        cache_util.clean_old(cache)
 
     def start_all_service(self):
         _ = [s.start() for s in self.service.values()]
@@ -0,0 +1,52 @@
+'''
+    qobuz.extension.kooli.prewarm
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Run a warm up function against many ids concurrently and report
+    throughput, used to fill api and rendered caches before a library scan
+
+    :part_of: kodi-qobuz
+    :copyright: (c) 2012-2018 by Joachim Basmaison, Cyril Leclerc
+    :license: GPLv3, see LICENSE for more details.
+'''
+import time
+
+from qobuz.debug import getLogger
+from qobuz.util.pool import WorkerPool
+
+logger = getLogger(__name__)
+
+DEFAULT_WORKERS = 8
+MAX_WORKERS = 32
+
+
+def unique(ids):
+    seen = set()
+    result = []
+    for nid in ids:
+        nid = str(nid).strip()
+        if nid and nid not in seen:
+            seen.add(nid)
+            result.append(nid)
+    return result
+
+
+def prewarm(func, ids, workers=DEFAULT_WORKERS):
+    '''Call func(id) for every id, func return True when warmed'''
+    ids = unique(ids)
+    workers = max(1, min(int(workers), MAX_WORKERS))
+    pool = WorkerPool(size=workers, name='prewarm')
+    started = time.time()
+    jobs = [pool.submit(func, nid) for nid in ids]
+    failed = [nid for nid, job in zip(ids, jobs) if job.wait() is not True]
+    elapsed = time.time() - started
+    report = {
+        'count': len(ids),
+        'warmed': len(ids) - len(failed),
+        'failed': failed,
+        'workers': workers,
+        'elapsed': round(elapsed, 3),
+        'per_second': round(len(ids) / elapsed, 1) if elapsed else 0
+    }
+    logger.info('Prewarm %s', report)
+    return report
@@ -0,0 +1,103 @@
+'''
+    qobuz.extension.kooli.render
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Rendered template cache with validators
+
+    Output is kept per (template, id) along with an ETag computed from the
+    version of the API payloads used to render it (cache updated_on), so
+    Kodi rescans get a 304 or a memory hit instead of a render. HEAD is
+    answered from the ETag only, never rendered.
+
+    :part_of: kodi-qobuz
+    :copyright: (c) 2012-2018 by Joachim Basmaison, Cyril Leclerc
+    :license: GPLv3, see LICENSE for more details.
+'''
+from collections import OrderedDict
+from datetime import datetime
+import threading
+
+from flask import make_response, render_template, request
+
+from qobuz.debug import getLogger
+from qobuz.util.hash import hashit
+
+logger = getLogger(__name__)
+
+RENDER_CACHE_SIZE = 2048
+CACHE_CONTROL = 'no-cache'
+
+
+def make_version(versions, image_size):
+    '''Payloads versions (updated_on) and image size used by templates'''
+    return '%s/%s' % ('/'.join(str(v) for v in versions), image_size)
+
+
+class RenderCache(object):
+    def __init__(self, size=RENDER_CACHE_SIZE):
+        self.size = size
+        self.lock = threading.Lock()
+        self.store = OrderedDict()
+        self.statHit = 0
+        self.statMiss = 0
+        self.statEvict = 0
+
+    @classmethod
+    def make_etag(cls, template, nid, version):
+        return hashit('%s/%s/%s' % (template, nid, version))
+
+    def get(self, template, nid, etag):
+        with self.lock:
+            entry = self.store.pop((template, nid), None)
+            if entry is None or entry[0] != etag:
+                return None
+            self.store[(template, nid)] = entry
+            self.statHit += 1
+            return entry[1]
+
+    def set(self, template, nid, etag, body):
+        with self.lock:
+            self.store.pop((template, nid), None)
+            self.store[(template, nid)] = (etag, body)
+            while len(self.store) > self.size:
+                self.store.popitem(last=False)
+                self.statEvict += 1
+
+    def render(self, template, nid, version, context_factory):
+        '''Return (etag, body), context_factory is only called on miss'''
+        etag = self.make_etag(template, nid, version)
+        body = self.get(template, nid, etag)
+        if body is None:
+            self.statMiss += 1
+            body = render_template(template, **context_factory())
+            self.set(template, nid, etag, body)
+        return etag, body
+
+    def respond(self, template, nid, versions, image_size, context_factory):
+        '''Return flask response, versions is None when a payload isn't
+        cached (rendered without validators)'''
+        if versions is None:
+            if request.method == 'HEAD':
+                return ''
+            return render_template(template, **context_factory())
+        version = make_version(versions, image_size)
+        etag = self.make_etag(template, nid, version)
+        last_modified = datetime.utcfromtimestamp(max(versions))
+        if request.method == 'HEAD' or request.if_none_match.contains(etag):
+            return conditional(etag, last_modified)
+        etag, body = self.render(template, nid, version, context_factory)
+        return conditional(etag, last_modified, body)
+
+    def clear(self):
+        with self.lock:
+            self.store.clear()
+
+
+def conditional(etag, last_modified, body=''):
+    '''Response with validators, 304 when the client copy is current'''
+    response = make_response(body)
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    return response.make_conditional(request)
@@ -7,8 +7,6 @@
     :license: GPLv3, see LICENSE for more details.
 '''
 from os import path as P
-import SocketServer
-import socket
 import sys
 import threading
 import time
@@ -22,8 +20,10 @@ from kooli import log
 from kooli import qobuz_lib_path
 
 from kodi_six import xbmc  # pylint:disable=E0401
-from kooli.application import application, shutdown_server, qobuzApp
+from kooli.application import application, http_error, qobuzApp
 from kooli.monitor import Monitor
+from kooli.server import make_server
+from kooli.warmer import CacheWarmer
 from qobuz import config
 from qobuz.api import api
 from qobuz.api.user import current as user
@@ -34,24 +34,6 @@ import qobuz.gui.util as gui
 logger = getLogger(__name__)
 
 
-def my_finish(self):
-    if not self.wfile.closed:
-        try:
-            self.wfile.flush()
-        except socket.error:
-            # A final socket error may have occurred here, such as
-            # the local error ECONNABORTED.
-            pass
-        try:
-            self.wfile.close()
-            self.rfile.close()
-        except socket.error:
-            pass
-
-
-SocketServer.StreamRequestHandler.finish = my_finish  # Ugly monkey patching
-
-
 def is_empty(obj):
     if obj is None:
         return True
@@ -73,10 +55,14 @@ def is_service_enable():
     return config.app.registry.get('enable_scan_feature', to='bool')
 
 
+def is_warmer_enable():
+    return config.app.registry.get('cache_warmer', to='bool')
+
+
 @application.before_request
 def shutdown_request():
     if monitor.abortRequested:
-        shutdown_server()
+        return http_error(503)
     return None
 
 
@@ -87,14 +73,17 @@ class KooliService(threading.Thread):
         threading.Thread.__init__(self)
         self.daemon = True
         self.port = port
-        self.running = False
-        self.threaded = True
-        self.processes = 2
         self.alive = True
+        self.server = None
+
+    def step(self):
+        pass
 
     def stop(self):
-        shutdown_server()
         self.alive = False
+        if self.server is not None:
+            self.server.shutdown()
+            logger.info('KooliService stopped %s', self.server.get_metrics())
 
     def run(self):
         while self.alive:
@@ -108,14 +97,18 @@ class KooliService(threading.Thread):
                     gui.notify_warn('Login failed', 'Invalid credentials')
                 else:
                     try:
-                        application.run(port=self.port,
-                                        threaded=True,
-                                        processes=0,
-                                        debug=False,
-                                        use_reloader=False,
-                                        use_debugger=False,
-                                        use_evalex=True,
-                                        passthrough_errors=False)
+                        self.server = make_server(
+                            qobuzApp.registry.get('httpd_host',
+                                                  default='127.0.0.1'),
+                            self.port,
+                            application,
+                            backend=qobuzApp.registry.get(
+                                'httpd_server', default='pool'),
+                            workers=qobuzApp.registry.get(
+                                'httpd_workers', to='int', default=8),
+                            queue_size=qobuzApp.registry.get(
+                                'httpd_queue_size', to='int', default=64))
+                        self.server.serve_forever()
                     except Exception as e:
                         logger.error('KooliService port: %s Error: %s',
                                      self.port, e)
@@ -130,6 +123,11 @@ if __name__ == '__main__':
     else:
         notify_warn('Qobuz service / HTTPD',
                     'Service is disabled from configuration')
+    if is_warmer_enable():
+        monitor.add_service(
+            CacheWarmer(budget=config.app.registry.get(
+                'cache_warmer_budget', to='int', default=30)),
+            on_idle=True)
     monitor.start_all_service()
     alive = True
     while alive:
@@ -141,5 +139,6 @@ if __name__ == '__main__':
         if abort:
             alive = False
             continue
+        monitor.step()
         xbmc.sleep(1000)
     monitor.stop_all_service()
@@ -0,0 +1,177 @@
+'''
+    qobuz.extension.kooli.server
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    WSGI server backends for kooli
+
+    pool:     bounded thread pool, HTTP/1.1 keep-alive, graceful shutdown
+    werkzeug: werkzeug threaded server (one thread per connection)
+
+    Both backends expose serve_forever / shutdown / get_metrics so the
+    service doesn't depend on werkzeug.server.shutdown.
+
+    :part_of: kodi-qobuz
+    :copyright: (c) 2012-2018 by Joachim Basmaison, Cyril Leclerc
+    :license: GPLv3, see LICENSE for more details.
+'''
+import socket
+import threading
+import time
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+from werkzeug.serving import make_server as make_werkzeug_server
+
+from qobuz.debug import getLogger
+from qobuz.util.pool import WorkerPool
+
+logger = getLogger(__name__)
+
+DEFAULT_WORKERS = 8
+DEFAULT_QUEUE_SIZE = 64
+KEEP_ALIVE_TIMEOUT = 15
+SHUTDOWN_TIMEOUT = 5
+BUSY_RESPONSE = b'HTTP/1.1 503 Service Unavailable\r\n' \
+                b'Content-Length: 0\r\nConnection: close\r\n\r\n'
+
+current = None
+
+
+class RequestHandler(WSGIRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEP_ALIVE_TIMEOUT
+    disable_nagle_algorithm = True
+
+    def end_headers(self):
+        # Don't keep a worker on an idle connection when others are waiting
+        pool = getattr(self.server, 'pool', None)
+        if pool is not None and pool.pending and not self.close_connection:
+            self.close_connection = 1
+            self.send_header('Connection', 'close')
+        WSGIRequestHandler.end_headers(self)
+
+    def finish(self):
+        '''Kodi often drops the connection while we flush (seek, stop)'''
+        if not self.wfile.closed:
+            try:
+                self.wfile.flush()
+            except socket.error:
+                pass
+        try:
+            self.wfile.close()
+            self.rfile.close()
+        except socket.error:
+            pass
+
+    def log_request(self, *a, **ka):
+        pass
+
+
+class ThreadPoolWSGIServer(BaseWSGIServer):
+    '''Connections are handled by a bounded WorkerPool, when more than
+    queue_size connections are waiting new ones get a 503'''
+    multithread = True
+    request_queue_size = DEFAULT_QUEUE_SIZE
+
+    def __init__(self, host, port, app, workers=DEFAULT_WORKERS,
+                 queue_size=DEFAULT_QUEUE_SIZE):
+        self.request_queue_size = queue_size
+        BaseWSGIServer.__init__(self, host, port, app,
+                                handler=RequestHandler)
+        self.queue_size = queue_size
+        self.pool = WorkerPool(size=workers, name='httpd', idle_timeout=30,
+                               daemon=True)
+        self.lock = threading.Lock()
+        self.statBusy = 0
+        self.statQueueMax = 0
+        self.statRequest = 0
+        self.statRejected = 0
+
+    def get_metrics(self):
+        return {
+            'backend': 'pool',
+            'workers': self.pool.size,
+            'workers_alive': self.pool.active,
+            'workers_busy': self.statBusy,
+            'queue_depth': self.pool.pending,
+            'queue_depth_max': self.statQueueMax,
+            'connections': self.statRequest,
+            'rejected': self.statRejected
+        }
+
+    def process_request(self, request, client_address):
+        depth = self.pool.pending
+        if depth >= self.queue_size:
+            self.statRejected += 1
+            logger.warn('HttpdQueueFull %s', depth)
+            try:
+                request.sendall(BUSY_RESPONSE)
+            except socket.error:
+                pass
+            self.shutdown_request(request)
+            return
+        with self.lock:
+            self.statRequest += 1
+            self.statQueueMax = max(self.statQueueMax, depth + 1)
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        with self.lock:
+            self.statBusy += 1
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self.lock:
+                self.statBusy -= 1
+
+    def drain(self, timeout=SHUTDOWN_TIMEOUT):
+        '''Wait for queued and running requests, True when all are done'''
+        deadline = time.time() + timeout
+        while self.statBusy or self.pool.pending:
+            if time.time() > deadline:
+                logger.warn('HttpdDrainTimeout busy: %s, pending: %s',
+                            self.statBusy, self.pool.pending)
+                return False
+            time.sleep(0.05)
+        return True
+
+    def shutdown(self, timeout=SHUTDOWN_TIMEOUT):
+        '''Stop accepting connections then let running requests finish'''
+        BaseWSGIServer.shutdown(self)
+        self.drain(timeout)
+        self.pool.close()
+        self.server_close()
+
+
+class WerkzeugServer(object):
+    '''Werkzeug development server with the same interface'''
+
+    def __init__(self, host, port, app, **_ka):
+        self.server = make_werkzeug_server(host, port, app, threaded=True,
+                                           request_handler=RequestHandler)
+
+    def get_metrics(self):
+        return {'backend': 'werkzeug'}
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def shutdown(self, timeout=None):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+backends = {'pool': ThreadPoolWSGIServer, 'werkzeug': WerkzeugServer}
+
+
+def make_server(host, port, app, backend='pool', workers=DEFAULT_WORKERS,
+                queue_size=DEFAULT_QUEUE_SIZE):
+    global current
+    if backend not in backends:
+        logger.warn('Unknown httpd backend %s, using pool', backend)
+        backend = 'pool'
+    current = backends[backend](host, port, app, workers=workers,
+                                queue_size=queue_size)
+    return current
@@ -0,0 +1,161 @@
+'''
+    qobuz.extension.kooli.stream
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Streaming proxy between Kodi and Qobuz CDN
+
+    Upstream connections are pooled, Range requests are forwarded so
+    seeking doesn't restart the download and chunks are handed to the WSGI
+    server as they arrive. When the segment cache is enabled tracks are
+    served from disk and only missing segments are downloaded.
+
+    :part_of: kodi-qobuz
+    :copyright: (c) 2012-2018 by Joachim Basmaison, Cyril Leclerc
+    :license: GPLv3, see LICENSE for more details.
+'''
+import re
+
+from flask import Response, stream_with_context
+import requests
+from requests.adapters import HTTPAdapter
+
+from qobuz.api.raw import REQUEST_TIMEOUT
+from qobuz.cache.segment_cache import SegmentError
+from qobuz.debug import getLogger
+from qobuz.util.metrics import metrics
+
+logger = getLogger(__name__)
+bytes_total = metrics.counter(
+    'kooli_stream_bytes_total', 'Audio bytes sent to clients', ['source'])
+active_streams = metrics.gauge(
+    'kooli_stream_active', 'Audio responses being streamed', ['source'])
+
+DEFAULT_CHUNK_SIZE = 256 * 1024
+REQUEST_HEADERS = ['Range', 'If-Range']
+RESPONSE_HEADERS = ['Content-Type', 'Content-Length', 'Content-Range',
+                    'Accept-Ranges', 'Last-Modified', 'ETag']
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def make_session(pool_size=8):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+upstream = make_session()
+
+
+def forward_headers(headers, names):
+    return {name: headers[name] for name in names if name in headers}
+
+
+def iter_upstream(response, chunk_size):
+    active_streams.inc(source='upstream')
+    try:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if chunk:
+                bytes_total.inc(len(chunk), source='upstream')
+                yield chunk
+    except Exception as e:
+        logger.warn('StreamError %s', e)
+    finally:
+        active_streams.dec(source='upstream')
+        response.close()
+
+
+def proxy(url, request_headers, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''Return streamed flask Response for url, Range/Content-Range/
+    Content-Length/Accept-Ranges are passed through
+    '''
+    headers = forward_headers(request_headers, REQUEST_HEADERS)
+    try:
+        # Read timeout bounds each chunk, a stalled CDN free the worker
+        response = upstream.get(url, headers=headers, stream=True,
+                                timeout=REQUEST_TIMEOUT)
+    except Exception as e:
+        logger.error('UpstreamError %s', e)
+        return None
+    if response.status_code not in (200, 206):
+        logger.warn('UpstreamError %s', response.status_code)
+        response.close()
+        return Response(status=response.status_code)
+    return Response(
+        stream_with_context(iter_upstream(response, chunk_size)),
+        status=response.status_code,
+        headers=forward_headers(response.headers, RESPONSE_HEADERS),
+        direct_passthrough=True)
+
+
+def head(mimetype):
+    '''Answer HEAD without opening an upstream connection'''
+    return Response(status=200,
+                    headers={'Content-Type': mimetype,
+                             'Accept-Ranges': 'bytes'})
+
+
+def parse_range(header, size):
+    '''Return (start, end) inclusive for a single range header, None when
+    the whole file is requested and False when unsatisfiable
+    '''
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    start, end = match.groups()
+    if start == '':
+        if end == '':
+            return None
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start = int(start)
+        end = size - 1 if end == '' else min(int(end), size - 1)
+    if start > end:
+        return False
+    return start, end
+
+
+def cached(segments, url, track_id, format_id, request_headers,
+           chunk_size=DEFAULT_CHUNK_SIZE):
+    '''Return flask Response served from the segment cache, None when the
+    cache cannot handle this track (caller fallback to proxy)
+    '''
+    requested = request_headers.get('Range')
+    match = RANGE_RE.match(requested.strip()) if requested else None
+    start = int(match.group(1)) if match and match.group(1) else 0
+    try:
+        meta = segments.open(url, track_id, format_id, start=start)
+    except Exception as e:
+        logger.warn('SegmentCacheError %s', e)
+        return None
+    size = meta['size']
+    headers = {'Accept-Ranges': 'bytes'}
+    if meta.get('content_type'):
+        headers['Content-Type'] = meta['content_type']
+    byte_range = parse_range(requested, size)
+    if byte_range is False:
+        headers['Content-Range'] = 'bytes */%s' % size
+        return Response(status=416, headers=headers)
+    status = 200
+    start, end = 0, size - 1
+    if byte_range is not None:
+        status = 206
+        start, end = byte_range
+        headers['Content-Range'] = 'bytes %s-%s/%s' % (start, end, size)
+    headers['Content-Length'] = str(end - start + 1)
+
+    def generate():
+        active_streams.inc(source='segment')
+        try:
+            for data in segments.read(url, track_id, format_id, start, end,
+                                      chunk_size=chunk_size):
+                bytes_total.inc(len(data), source='segment')
+                yield data
+        except (SegmentError, EnvironmentError) as e:
+            logger.warn('StreamError %s', e)
+        finally:
+            active_streams.dec(source='segment')
+
+    return Response(stream_with_context(generate()), status=status,
+                    headers=headers, direct_passthrough=True)
@@ -0,0 +1,187 @@
+'''
+    qobuz.extension.kooli.warmer
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Keep the cache warm while Kodi is idle (on_idle monitor service)
+
+    User favorites, playlists, purchases and featured albums pages already
+    in cache (found through their tags, see qobuz.cache.qobuz_cache) are
+    fetched again shortly before they expire, soonest first, so opening the
+    addon hit a warm cache. At most budget requests are made per idle
+    window, garbage collection of expired entries is advanced a few files
+    per step when there is nothing to refresh.
+
+    Pinned entries that expired (offline mode, see qobuz.cache.connectivity)
+    are refreshed first, once the api is reachable again.
+
+    The warmer logs in by itself (the HTTP service may be disabled), user
+    entries are skipped with a message while it can't. Api calls run in a
+    background thread, one at a time, so the monitor loop still handle
+    abort requests.
+
+    ::example
+        monitor.add_service(CacheWarmer(budget=30), on_idle=True)
+
+    :part_of: kodi-qobuz
+    :copyright: (c) 2012-2018 by Joachim Basmaison, Cyril Leclerc
+    :license: GPLv3, see LICENSE for more details.
+'''
+import threading
+import time
+
+from qobuz import config
+from qobuz.api import api
+from qobuz.api.user import current as user
+from qobuz.cache import cache, cache_util
+from qobuz.debug import getLogger
+
+logger = getLogger(__name__)
+
+BUDGET = 30  # Requests per idle window
+LEAD = 15 * 60  # Refresh entries expiring in less than LEAD seconds
+GC_BATCH = 50  # Cache files checked per step
+GC_INTERVAL = 3600  # Seconds between two garbage collections
+SCAN_INTERVAL = 60  # Seconds between two scans of warmed entries
+WINDOW_GAP = 5  # Steps further apart belong to different idle windows
+LOGIN_RETRY = 300  # Seconds between two login attempts
+USER_TAGS = ['favorites', 'playlists', 'purchases']
+
+
+class CacheWarmer(object):
+    name = 'warmer'
+
+    def __init__(self, budget=BUDGET, lead=LEAD, gc_batch=GC_BATCH,
+                 gc_interval=GC_INTERVAL):
+        self.budget = budget
+        self.lead = lead
+        self.gc_batch = gc_batch
+        self.gc_interval = gc_interval
+        self.spent = 0
+        self.last_step = 0
+        self.queue = []
+        self.scanned_on = 0
+        self.collector = None
+        self.collected_on = 0
+        self.login_on = 0
+        self.worker = None
+        self.statWindow = 0
+        self.statRefresh = 0
+        self.statRefreshFail = 0
+        self.statCollect = 0
+
+    def start(self):
+        return True
+
+    def stop(self):
+        self.queue = []
+        self.collector = None
+
+    def is_busy(self):
+        return self.worker is not None and self.worker.is_alive()
+
+    def join(self, timeout=None):
+        if self.worker is not None:
+            self.worker.join(timeout)
+
+    def run_in_background(self, target, *a):
+        self.worker = threading.Thread(target=target, args=a,
+                                       name='cache-warmer')
+        self.worker.daemon = True
+        self.worker.start()
+
+    def need_login(self, now):
+        if user.logged or now - self.login_on < LOGIN_RETRY:
+            return False
+        self.login_on = now
+        return True
+
+    def login(self):
+        username = config.app.registry.get('username')
+        password = config.app.registry.get('password')
+        if username and password and api.login(username=username,
+                                                password=password) \
+                and user.logged:
+            return True
+        logger.warn('Not logged, favorites, playlists and purchases are '
+                    'not warmed')
+        return False
+
+    @classmethod
+    def get_tags(cls):
+        from qobuz.node.recommendation import RECOS_TYPE_IDS
+        tags = ['featured:%s' % kind for kind in RECOS_TYPE_IDS.values()]
+        user_id = user.get_id()
+        if user_id is None:
+            return tags
+        return ['%s:%s' % (name, user_id) for name in USER_TAGS] + tags
+
+    def scan(self, now):
+        '''Queue calls of expired pinned entries then of entries expiring
+        soon, soonest first'''
+        pinned = []
+        seen = set()
+        for key, entry in cache.get_pinned_entries().items():
+            seen.add(key)
+            if not cache.is_fresh(key, entry):
+                pinned.append((entry['pa'], entry['ka']))
+        due = []
+        for tag in self.get_tags():
+            for key in cache.tags.keys(tag):
+                if key in seen:
+                    continue
+                seen.add(key)
+                entry = cache.load(key)
+                if not entry or not cache.check_magic(entry) \
+                        or not entry.get('ttl'):
+                    continue
+                expire = entry['updated_on'] + entry['ttl']
+                if expire - now < self.lead:
+                    due.append((expire, entry['pa'], entry['ka']))
+        due.sort(key=lambda item: item[0])
+        self.queue = pinned + [(a, ka) for _, a, ka in due]
+        self.scanned_on = now
+        return len(self.queue)
+
+    def step(self, now=None):
+        '''Called by the monitor while Kodi is idle, return True when some
+        work was done'''
+        now = time.time() if now is None else now
+        if now - self.last_step > WINDOW_GAP:
+            self.spent = 0
+            self.statWindow += 1
+        self.last_step = now
+        if self.is_busy():
+            return True
+        if self.spent < self.budget and not cache.is_offline():
+            if self.need_login(now):
+                self.run_in_background(self.login)
+                return True
+            if not self.queue and now - self.scanned_on > SCAN_INTERVAL:
+                self.scan(now)
+            if self.queue:
+                self.spent += 1
+                self.run_in_background(self.refresh, *self.queue.pop(0))
+                return True
+        return self.collect(now)
+
+    def refresh(self, a, ka):
+        ka = dict((str(key), value) for key, value in ka.items())
+        if api.get(*a, forceRemote=True, **ka) is None:
+            self.statRefreshFail += 1
+            return False
+        self.statRefresh += 1
+        return True
+
+    def collect(self, now):
+        '''Advance garbage collection by gc_batch files'''
+        if self.collector is None:
+            if now - self.collected_on < self.gc_interval:
+                return False
+            self.collector = cache_util.iter_clean_old(cache)
+        for _ in range(self.gc_batch):
+            if next(self.collector, None) is None:
+                self.collector = None
+                self.collected_on = now
+                break
+            self.statCollect += 1
+        return True
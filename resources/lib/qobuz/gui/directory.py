@@ -13,6 +13,7 @@ from kodi_six import xbmcplugin  # pylint:disable=E0401
 from qobuz.debug import getLogger
 from qobuz.gui.bg_progress import Progress
 from qobuz.node import Flag
+from qobuz.util.trace import tracer
 
 logger = getLogger(__name__)
 
@@ -65,6 +66,7 @@ class Directory(object):
     def elapsed(self):
         return time.time() - self.started_on
 
+    @tracer.traced('directory.add_node')
     def add_node(self, node):
         if self.filter_double is not None:
             if self.filter_double & node.nt == node.nt:
@@ -83,7 +85,8 @@ class Directory(object):
         return self.__add_node(node)
 
     def __add_node(self, node):
-        item = node.makeListItem(replaceItems=self.replaceItems)
+        with tracer.span('node.makeListItem'):
+            item = node.makeListItem(replaceItems=self.replaceItems)
         if item is None:
             return False
         url = node.make_url(asLocalUrl=self.asLocalUrl)
@@ -95,8 +98,10 @@ class Directory(object):
 
     def add_to_xbmc_directory(self, is_folder=False, item=None, url=None,
                               **ka):
-        if not xbmcplugin.addDirectoryItem(self.handle, url, item, is_folder,
-                                           self.total_put):
+        with tracer.span('kodi.addDirectoryItem'):
+            added = xbmcplugin.addDirectoryItem(self.handle, url, item,
+                                                is_folder, self.total_put)
+        if not added:
             return False
         self.total_put += 1
         return True
@@ -110,13 +115,14 @@ class Directory(object):
         if not self.put_item_ok or self.total_put == 0:
             success = False
         if not self.asList:
-            xbmcplugin.setContent(
-                handle=self.handle, content=self.content_type)
-            xbmcplugin.endOfDirectory(
-                handle=self.handle,
-                succeeded=success,
-                updateListing=False,
-                cacheToDisc=success)
+            with tracer.span('kodi.endOfDirectory'):
+                xbmcplugin.setContent(
+                    handle=self.handle, content=self.content_type)
+                xbmcplugin.endOfDirectory(
+                    handle=self.handle,
+                    succeeded=success,
+                    updateListing=False,
+                    cacheToDisc=success)
         return self.total_put
 
     def __exit__(self, *a, **ka):
@@ -1,28 +1,50 @@
 import functools
+import imp
 import os
-import requests
+import threading
 
 from qobuz import config
+from qobuz.cache import cover_cache
 from qobuz.debug import getLogger
 from qobuz.util.common import get_default_image_size
-from qobuz.util.file import unlink
+from qobuz.util.file import RenamedTemporaryFile, unlink
 from qobuz.util.hash import hashit
+from qobuz.util.pool import WorkerPool
 from qobuz.util.random import randrange
 
 COMBINED_COVER_FMT = 'cover-{nid}-{size_w}-{size_h}-{count}-combine.jpg'
 TMPIMG_FMT = 'tmp-img.jpg'
-HASHED_ALBUM_COVER_FMT = 'cache-album-cover-{}.jpg'
+THUMBNAIL_FMT = 'thumb-{key}-{size_w}.jpg'
+COVER_DOWNLOAD_WORKERS = 4
+THUMBNAIL_SAVE_OPTIONS = {'quality': 90}
+MOSAIC_SAVE_OPTIONS = {'quality': 85, 'optimize': True, 'progressive': True}
 
 logger = getLogger(__name__)
 PIL_AVAILABLE = False
+Image = None
 
 try:
-    from PIL import Image
+    # Only look for PIL here, it's imported by the mosaic worker
+    imp.find_module('PIL')
     PIL_AVAILABLE = True
 except ImportError as e:
     logger.error('Cannot import PIL library')
 
 
+def _import_pil():
+    global Image
+    if Image is None:
+        from PIL import Image as _Image
+        Image = _Image
+    return Image
+
+# Mosaic are built one at a time, each one download its covers in parallel
+_mosaic_queue = WorkerPool(size=1, name='mosaic')
+_download_pool = WorkerPool(size=COVER_DOWNLOAD_WORKERS, name='cover')
+_pending = set()
+_pending_lock = threading.Lock()
+
+
 def _mywalk(path):
     for dirpath, _dirnames, filenames in os.walk(path):
         for name in filenames:
@@ -39,6 +61,7 @@ def _find_all_combined_images(covers_path):
 def cleanfs_combined_covers():
     ''' Clean all images under __covers_path__
     '''
+    cover_cache.clear()
     covers_path = config.path.combined_covers
     for filename in _find_all_combined_images(covers_path):
         unlink(filename)
@@ -59,30 +82,68 @@ def next_image_generator_factory(images):
 
 def get_remote_image(url):
     ''' get image from url and return path from local file'''
-    covers_path = config.path.combined_covers
-    hashed_filename = HASHED_ALBUM_COVER_FMT.format(
-        hashit(url))
-    new_path = os.path.join(covers_path, hashed_filename)
-
-    if not os.path.exists(new_path):
-        img_request = requests.get(url, stream=True)
-        if img_request.status_code != 200:
-            logger.warn('GetRemoteImageError %s', img_request.status_code)
-            return None
-        with open(new_path, 'wb') as write_handle:
-            write_handle.writelines(img_request.iter_content(1024))
-            write_handle.flush()
-    return new_path
+    return cover_cache.get(url)
+
+
+def _thumbnail_path(img_path, thumb_size_w):
+    '''Keyed by source mtime and size, a cover downloaded again get new
+    thumbnails (old ones are evicted by cover_cache)'''
+    stat = os.stat(img_path)
+    source = '%s-%s-%s' % (img_path, stat.st_mtime, stat.st_size)
+    return os.path.join(config.path.combined_covers, THUMBNAIL_FMT.format(
+        key=hashit(source), size_w=thumb_size_w))
+
+
+def _decode_reduced(part, size):
+    '''Decode as few pixels as possible: JPEG are decoded straight at 1/2,
+    1/4 or 1/8 scale (draft), other formats are reduced by an integer factor
+    when PIL support it
+    '''
+    if part.format == 'JPEG':
+        part.draft('RGB', size)
+    factor = min(part.width // size[0], part.height // size[1])
+    if factor >= 2 and hasattr(part, 'reduce'):
+        part = part.reduce(factor)
+    if part.mode != 'RGB':
+        part = part.convert('RGB')
+    return part
 
 
 def _resize_image(img_path, thumb_size_w):
+    '''Return image resized to thumb_size_w width, resized variants are
+    cached on disk per target size
+    '''
+    _import_pil()
+    try:
+        thumb_path = _thumbnail_path(img_path, thumb_size_w)
+    except OSError as e:
+        # Cover evicted by another process since cover_cache.get
+        img_path = cover_cache.recover(img_path)
+        if img_path is None:
+            logger.error('ResizeImageError %s', e)
+            return None
+        thumb_path = _thumbnail_path(img_path, thumb_size_w)
+    if cover_cache.touch(thumb_path):
+        try:
+            return Image.open(thumb_path)
+        except Exception as e:
+            logger.warn('ThumbnailCacheError %s', e)
     try:
         part = Image.open(img_path)
         new_height = thumb_size_w * part.height / part.width
-        return part.resize((thumb_size_w, new_height), Image.ANTIALIAS)
+        size = (thumb_size_w, new_height)
+        part = _decode_reduced(part, size)
+        thumb = part.resize(size, Image.ANTIALIAS)
     except Exception as e:
         logger.error('ResizeImageError %s', e)
-    return None
+        return None
+    try:
+        with RenamedTemporaryFile(thumb_path) as write_handle:
+            thumb.save(write_handle.tmpfile, 'JPEG', **THUMBNAIL_SAVE_OPTIONS)
+        cover_cache.add(thumb_path)
+    except Exception as e:
+        logger.warn('ThumbnailCacheError %s', e)
+    return thumb
 
 
 def _combine_factory_final_path(count, nid, img_size):
@@ -97,37 +158,51 @@ def _combine_factory_final_path(count, nid, img_size):
     return os.path.join(covers_path, filename)
 
 
-def _combine_factory_build_one(thumb_size,
-                               image_path_generator,
-                               new_image,
-                               rowcol):
-    img_path = next(image_path_generator)
+def _local_image(img_path):
     if img_path.startswith('http'):
-        img_path = get_remote_image(img_path)
+        return get_remote_image(img_path)
+    return img_path
+
+
+def _download_covers(image_path_generator, count):
+    '''Fetch covers needed by our mosaic in parallel, return local paths in
+    mosaic order
+    '''
+    selection = [next(image_path_generator) for _i in range(0, count)]
+    unique = list(set(selection))
+    local = dict(zip(unique, _download_pool.map(_local_image, unique)))
+    return [local[img_path] for img_path in selection]
+
+
+def _combine_factory_build_one(thumb_size, img_path, new_image, rowcol):
+    if img_path is None:
+        return
     image = _resize_image(img_path, thumb_size[0])
     try:
         new_image.paste(image, (rowcol[0] * thumb_size[0],
-                            rowcol[1] * thumb_size[1]))
+                                rowcol[1] * thumb_size[1]))
     except:
         logger.warn("new_image paste failed")
 
 
 def _combine_factory_build(final_path, img_size, count, image_path_generator):
-    new_image = Image.new('RGB', img_size)
+    new_image = _import_pil().new('RGB', img_size)
     demi_count = count / 2
     thumb_size = (
         int(img_size[0] / demi_count),
         int(img_size[1] / demi_count)
     )
-
+    paths = _download_covers(image_path_generator, count)
     for i in range(0, demi_count):
         for j in range(0, demi_count):
             _combine_factory_build_one(thumb_size,
-                                       image_path_generator,
+                                       paths[i * demi_count + j],
                                        new_image,
                                        (i, j))
-
-    new_image.save(final_path)
+    # Written aside then renamed, a partial mosaic is never served
+    with RenamedTemporaryFile(final_path) as write_handle:
+        new_image.save(write_handle.tmpfile, 'JPEG', **MOSAIC_SAVE_OPTIONS)
+    cover_cache.add(final_path)
     return final_path
 
 
@@ -137,18 +212,38 @@ def _combine_nopil(_nid, images=None):
     return images[randrange(0, len(images) - 1)]
 
 
+def _combine_background(final_path, img_size, count, image_path_generator):
+    try:
+        return _combine_factory_build(final_path,
+                                      img_size,
+                                      count,
+                                      image_path_generator)
+    finally:
+        with _pending_lock:
+            _pending.discard(final_path)
+
+
 def _combine_pil(nid, images=None):
-    ''' Combine the first 4 images of images array into single image '''
+    ''' Combine the first 4 images of images array into single image
+
+    Mosaic is built by a background worker, until it's ready we are
+    returning a single cover
+    '''
     count = 4
     img_size = get_default_image_size()
     image_path_generator = next_image_generator_factory(images)
     final_path = _combine_factory_final_path(count, nid, img_size)
-    if os.path.exists(final_path):
+    if cover_cache.touch(final_path):
         return final_path
-    return _combine_factory_build(final_path,
-                                  img_size,
-                                  count,
-                                  image_path_generator)
+    with _pending_lock:
+        if final_path not in _pending:
+            _pending.add(final_path)
+            _mosaic_queue.submit(_combine_background,
+                                 final_path,
+                                 img_size,
+                                 count,
+                                 image_path_generator)
+    return _combine_nopil(nid, images=images)
 
 
 def combine_factory(pil_available, nid, images=None):
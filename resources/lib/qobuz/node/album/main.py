@@ -44,27 +44,34 @@ class Node_album(INode):
                        album_id=self.nid,
                        noRemote=options.noRemote)
 
+    def get_pin_tags(self):
+        return ['album:%s' % self.nid]
+
     def populate(self, options=None):
         if self.count() == 0:
             return False
+        # Getters walk album data, read once; each track get its own dicts
+        # (callers set images or labels on them)
+        title, genre, year, artist = (self.get_title(), self.get_genre(),
+                                      self.get_year(), self.get_artist())
+        label, albums_count = (self.get_label(),
+                               self.get_label_albums_count())
         for track in self.get_property(self._items_path):
-            track.update({
-                'album': {
-                    'title': self.get_title(),
-                    'id': self.nid,
-                    'genre': {
-                        'name': self.get_genre()
-                    },
-                    'label': {
-                        'name': self.get_label(),
-                        'albums_count': self.get_label_albums_count()
-                    },
-                    'year': self.get_year(),
-                    'artist': {
-                        'name': self.get_artist()
-                    }
+            track['album'] = {
+                'title': title,
+                'id': self.nid,
+                'genre': {
+                    'name': genre
+                },
+                'label': {
+                    'name': label,
+                    'albums_count': albums_count
+                },
+                'year': year,
+                'artist': {
+                    'name': artist
                 }
-            })
+            }
             self.add_child(getNode(Flag.TRACK, data=track))
         return True
 
@@ -7,6 +7,7 @@
     :license: GPLv3, see LICENSE for more details.
 '''
 from qobuz.api import api
+from qobuz.cache import cache
 from qobuz.debug import getLogger
 from qobuz.gui.util import getImage, lang
 from qobuz.node import Flag, getNode
@@ -63,13 +64,20 @@ class Node_collection(INode):
         if self.source is not None:
             kwargs['source'] = self.source
         logger.info('SEARCH %s', kwargs)
+        data = None
         if self.search_type == 'albums':
-            return api.get('/collection/getAlbums', **kwargs)
+            data = api.get('/collection/getAlbums', **kwargs)
         elif self.search_type == 'artists':
-            return api.get('/collection/getArtists', **kwargs)
+            data = api.get('/collection/getArtists', **kwargs)
         elif self.search_type == 'tracks':
-            return api.get('/collection/getTracks', **kwargs)
-        return None
+            data = api.get('/collection/getTracks', **kwargs)
+        if data is None and self.source is None:
+            # Favorites and purchases seen before
+            items = cache.search_local(self.search_type[:-1], query,
+                                       limit=int(self.limit), owned=True)
+            if items:
+                return {'items': items}
+        return data
 
     @classmethod
     def get_description(cls):
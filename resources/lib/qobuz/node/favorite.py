@@ -17,7 +17,6 @@ from qobuz.gui.util import getImage, notifyH, executeBuiltin, containerUpdate
 from qobuz.gui.util import lang
 from qobuz.node import getNode, Flag, helper
 from qobuz.node.inode import INode
-from qobuz.renderer import renderer
 
 logger = getLogger(__name__)
 dialogHeading = lang(30083)
@@ -58,6 +57,9 @@ class Node_favorite(INode):
                        limit=self.limit,
                        offset=self.offset)
 
+    def get_pin_tags(self):
+        return ['favorites:%s' % user.get_id()]
+
     def make_url(self, **ka):
         if self.search_type is not None:
             ka['search-type'] = self.search_type
@@ -171,6 +173,7 @@ class Node_favorite(INode):
     def list_albums(self, qnt, qid):
         ''' List albums givent a node type and a node id
         '''
+        from qobuz.renderer import renderer
         album_ids = {}
         nodes = []
         if qnt & Flag.ALBUM == Flag.ALBUM:
@@ -260,6 +263,7 @@ class Node_favorite(INode):
     def list_tracks(self, qnt, qid):
         '''List tracks given a node type and a node id
         '''
+        from qobuz.renderer import renderer
         track_ids = {}
         nodes = []
         if qnt & Flag.TRACK == Flag.TRACK:
@@ -280,6 +284,7 @@ class Node_favorite(INode):
         return nodes
 
     def list_artists(self, qnt, qid):
+        from qobuz.renderer import renderer
         artist_ids = {}
         nodes = []
         if qnt & Flag.ARTIST == Flag.ARTIST:
@@ -310,25 +315,10 @@ class Node_favorite(INode):
         self._delete_cache()
         return True
 
-    def _delete_cache(self):
-        keys = [cache.make_key(
-            '/favorite/getUserFavorites',
-            user_id=user.get_id(),
-            limit=self.limit,
-            offset=self.offset)]
-        for kind in ['artists', 'albums', 'tracks']:
-            keys.append(
-                cache.make_key(
-                    '/favorite/getUserFavorites',
-                    user_id=user.get_id(),
-                    limit=self.limit,
-                    type=kind,
-                    offset=self.offset))
-        ret = False
-        for key in keys:
-            if cache.delete(key):
-                ret = True
-        return ret
+    @classmethod
+    def _delete_cache(cls):
+        '''Drop every page and type of user favorites'''
+        return cache.invalidate('favorites:%s' % user.get_id()) > 0
 
     def del_track(self, track_id):
         if api.favorite_delete(track_ids=track_id):
@@ -376,6 +366,6 @@ class Node_favorite(INode):
             image = super(Node_favorite, self).get_image()
         return image
 
-    def _get_node_storage_filename(self):
-        return u'userdata-{user_id}-favorite-{nid}.local'.format(
+    def _get_node_storage_name(self):
+        return u'{user_id}-favorite-{nid}'.format(
             user_id=user.get_id(), nid=self.nid)
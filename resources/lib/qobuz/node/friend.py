@@ -22,6 +22,8 @@ logger = getLogger(__name__)
 
 
 class Node_friend(INode):
+    template_state = ('name', )
+
     def __init__(self, parent=None, parameters=None, data=None):
         parameters = {} if parameters is None else parameters
         super(Node_friend, self).__init__(
@@ -17,6 +17,8 @@ logger = getLogger(__name__)
 
 
 class Node_friends(INode):
+    template_state = ('name', )
+
     def __init__(self, parent=None, parameters=None, data=None):
         parameters = {} if parameters is None else parameters
         super(Node_friends, self).__init__(
@@ -1,6 +1,8 @@
+import re
 import urllib
 
 from qobuz import config
+from qobuz import route
 from qobuz.constants import Mode
 from qobuz.debug import getLogger
 from qobuz.gui.util import lang, runPlugin, containerUpdate
@@ -9,21 +11,85 @@ from qobuz.theme import theme, color
 
 logger = getLogger(__name__)
 
+# Placeholders are made of url safe characters so they survive make_url and
+# urllib.quote_plus untouched
+_NID = '__qobuz_ctx_nid__'
+_ARTIST_ID = '__qobuz_ctx_artist_id__'
+_LABEL = '__qobuz_ctx_label__'
+_QLABEL = '__qobuz_ctx_qlabel__'
 
-def attach_context_menu(node, item, menu):
+_templates = {}
+
+
+class _MenuRecorder(object):
+    '''Record menu.add calls so we can replay them for every node sharing
+    the same template
+    '''
+
+    def __init__(self):
+        self.entries = []
+
+    def add(self, **ka):
+        self.entries.append(ka)
+
+
+def _template_key(node):
+    '''Everything except node ids and label that can change the menu'''
+    parent_nt = node.parent.nt if node.parent else None
+    try:
+        parameters = tuple(sorted(
+            (k, v) for k, v in node.parameters.items() if k != 'nid'))
+        state = tuple(getattr(node, name, None)
+                      for name in node.template_state)
+        hash((parameters, state))
+    except TypeError:
+        return None
+    return (node.__class__, node.nt, parent_nt, parameters, state)
+
+
+def _quote_label(node):
+    label = node.get_label()
+    try:
+        label = label.encode('utf8', 'replace')
+    except Exception as e:
+        logger.warn('Cannot set query... %s %s', repr(label), e)
+        label = ''
+    # Substituted in an url built by route.build, quote it the same way
+    return route.quote(urllib.quote_plus(label))
+
+
+def _fill(text, values):
+    for token, value in values:
+        if token not in text:
+            continue
+        if value is None or value == '':
+            # Same behavior as make_url that skip empty parameters
+            text = re.sub(r'&[\w-]+=%s' % token, '', text)
+            text = text.replace(token, '')
+        else:
+            if not isinstance(value, basestring):
+                value = str(value)
+            text = text.replace(token, value)
+    return text
+
+
+def _build_template(node):
     '''Note: Url made with make_url must set mode (like mode=Mode.VIEW)
         else we are copying current mode (for track it's Mode.PLAY ...)
     '''
+    menu = _MenuRecorder()
     # HOME
     colorCaution = theme.get('item/caution/color')
+    colorPlaylist = theme.get('menu/playlist/color')
+    colorFavorite = theme.get('menu/favorite/color')
 
     def c_pl(txt):
-        return color(theme.get('menu/playlist/color'), txt)
+        return color(colorPlaylist, txt)
 
     def c_fav(txt):
-        return color(theme.get('menu/favorite/color'), txt)
+        return color(colorFavorite, txt)
 
-    url = node.make_url(nt=Flag.ROOT, mode=Mode.VIEW, nm='')
+    url = node.make_url(nt=Flag.ROOT, mode=Mode.VIEW, nm='', nid=_NID)
     menu.add(path='qobuz',
              label="Qobuz",
              cmd=containerUpdate(url, False),
@@ -31,10 +97,9 @@ def attach_context_menu(node, item, menu):
              pos=-5)
     # ARTIST
     if node.nt & (Flag.ALBUM | Flag.TRACK | Flag.ARTIST):
-        artist_id = node.get_artist_id()
         # Similar artist
         url = node.make_url(
-            nt=Flag.SIMILAR_ARTIST, nid=artist_id, mode=Mode.VIEW)
+            nt=Flag.SIMILAR_ARTIST, nid=_ARTIST_ID, mode=Mode.VIEW)
         menu.add(path='artist/similar',
                  label=lang(30160),
                  cmd=containerUpdate(url, True))
@@ -44,7 +109,8 @@ def attach_context_menu(node, item, menu):
         wf = wf and node.parent.nt & ~Flag.FAVORITE
     if wf:
         # ADD TO FAVORITES / TRACKS
-        url = node.make_url(nt=Flag.FAVORITE, nm='', mode=Mode.VIEW)
+        url = node.make_url(nt=Flag.FAVORITE, nm='', mode=Mode.VIEW,
+                            nid=_NID)
         menu.add(path='favorites',
                  label=c_fav("Favorites"),
                  cmd=containerUpdate(url, True),
@@ -52,7 +118,8 @@ def attach_context_menu(node, item, menu):
         url = node.make_url(
             nt=Flag.FAVORITE,
             nm='gui_add_tracks',
-            qid=node.nid,
+            nid=_NID,
+            qid=_NID,
             qnt=node.nt,
             mode=Mode.VIEW)
         menu.add(path='favorites/add_tracks',
@@ -62,7 +129,8 @@ def attach_context_menu(node, item, menu):
         url = node.make_url(
             nt=Flag.FAVORITE,
             nm='gui_add_albums',
-            qid=node.nid,
+            nid=_NID,
+            qid=_NID,
             qnt=node.nt,
             mode=Mode.VIEW)
         menu.add(path='favorites/add_albums',
@@ -80,7 +148,8 @@ def attach_context_menu(node, item, menu):
         #          cmd=runPlugin(url))
 
     if node.parent and (node.parent.nt & Flag.FAVORITE):
-        url = node.make_url(nt=Flag.FAVORITE, nm='', mode=Mode.VIEW)
+        url = node.make_url(nt=Flag.FAVORITE, nm='', mode=Mode.VIEW,
+                            nid=_NID)
         menu.add(path='favorites',
                  label="Favorites",
                  cmd=containerUpdate(url, True),
@@ -88,11 +157,12 @@ def attach_context_menu(node, item, menu):
         url = node.make_url(
             nt=Flag.FAVORITE,
             nm='gui_remove',
-            qid=node.nid,
+            nid=_NID,
+            qid=_NID,
             qnt=node.nt,
             mode=Mode.VIEW)
         menu.add(path='favorites/remove',
-                 label=c_fav('Remove %s' % (node.get_label())),
+                 label=c_fav('Remove %s' % _LABEL),
                  cmd=runPlugin(url),
                  color=colorCaution)
     wf = ~Flag.USERPLAYLISTS
@@ -113,26 +183,21 @@ def attach_context_menu(node, item, menu):
                 nm='gui_add_to_current',
                 qnt=node.nt,
                 mode=Mode.VIEW,
-                qid=node.nid))
+                nid=_NID,
+                qid=_NID))
         menu.add(path='playlist/add_to_current',
                  label=c_pl(lang(30161)),
                  cmd=cmd)
-        label = node.get_label()
-        try:
-            label = label.encode('utf8', 'replace')
-        except Exception as e:
-            logger.warn('Cannot set query... %s %s', repr(label), e)
-            label = ''
-        label = urllib.quote_plus(label)
         # ADD AS NEW
         cmd = runPlugin(
             node.make_url(
                 nt=Flag.PLAYLIST,
                 nm='gui_add_as_new',
                 qnt=node.nt,
-                query=label,
+                query=_QLABEL,
                 mode=Mode.VIEW,
-                qid=node.nid))
+                nid=_NID,
+                qid=_NID))
         menu.add(path='playlist/add_as_new',
                  label=c_pl(lang(30082)),
                  cmd=cmd)
@@ -141,24 +206,29 @@ def attach_context_menu(node, item, menu):
     if node.nt | cFlag == cFlag:
         cmd = runPlugin(
             node.make_url(
-                nt=Flag.PLAYLIST, nm="gui_create", mode=Mode.VIEW))
+                nt=Flag.PLAYLIST, nm="gui_create", mode=Mode.VIEW,
+                nid=_NID))
         menu.add(path='playlist/create', label=c_pl(lang(30164)), cmd=cmd)
     # VIEW BIG DIR
     # cmd = containerUpdate(node.make_url(mode=Mode.VIEW_BIG_DIR))
     # menu.add(path='qobuz/big_dir', label=lang(30158), cmd=cmd)
+    # OFFLINE, pinned content is kept and refreshed (see INode.pin)
+    if node.nt & (Flag.ALBUM | Flag.PLAYLIST | Flag.FAVORITE |
+                  Flag.PURCHASE):
+        cmd = runPlugin(
+            node.make_url(nm='gui_toggle_pin', mode=Mode.VIEW, nid=_NID))
+        menu.add(path='qobuz/pin',
+                 label='Pin / unpin for offline',
+                 cmd=cmd)
     if config.app.registry.get('enable_scan_feature', to='bool'):
-        # SCAN
-        query = urllib.quote_plus(
-            node.make_url(
-                mode=Mode.SCAN, asLocalUrl=True))
-        url = node.make_url(
-            nt=Flag.ROOT, mode=Mode.VIEW, nm='gui_scan', query=query)
-        menu.add(path='qobuz/scan', cmd=runPlugin(url), label='scan')
+        # SCAN, local url are node specific (track embed album id...)
+        menu.add(path='qobuz/scan', cmd=None, label='scan')
     if node.nt & (Flag.ALL & ~Flag.ALBUM & ~Flag.TRACK & ~Flag.PLAYLIST):
         # ERASE CACHE
         cmd = runPlugin(
             node.make_url(
-                nt=Flag.ROOT, nm="cache_remove", mode=Mode.VIEW))
+                nt=Flag.ROOT, nm="cache_remove", mode=Mode.VIEW,
+                nid=_NID))
         menu.add(path='qobuz/erase_cache',
                  label=lang(30117),
                  cmd=cmd,
@@ -173,3 +243,45 @@ def attach_context_menu(node, item, menu):
 #                     label='Test web service',
 #                     cmd=cmd,
 #                     pos=11)
+    return menu.entries
+
+
+def _scan_cmd(node):
+    query = urllib.quote_plus(
+        node.make_url(
+            mode=Mode.SCAN, asLocalUrl=True))
+    url = node.make_url(
+        nt=Flag.ROOT, mode=Mode.VIEW, nm='gui_scan', query=query)
+    return runPlugin(url)
+
+
+def get_template(node):
+    '''Return menu entries for this kind of node, registry and theme values
+    are resolved only once per run
+    '''
+    key = _template_key(node)
+    if key is None:
+        return _build_template(node)
+    if key not in _templates:
+        _templates[key] = _build_template(node)
+    return _templates[key]
+
+
+def attach_context_menu(node, item, menu):
+    entries = get_template(node)
+    artist_id = None
+    if node.nt & (Flag.ALBUM | Flag.TRACK | Flag.ARTIST):
+        artist_id = node.get_artist_id()
+    label = node.get_label()
+    values = ((_NID, node.nid),
+              (_ARTIST_ID, artist_id),
+              (_QLABEL, _quote_label(node) if label else None),
+              (_LABEL, label))
+    for entry in entries:
+        ka = dict(entry)
+        if ka['cmd'] is None:
+            ka['cmd'] = _scan_cmd(node)
+        else:
+            ka['cmd'] = _fill(ka['cmd'], values)
+        ka['label'] = _fill(ka['label'], values)
+        menu.add(**ka)
@@ -11,11 +11,13 @@ import sys
 import urllib
 
 from .context_menu import attach_context_menu
-from .pagination import add_pagination
+from .pagination import add_pagination, remaining_offsets
+from .pagination import iter_fetched, submit_pages
 from .props import node_type_from_class, node_image_from_class
 from .props import node_contenttype_from_class
 from qobuz import config
 from qobuz import exception
+from qobuz import route
 from qobuz.api import api
 from qobuz.api.user import current as current_user
 from qobuz.cache import cache
@@ -23,15 +25,24 @@ from qobuz.constants import Mode
 from qobuz.debug import getLogger
 from qobuz.gui.contextmenu import contextMenu
 from qobuz.node import Flag, getNode, helper
-from qobuz.renderer import renderer
-from qobuz.storage import Storage
+from qobuz import storage as storageUtil
 from qobuz.util import data as dataUtil
 from qobuz.util import properties
 from qobuz.util.converter import converter
 from qobuz.util.random import randrange
+from qobuz.util.trace import tracer
 
 logger = getLogger(__name__)
 
+# Parameters a node pass down to the urls it builds
+INHERITED_PARAMETERS = ('qnt', 'qid', 'query', 'search-type')
+USERDATA_FILENAME = 'userdata.local'
+# Files of user and node data before USERDATA_FILENAME
+LEGACY_USERDATA = [
+    (r'^user-(\w+)\.local$', 'user-{0}'),
+    (r'^userdata-(\w+-\w+-\w+)\.local$', '{0}'),
+]
+
 
 def get_property_helper(data, path, to):
     try:
@@ -54,6 +65,8 @@ class INode(object):
         The main build_down method is responsible for the logic flow
         (recursive, depth, whiteFlag, blackFlag...)
     '''
+    # Attributes, not parameters, make_url read (see context_menu)
+    template_state = ()
 
     def __init__(self, parent=None, parameters=None, data=None):
         '''Constructor
@@ -243,9 +256,8 @@ class INode(object):
         return True
 
     def make_url(self, **ka):
-        '''Generate URL to navigate between nodes
+        '''Generate URL to navigate between nodes (see qobuz.route)
             Nodes with custom parameters must override this method
-            @todo: Ugly need rewrite =]
         '''
         if 'mode' not in ka:
             ka['mode'] = Mode.VIEW
@@ -259,24 +271,11 @@ class INode(object):
             del ka['asLocalUrl']
         if 'offset' in ka and ka['offset'] == 0:
             del ka['offset']
-        for name in ['qnt', 'qid', 'query', 'search-type', 'mode']:
-            if name in ka:
-                continue
-            value = self.get_parameter(name)
-            if value is None:
-                continue
-            ka[name] = self.get_parameter(name)
-        url = sys.argv[0] + '?'
-        for key in sorted(ka):
-            value = ka[key]
-            if value is None:
-                continue
-            value = str(value).strip()
-            if value == '':
-                continue
-            url += key + '=' + value + '&'
-        url = url[:-1]
-        return url
+        if self.parameters:
+            for name in INHERITED_PARAMETERS:
+                if name not in ka and self.parameters.get(name) is not None:
+                    ka[name] = self.parameters[name]
+        return route.build(sys.argv[0], ka)
 
     def makeListItem(self, **ka):
         '''
@@ -348,6 +347,7 @@ class INode(object):
                      lvl=1,
                      whiteFlag=Flag.ALL,
                      blackFlag=Flag.TRACK & Flag.STOPBUILD):
+        from qobuz.renderer import renderer
         render = renderer(nt, parameters)
         render.depth = -1
         render.whiteFlag = whiteFlag
@@ -362,32 +362,59 @@ class INode(object):
         '''
         return {}
 
+    @tracer.traced('node.populating')
     def populating(self, options=None):
         options = options if options is not None else helper.TreeTraverseOpts()
         data = {} if options.data is None else options.data
         if options.lvl != -1 and options.lvl < 1:
             return False
         if self.nt & options.blackFlag != self.nt:
-            new_data = self.fetch(options)
+            with tracer.span('node.fetch'):
+                new_data = self.fetch(options)
             if new_data is None:
                 return False
             data.update(new_data)
             self.data = data
             self.__add_pagination(self.data)
-        self.populate(options)
+        with tracer.span('node.populate'):
+            self.populate(options)
         new_options = options.clone()
         if options.lvl != -1:
             new_options.lvl -= 1
-        self.__add_pagination_node(options.xdir,
-                                   options.lvl,
-                                   options.whiteFlag)
-        for child in self.childs:
+            self.__add_pagination_node(options.xdir,
+                                       options.lvl,
+                                       options.whiteFlag)
+        # Remaining pages are fetched while we populate this one
+        jobs = self.__submit_pages(options) if options.lvl == -1 else []
+        self.__add_childs(self.childs, options, new_options)
+        for page, data in iter_fetched(jobs):
+            page.data = data
+            with tracer.span('node.populate'):
+                page.populate(options)
+            self.__add_childs(page.childs, options, new_options)
+
+    @classmethod
+    def __add_childs(cls, childs, options, new_options):
+        for child in childs:
             if (child.nt & options.whiteFlag == child.nt) and not (
                     options.xdir.add_node(child)):
                 logger.error('Could not add node')
                 continue
             child.populating(new_options)
 
+    def __submit_pages(self, options):
+        '''Whole directory: start fetching every remaining page
+        concurrently, return [(page, job)]'''
+        pages = []
+        for offset in remaining_offsets(self):
+            parameters = dict(self.parameters, offset=offset, nid=self.nid)
+            page = getNode(self.nt, parameters)
+            page.parent = self
+            pages.append(page)
+        if not pages:
+            return []
+        return submit_pages(pages, options)
+
     def populate(self, options=None):
         '''Hook / _build_down:
         This method is called by build_down, each object who
@@ -418,11 +445,19 @@ class INode(object):
     def get_user_storage(self):
         if self.user_storage is not None:
             return self.user_storage
-        filename = os.path.join(cache.base_path,
-                                'user-%s.local' % str(current_user.get_id()))
-        self.user_storage = Storage(filename)
+        self.user_storage = storageUtil.StorageView(
+            self.get_shared_storage(), 'user-%s' % current_user.get_id())
         return self.user_storage
 
+    @classmethod
+    def get_shared_storage(cls):
+        '''User and node data share one journaled file'''
+        storage = storageUtil.get_shared(
+            os.path.join(cache.base_path, USERDATA_FILENAME))
+        storageUtil.import_legacy(storage, cache.base_path, LEGACY_USERDATA,
+                                  'legacy-imported')
+        return storage
+
     @classmethod
     def get_user_path(cls):
         return os.path.join(cache.base_path)
@@ -448,28 +483,21 @@ class INode(object):
     def __str__(self):
         return '<{class_name} nid={nid}>'.format(**self.as_dict())
 
-    def get_node_storage_path(self):
-        return os.path.join(cache.base_path, self._get_node_storage_filename())
-
     def get_node_storage(self):
         if self.node_storage is not None:
             return self.node_storage
-        self.node_storage = Storage(self.get_node_storage_path())
+        self.node_storage = storageUtil.StorageView(
+            self.get_shared_storage(), self._get_node_storage_name())
         return self.node_storage
 
     def remove_node_storage(self):
-        filename = self.get_node_storage_path()
-        if os.path.exists(filename):
-            os.unlink(filename)
+        storage = self.get_node_storage()
+        storage.clear()
+        return storage.sync()
 
-    def _get_node_storage_filename(self):
+    def _get_node_storage_name(self):
         raise NotImplementedError(self)
 
-    def remove_playlist_storage(self):
-        path = os.path.join(cache.base_path, self._get_node_storage_filename())
-        if os.path.exists(path):
-            os.unlink(path)
-
     def get_image_from_storage(self):
         desired_size = config.app.registry.get('image_default_size',
                                                default=None)
@@ -494,6 +522,32 @@ class INode(object):
                 logger.error('Cannot get node storage')
         return None
 
+    def get_pin_tags(self):
+        '''Cache tags keeping this node available offline (see
+        qobuz.cache.qobuz_cache), empty when it cannot be pinned'''
+        return []
+
+    def pin(self):
+        '''Pin and fetch, so it's in cache before we go offline'''
+        cache.pin(*self.get_pin_tags())
+        return self.fetch() is not None
+
+    def unpin(self):
+        return cache.unpin(*self.get_pin_tags())
+
+    def gui_toggle_pin(self):
+        from qobuz.gui.util import notify_log
+        tags = self.get_pin_tags()
+        if not tags:
+            return False
+        if all(cache.is_pinned(tag) for tag in tags):
+            self.unpin()
+            notify_log('Qobuz / Offline', 'Unpinned %s' % self.get_label())
+        else:
+            self.pin()
+            notify_log('Qobuz / Offline', 'Pinned %s' % self.get_label())
+        return True
+
     def count(self):
         if self.data is None:
             raise exception.NodeHasNoData(Flag.to_s(self.nt))
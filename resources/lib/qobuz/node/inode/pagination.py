@@ -1,3 +1,13 @@
+from qobuz.debug import getLogger
+from qobuz.util.pool import WorkerPool
+
+logger = getLogger(__name__)
+
+# Pages fetched concurrently when rendering a whole directory (depth -1),
+# shared by the whole recursion so nested directories stay bounded
+FETCH_ALL_WORKERS = 4
+_fetch_pool = WorkerPool(size=FETCH_ALL_WORKERS, name='fetch-all')
+
 _paginated = [
     'albums', 'labels', 'tracks', 'artists', 'playlists', 'playlist',
     'public_playlists', 'genres'
@@ -34,3 +44,32 @@ def add_pagination(node, data):
     node.pagination_limit = items['limit']
     node.pagination_next_offset = newlimit
     return True
+
+
+def remaining_offsets(node):
+    '''Offsets of the pages after the one node has fetched'''
+    if not node.pagination_next:
+        return []
+    limit = int(node.pagination_limit)
+    if limit <= 0:
+        return []
+    return range(node.pagination_next_offset, int(node.pagination_total),
+                 limit)
+
+
+def submit_pages(pages, options, pool=None):
+    '''Queue every page on the fetch-all pool, return [(page, job)] without
+    waiting'''
+    pool = _fetch_pool if pool is None else pool
+    return [(page, pool.submit(page.fetch, options)) for page in pages]
+
+
+def iter_fetched(jobs):
+    '''Yield (page, data) in order, as soon as a page (and pages before it)
+    is fetched, failed pages are skipped'''
+    for page, job in jobs:
+        data = job.wait()
+        if data is None:
+            logger.warn('Page fetch failed offset %s', page.offset)
+            continue
+        yield page, data
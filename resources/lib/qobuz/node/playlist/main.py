@@ -15,7 +15,6 @@ from qobuz import image
 from qobuz.api import api
 from qobuz.api.user import current as user
 from qobuz.cache import cache
-from qobuz.cache.cache_util import clean_all
 from qobuz.debug import getLogger
 from qobuz.gui.contextmenu import contextMenu
 from qobuz.gui.util import ask
@@ -23,7 +22,6 @@ from qobuz.gui.util import lang, executeBuiltin
 from qobuz.gui.util import notify_warn, notify_error, notify_log
 from qobuz.node import getNode, Flag
 from qobuz.node.inode import INode
-from qobuz.renderer import renderer
 from qobuz.theme import theme, color
 from qobuz.util.converter import converter
 from qobuz.gui.util import containerRefresh, containerUpdate
@@ -64,8 +62,8 @@ class Node_playlist(INode):
 
     is_folder = property(get_is_folder, set_is_folder)
 
-    def _get_node_storage_filename(self):
-        return u'userdata-{user_id}-playlist-{nid}.local'.format(
+    def _get_node_storage_name(self):
+        return u'{user_id}-playlist-{nid}'.format(
             user_id=user.get_id(), nid=self.nid)
 
     def get_label(self, _=None):
@@ -92,6 +90,9 @@ class Node_playlist(INode):
         method, args = self._fetch_args()
         return api.get(method, **args)
 
+    def get_pin_tags(self):
+        return ['playlist:%s' % self.nid]
+
     def _count(self):
         return len(self.get_property(self._items_path, default=[]))
 
@@ -224,6 +225,7 @@ class Node_playlist(INode):
         return True
 
     def gui_add_to_current(self):
+        from qobuz.renderer import renderer
         cid = self.get_current_playlist()
         qnt = int(self.get_parameter('qnt'))
         qid = self.get_parameter('qid')
@@ -285,6 +287,7 @@ class Node_playlist(INode):
         return True
 
     def gui_add_as_new(self, _=None):
+        from qobuz.renderer import renderer
         nodes = []
         qnt = int(self.get_parameter('qnt'))
         qid = self.get_parameter('qid')
@@ -450,9 +453,8 @@ class Node_playlist(INode):
             return True
         return False
 
-    def delete_cache(self, _playlist_id):
-        method, args = self._fetch_args()
-        key = cache.make_key(method, **args)
-        cache.delete(key)
-        clean_all(cache)
+    def delete_cache(self, playlist_id):
+        '''Drop every page of this playlist and user playlists listing'''
+        cache.invalidate('playlist:%s' % (playlist_id or self.nid),
+                         'playlists:%s' % user.get_id())
         self.remove_node_storage()
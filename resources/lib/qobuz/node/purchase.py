@@ -8,10 +8,12 @@
 '''
 from qobuz.api import api
 from qobuz.api.user import current as user
+from qobuz.cache import cache
 from qobuz.debug import getLogger
 from qobuz.gui.util import lang, getImage
 from qobuz.node import Flag, getNode, helper
 from qobuz.node.inode import INode
+from qobuz.util.pool import WorkerPool
 
 logger = getLogger(__name__)
 
@@ -52,6 +54,22 @@ class Node_purchase(INode):
                        offset=self.offset,
                        user_id=user.get_id())
 
+    def get_pin_tags(self):
+        return ['purchases:%s' % user.get_id()]
+
+    def pin(self):
+        '''Purchased albums are pinned (and fetched) too'''
+        if not super(Node_purchase, self).pin():
+            return False
+        data = self.fetch()
+        ids = [album['id'] for album in
+               data.get('albums', {}).get('items', []) if 'id' in album]
+        cache.pin(*['album:%s' % album_id for album_id in ids])
+        pool = WorkerPool(size=4, name='pin-purchases')
+        pool.map(lambda album_id: api.get('/album/get', album_id=album_id),
+                 ids)
+        return True
+
     def populate(self, options=None):
         if self.search_type is None:
             for search_type in ['albums']:  # 'all' , 'tracks']:
@@ -2,13 +2,20 @@
     qobuz.node.search
     ~~~~~~~~~~~~~~~~~
 
+    Cached items matching the query (see qobuz.cache.search_index) are
+    the first listing, served without waiting for the api. Remote results
+    follow through their own entry (source=remote), paginated as usual.
+    Without cached items the first listing is the remote one, cached items
+    are listed alone when the api failed.
+
     :part_of: kodi-qobuz
     :copyright: (c) 2012-2018 by Joachim Basmaison, Cyril Leclerc
     :license: GPLv3, see LICENSE for more details.
 '''
 from qobuz.api import api
+from qobuz.cache import cache
 from qobuz.gui.util import lang, getImage
-from qobuz.node import getNode, Flag
+from qobuz.node import getNode, Flag, helper
 from qobuz.node.inode import INode
 
 data_search_type = {
@@ -38,15 +45,24 @@ class Node_search(INode):
         self.nt = Flag.SEARCH
         self.content_type = 'albums'
         self.search_type = self.get_parameter('search-type', default=None)
+        self.source = self.get_parameter('source', default=None)
+        # First listing made of cached items, remote ones have an entry
+        self.local_first = False
 
     def make_url(self, **ka):
         ka['search-type'] = self.search_type
+        if self.source is not None and 'source' not in ka:
+            ka['source'] = self.source
         return super(Node_search, self).make_url(**ka)
 
     def get_label(self, default=None):
         if self.search_type is None:
             return lang(30022)
         query = self.get_parameter('query', to='unquote')
+        if query is not None and (self.local_first or
+                                  self.source == 'cache'):
+            return 'cached %s: %s' % (self.search_type,
+                                      self.get_parameter('query'))
         if query is not None:
             return 'search %s: %s [%s/%s]' % (self.search_type,
                                               self.get_parameter('query'),
@@ -72,11 +88,42 @@ class Node_search(INode):
             if query is None or query == '':
                 return None
             self.set_parameter('query', query, quote=True)
-        return api.get('/search/getResults',
+        if self.source == 'cache':
+            return self._local_page(self._search_local(query))
+        first = self.source is None and not (self.offset and
+                                             int(self.offset) > 0)
+        options = helper.get_tree_traverse_opts(options)
+        # Whole directory (depth -1) get cached items from remote anyway
+        if first and options.lvl != -1:
+            data = self._local_page(self._search_local(query))
+            if data is not None:
+                self.local_first = True
+                return data
+        data = api.get('/search/getResults',
                        query=query,
                        type=self.search_type,
                        limit=self.limit,
                        offset=self.offset)
+        if first and (data is None or self.search_type not in data):
+            return self._local_page(self._search_local(query))
+        return data
+
+    def _search_local(self, query):
+        return cache.search_local(self.search_type[:-1], query,
+                                  limit=int(self.limit))
+
+    def _local_page(self, items):
+        '''Single page of cached items, None when there is none'''
+        if not items:
+            return None
+        return {
+            self.search_type: {
+                'items': items,
+                'offset': 0,
+                'limit': self.limit,
+                'total': len(items)
+            }
+        }
 
     def _get_parameters(self):
         return {
@@ -115,4 +162,9 @@ class Node_search(INode):
                         Flag.SEARCH, parameters={'search-type': search_type}))
             return True
         self.content_type = data_search_type[self.search_type]['content_type']
+        if self.local_first:
+            self.add_child(
+                getNode(
+                    Flag.SEARCH,
+                    parameters=dict(self._get_parameters(), source='remote')))
         return getattr(self, '_populate_%s' % self.search_type)(options)
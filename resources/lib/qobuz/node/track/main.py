@@ -15,6 +15,7 @@ from .list_item import make_list_item
 from qobuz import config
 from qobuz.api import api
 from qobuz.api.user import current as user
+from qobuz.api.user import format_mimetype, get_format_mimetype
 from qobuz.constants import Mode
 from qobuz.debug import getLogger
 from qobuz.node import Flag, ErrorNoData
@@ -245,15 +246,15 @@ class Node_track(INode):
             logger.warn('Cannot get mime/type for track (restricted track?)')
             return False
         formatId = int(data['format_id'])
-        mime = ''
-        if formatId in [6, 27, 7]:
-            mime = 'audio/flac'
-        elif formatId == 5:
-            mime = 'audio/mpeg'
-        else:
+        if formatId not in format_mimetype:
             logger.warn('Unknow format %s', formatId)
-            mime = 'audio/mpeg'
-        return mime
+        return get_format_mimetype(formatId)
+
+    def get_format_id(self):
+        data = self.__getFileUrl()
+        if not data or 'format_id' not in data:
+            return None
+        return int(data['format_id'])
 
     def item_add_playing_property(self, item):
         """ We add this information only when playing item because it require
@@ -31,8 +31,23 @@ class RegistryBackend(IRegistryBackend):
             P.expanduser('~/.qobuz/qobuz.conf')
         ]
         self.conf.read(self.paths)
+        self.defaults = self._read_defaults()
+
+    @classmethod
+    def _read_defaults(cls):
+        '''Default values declared in settings.xml'''
+        from xml.etree import ElementTree
+        try:
+            tree = ElementTree.parse(cls._get_setting_path())
+        except Exception:
+            return {}
+        return dict((node.get('id'), node.get('default'))
+                    for node in tree.iter('setting')
+                    if node.get('id') and node.get('default') is not None)
 
     def get(self, key):
+        if key in self.defaults and not self.conf.has_option('main', key):
+            return self.defaults[key]
         return self.conf.get('main', key)
 
 
@@ -48,19 +63,45 @@ class XbmcRegistryBackend(IRegistryBackend):
 
 
 class Registry(object):
+    '''Read-through cache in front of our backend, each setting is read
+    at most once per process (getSetting is an IPC call with Kodi).
+    Call invalidate() when settings change (see Monitor.onSettingsChanged)
+    '''
+
     def __init__(self, application):
         self.application = application
+        self.statBackendRead = 0
+        self._raw = {}
+        self._typed = {}
         try:
             import xbmc as _
             self.backend = XbmcRegistryBackend(application)
         except ImportError:
             self.backend = RegistryBackend(application)
 
+    def _get_raw(self, key):
+        if key not in self._raw:
+            self.statBackendRead += 1
+            self._raw[key] = self.backend.get(key)
+        return self._raw[key]
+
     def get(self, key, to='raw', default=None):
-        return getattr(converter, to)(self.backend.get(key), default=default)
+        typed_key = (key, to, default)
+        if typed_key in self._typed:
+            return self._typed[typed_key]
+        value = getattr(converter, to)(self._get_raw(key), default=default)
+        self._typed[typed_key] = value
+        return value
 
     def set(self, key, value):
         self.backend.set(key, value)
+        self._raw.pop(key, None)
+        for typed_key in [k for k in self._typed.keys() if k[0] == key]:
+            self._typed.pop(typed_key, None)
+
+    def invalidate(self):
+        self._raw = {}
+        self._typed = {}
 
     def __getitem__(self, key):
-        return self.backend.get(key)
+        return self._get_raw(key)
@@ -0,0 +1,125 @@
+'''
+    qobuz.route
+    ~~~~~~~~~~~
+
+    Plugin url parsing and building
+
+    Parameters are checked against a schema compiled once at import time
+    and parsed in a single pass. Values are quoted when building and
+    unquoted when parsing so any value survive a round trip (nodes quoting
+    a parameter by hand get back exactly what they quoted).
+
+    ::example
+        from qobuz import route
+        url = route.build('plugin://plugin.audio.qobuz/', {'nt': 2, 'nid': 42})
+        route.parse(url.split('?', 1)[1])
+        {'nt': '2', 'nid': '42'}
+
+    :part_of: kodi-qobuz
+    :copyright: (c) 2012-2018 by Joachim Basmaison, Cyril Leclerc
+    :license: GPLv3, see LICENSE for more details.
+'''
+import re
+import urllib
+
+from qobuz.debug import getLogger
+
+logger = getLogger(__name__)
+
+SCHEMA = {
+    'mode': r'^\d{1,10}$',  # Mode View/Scan/BigDir ...
+    'nid': r'^\w{1,14}$',  # Node id (node.nid)
+    'nt': r'^\d{1,10}$',  # Node type (node.type)
+    'qnt': r'^\d{1,20}$',  # Node type in query
+    'qid': r'^\w{1,14}$',  # Node id in query
+    'purchased': r'^\d{1,10}$',
+    'nm': r'^[\w\d_]+$',  # Method to be called on node
+    'genre-type': r'^(\d+|null)$',  # Reco params
+    'genre-id': r'^(\d+|null)$',  # Reco params
+    'search-type': r'^(artists|tracks|albums|articles|all)$',
+    'depth': r'^(-)?\d+$',
+    'query': r'^.*$',
+    'track-id': r'^\w{1,10}$',
+    'parent-id': r'^\w{1,10}$',
+    'offset': r'^\d{1,10}$',
+    'source': r'^(all|playlists|purchases|favorites|cache|remote)$',
+}
+BOOLEANS = ['asLocalUrl']
+QUOTE_CACHE_SIZE = 1024
+
+
+def compile_schema(schema, booleans):
+    '''Return {key: callable(value)}, callable is truthy for valid value'''
+    validators = {}
+    for key, pattern in schema.items():
+        validators[key] = re.compile(pattern).match
+    for key in booleans:
+        validators[key] = frozenset(['True', 'False']).__contains__
+    return validators
+
+
+validators = compile_schema(SCHEMA, BOOLEANS)
+_is_safe = re.compile(r'^[\w.-]*$').match
+_quoted = {}
+
+
+def is_valid(key, value):
+    check = validators.get(key)
+    if check is None:
+        return False
+    return bool(check(value))
+
+
+def quote(value):
+    if isinstance(value, unicode):
+        value = value.encode('utf8')
+    value = str(value).strip()
+    if _is_safe(value):
+        return value
+    # Children urls carry their parent query, same values come again
+    quoted = _quoted.get(value)
+    if quoted is None:
+        if len(_quoted) >= QUOTE_CACHE_SIZE:
+            _quoted.clear()
+        quoted = _quoted[value] = urllib.quote_plus(value)
+    return quoted
+
+
+def parse(paramstring):
+    '''Return valid parameters from a plugin query string ("?k=v&..."),
+    invalid pairs are logged and dropped'''
+    params = {}
+    if not paramstring:
+        return params
+    for pair in paramstring.lstrip('?').split('&'):
+        key, sep, value = pair.partition('=')
+        if not sep:
+            continue
+        if '%' in value or '+' in value:
+            value = urllib.unquote_plus(value)
+        check = validators.get(key)
+        if check is None or not check(value):
+            logger.warn('--- Invalid key: %s / value: %s', key, value)
+            continue
+        params[key] = value
+    return params
+
+
+def build(base, params):
+    '''Return plugin url, None and empty values are skipped'''
+    pairs = []
+    append = pairs.append
+    for key in sorted(params):
+        value = params[key]
+        # Fast path, most values are ids, numbers and names already url safe
+        kind = value.__class__
+        if kind is int:
+            append('%s=%d' % (key, value))
+            continue
+        if value is None:
+            continue
+        if kind is not str or not _is_safe(value):
+            value = quote(value)
+        if value:
+            append(key + '=' + value)
+    return base + '?' + '&'.join(pairs)
@@ -4,20 +4,27 @@
 
     This module contains persistent storage classes.
 
+    Storage rewrite the whole file on each sync, JournaledStorage append
+    changes since last sync and rewrite the file only when the journal
+    grows too much. StorageView expose a namespace of a shared storage as
+    a dict, many small stores (one per node) live in one file.
+
     :part_of: kodi-qobuz
     :copyright: (c) 2012-2018 by Joachim Basmaison, Cyril Leclerc
     :license: GPLv3, see LICENSE for more details.
 '''
-from datetime import datetime
 import collections
 import csv
+import heapq
 import json
 import os
+import re
 import shutil
 import time
 
 from qobuz.debug import getLogger
-from qobuz.util.common import json_dump
+from qobuz.util.common import json_dump, json_dumps
+from qobuz.util.file import FileLock, RenamedTemporaryFile
 
 logger = getLogger(__name__)
 
@@ -144,7 +151,7 @@ class Storage(collections.MutableMapping, _PersistentDictMixin):
     def __len__(self):
         if self._items is None:
             return -1
-        return self._items.__len__
+        return self._items.__len__()
 
     def raw_dict(self):
         '''Returns the wrapped dict
@@ -156,38 +163,283 @@ class Storage(collections.MutableMapping, _PersistentDictMixin):
 
 class TimedStorage(Storage):
     '''A dict with the ability to persist to disk and TTL for items.
+
+    Items are stored with their timestamp (int seconds, wall clock so it
+    survive restarts) and expiry times are kept in a min heap, expired
+    items are purged in bulk on load, on sync and when an expired item is
+    accessed, O(log n) each. Overwritten keys leave a stale heap entry,
+    skipped when popped, the heap is rebuilt when they pile up.
     '''
 
     def __init__(self, filename, file_format='json', TTL=None):
         '''TTL if provided should be a datetime.timedelta. Any entries
-        older than the provided TTL will be removed upon load and upon item
-        access.
+        older than the provided TTL will be removed upon load, sync and upon
+        item access.
         '''
         self.TTL = TTL
+        self._ttl = TTL.total_seconds() if TTL else None
+        self._heap = []
+        self._now = 0
+        self.statExpired = 0
         Storage.__init__(self, filename, file_format=file_format)
 
+    def now(self):
+        '''Never go backward in a process, clock adjustments don't
+        resurrect expired items'''
+        self._now = max(self._now, int(time.time()))
+        return self._now
+
     def __setitem__(self, key, val, raw=False):
         if raw:
-            self._items[key] = val
+            val, timestamp = val
+            timestamp = int(timestamp)
         else:
-            self._items[key] = (val, time.time())
+            timestamp = self.now()
+        self._items[key] = (val, timestamp)
+        if self._ttl is not None:
+            heapq.heappush(self._heap, (timestamp + self._ttl, key))
+            if len(self._heap) > 2 * len(self._items) + 64:
+                self._rebuild_heap()
 
     def __getitem__(self, key):
         val, timestamp = self._items[key]
-        if self.TTL and (
-                datetime.utcnow() - datetime.utcfromtimestamp(timestamp) >
-                self.TTL):
-            del self._items[key]
-            return self._items[key][0]  # Will raise KeyError
+        if self._ttl is not None and timestamp + self._ttl <= self.now():
+            self.purge()
+            raise KeyError(key)
         return val
 
+    def _rebuild_heap(self):
+        self._heap = [(timestamp + self._ttl, key)
+                      for key, (_, timestamp) in self._items.items()]
+        heapq.heapify(self._heap)
+
+    def purge(self):
+        '''Remove expired items, return how many'''
+        if self._ttl is None:
+            return 0
+        now = self.now()
+        heap = self._heap
+        items = self._items
+        count = 0
+        while heap and heap[0][0] <= now:
+            expire, key = heapq.heappop(heap)
+            entry = items.get(key)
+            # Stale entry, key was set again or deleted
+            if entry is None or entry[1] + self._ttl != expire:
+                continue
+            del items[key]
+            count += 1
+        self.statExpired += count
+        return count
+
+    def sync(self):
+        self.purge()
+        return Storage.sync(self)
+
     def initial_update(self, mapping):
         '''Initially fills the underlying dictionary with keys, values and
         timestamps.
         '''
-        for key, val in mapping.items():
-            _, timestamp = val
-            if not self.TTL or (
-                    datetime.utcnow() - datetime.utcfromtimestamp(timestamp) <
-                    self.TTL):
-                self.__setitem__(key, val, raw=True)
+        items = self._items
+        if self._ttl is None:
+            for key, (val, timestamp) in mapping.items():
+                items[key] = (val, int(timestamp))
+            return
+        # Bulk purge, one pass instead of a heap pop per expired item
+        born_after = self.now() - self._ttl
+        for key, (val, timestamp) in mapping.items():
+            if timestamp > born_after:
+                items[key] = (val, int(timestamp))
+        self.statExpired += len(mapping) - len(items)
+        self._rebuild_heap()
+
+
+class JournaledStorage(Storage):
+    '''Storage persisted as an append only journal of json lines
+
+    Each line is {"k": key, "v": value} or {"k": key, "d": 1} for a
+    deletion, sync append only keys changed since last sync. Loading replay
+    the journal, a truncated last line (crash while writing) is skipped.
+    The file is rewritten with live items only when the journal hold more
+    than compact_ratio lines per item.
+
+    Writes are serialized with a lock file so processes sharing the journal
+    never append to a file being compacted, each process only see changes
+    made by others when loading.
+    '''
+    DELETED = object()
+
+    def __init__(self, filename, compact_ratio=4, compact_min=512):
+        self.compact_ratio = compact_ratio
+        self.compact_min = compact_min
+        self._pending = {}
+        self._lines = 0
+        self.statAppend = 0
+        self.statCompact = 0
+        Storage.__init__(self, filename)
+
+    def __setitem__(self, key, val):
+        self._items[key] = val
+        self._pending[key] = val
+
+    def __delitem__(self, key):
+        del self._items[key]
+        self._pending[key] = self.DELETED
+
+    def load(self, fileobj):
+        self._items.update(self._replay(fileobj))
+
+    def _replay(self, fileobj):
+        items = {}
+        self._lines = 0
+        for line in fileobj:
+            try:
+                entry = json.loads(line)
+                key = entry['k']
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warn('JournalBadLine %s %s', self.filename, e)
+                continue
+            self._lines += 1
+            if 'd' in entry:
+                items.pop(key, None)
+            else:
+                items[key] = entry.get('v')
+        return items
+
+    @classmethod
+    def _entry(cls, key, val):
+        if val is cls.DELETED:
+            return json_dumps({'k': key, 'd': 1})
+        return json_dumps({'k': key, 'v': val})
+
+    def get_lock(self):
+        return FileLock(self.filename + '.lock')
+
+    def sync(self):
+        '''Append pending changes'''
+        if not self._pending:
+            return True
+        lines = ''.join('%s\n' % self._entry(key, val)
+                        for key, val in self._pending.items())
+        try:
+            with self.get_lock():
+                with open(self.filename, 'ab') as handle:
+                    handle.write(lines)
+                self._lines += len(self._pending)
+                self.statAppend += len(self._pending)
+                self._pending = {}
+                if self._lines > max(self.compact_min,
+                                     self.compact_ratio * len(self._items)):
+                    self._compact()
+        except (IOError, OSError) as e:
+            logger.error('JournalSyncError %s %s', self.filename, e)
+            return False
+        return True
+
+    def _compact(self):
+        '''Rewrite journal with live items, caller hold the lock'''
+        # Our changes are appended already, the journal is the truth: our
+        # items may be older than lines appended by other processes
+        with open(self.filename, 'rb') as handle:
+            items = self._replay(handle)
+        with RenamedTemporaryFile(self.filename) as handle:
+            handle.write(''.join('%s\n' % self._entry(key, val)
+                                 for key, val in items.items()))
+        self._items = items
+        self._lines = len(items)
+        self.statCompact += 1
+
+
+class StorageView(collections.MutableMapping):
+    '''Dict view of keys starting with prefix in a shared storage
+
+    ::example
+        view = StorageView(shared, 'favorite-42')
+        view['image'] = images
+        view.sync()
+    '''
+
+    def __init__(self, storage, prefix):
+        self.storage = storage
+        self.prefix = '%s/' % prefix
+
+    def _key(self, key):
+        return self.prefix + key
+
+    def __setitem__(self, key, val):
+        self.storage[self._key(key)] = val
+
+    def __getitem__(self, key):
+        return self.storage[self._key(key)]
+
+    def __delitem__(self, key):
+        del self.storage[self._key(key)]
+
+    def __iter__(self):
+        size = len(self.prefix)
+        for key in list(self.storage):
+            if key.startswith(self.prefix):
+                yield key[size:]
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def clear(self):
+        for key in list(self):
+            del self[key]
+
+    def sync(self):
+        return self.storage.sync()
+
+
+def import_legacy(storage, directory, patterns, marker):
+    '''Copy items of one Storage file per namespace (patterns is a list of
+    (regex, prefix format) matched against file names in directory) into
+    storage views, then remove the files. Done once, marker is set.
+    Files are removed once the storage is synced, a crash in between only
+    import them again'''
+    if marker in storage:
+        return 0
+    count = 0
+    imported = []
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        names = []
+    for name in names:
+        for pattern, prefix in patterns:
+            match = re.match(pattern, name)
+            if match is None:
+                continue
+            path = os.path.join(directory, name)
+            try:
+                legacy = Storage(path)
+            except Exception as e:
+                logger.warn('LegacyStorageError %s %s', path, e)
+                break
+            view = StorageView(storage, prefix.format(*match.groups()))
+            for key, val in legacy.items():
+                if key not in view:
+                    view[key] = val
+            count += 1
+            imported.append(path)
+            break
+    storage[marker] = count
+    storage.sync()
+    for path in imported:
+        try:
+            os.unlink(path)
+        except OSError as e:  # Imported by another process meanwhile
+            logger.info('LegacyStorageUnlink %s %s', path, e)
+    return count
+
+
+_shared = {}
+
+
+def get_shared(filename):
+    '''Return JournaledStorage for filename, loaded once per process'''
+    storage = _shared.get(filename)
+    if storage is None:
+        storage = _shared[filename] = JournaledStorage(filename)
+    return storage
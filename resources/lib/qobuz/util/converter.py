@@ -1,24 +1,34 @@
-from HTMLParser import HTMLParser
 import math
 import urllib
 
 from qobuz.util import common
 
+_MLStripper = None
 
-class MLStripper(HTMLParser):
-    def __init__(self):
-        self.reset()
-        self.fed = []
 
-    def handle_data(self, d):
-        self.fed.append(d)
+def _get_stripper_class():
+    '''HTMLParser is only imported when we meet html'''
+    global _MLStripper
+    if _MLStripper is None:
+        from HTMLParser import HTMLParser
 
-    def get_data(self):
-        return ''.join(self.fed)
+        class MLStripper(HTMLParser):
+            def __init__(self):
+                self.reset()
+                self.fed = []
+
+            def handle_data(self, d):
+                self.fed.append(d)
+
+            def get_data(self):
+                return ''.join(self.fed)
+
+        _MLStripper = MLStripper
+    return _MLStripper
 
 
 def strip_tags(html):
-    s = MLStripper()
+    s = _get_stripper_class()()
     s.feed(html)
     return s.get_data()
 
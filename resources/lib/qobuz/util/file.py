@@ -9,12 +9,24 @@
 import os
 import re
 import tempfile
+import time
 
 from qobuz.debug import getLogger
 from qobuz.util.common import Struct
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
 logger = getLogger(__name__)
 
+MOVEFILE_REPLACE_EXISTING = 0x1
+MOVEFILE_WRITE_THROUGH = 0x8
+LOCK_POLL_INTERVAL = 0.02
+LOCK_TIMEOUT = 30
+
 
 def unlink(filename):
     logger.info('unlink %s', filename)
@@ -29,6 +41,97 @@ def unlink(filename):
     return False
 
 
+def replace(src, dst):
+    '''Atomically rename src over dst, readers see the old or the new file
+    but never a missing one (os.replace is Python 3 only)'''
+    if os.name != 'nt':
+        os.rename(src, dst)
+        return
+    import ctypes
+    if not ctypes.windll.kernel32.MoveFileExW(
+            unicode(src), unicode(dst),
+            MOVEFILE_REPLACE_EXISTING | MOVEFILE_WRITE_THROUGH):
+        raise ctypes.WinError()
+
+
+def _try_lock(handle):
+    try:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except (IOError, OSError):
+        return False
+
+
+def _unlock(handle):
+    if fcntl is not None:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+    else:
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class FileLock(object):
+    '''Advisory lock shared by processes and threads (each acquire open its
+    own handle). Lock file is never removed while held, removing it would
+    let a waiter lock a file nobody else see anymore (see try_acquire).
+
+    ::example
+        with FileLock('/tmp/foo.lock'):
+            ...
+    '''
+
+    def __init__(self, path, timeout=LOCK_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self.handle = None
+        self.locked = False
+
+    def acquire(self):
+        '''Return False when lock cannot be taken before timeout, caller
+        can proceed unlocked (a dead lock is worse than a duplicate fetch)
+        '''
+        self.handle = open(self.path, 'a+')
+        deadline = time.time() + self.timeout
+        while not _try_lock(self.handle):
+            if time.time() > deadline:
+                logger.warn('LockTimeout %s', self.path)
+                return False
+            time.sleep(LOCK_POLL_INTERVAL)
+        self.locked = True
+        return True
+
+    def try_acquire(self):
+        '''Take the lock only when nobody holds it, never wait'''
+        self.handle = open(self.path, 'a+')
+        self.locked = _try_lock(self.handle)
+        if not self.locked:
+            self.release()
+        return self.locked
+
+    def release(self):
+        if self.handle is None:
+            return
+        try:
+            if self.locked:
+                _unlock(self.handle)
+        finally:
+            self.locked = False
+            self.handle.close()
+            self.handle = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *a):
+        self.release()
+        return False
+
+
 class RenamedTemporaryFile(object):
     """A temporary file object which will be renamed to the specified
     path on exit.
@@ -63,7 +166,7 @@ class RenamedTemporaryFile(object):
         if exc_type is None:
             self.tmpfile.delete = False
             result = self.tmpfile.__exit__(exc_type, exc_val, exc_tb)
-            os.rename(self.tmpfile.name, self.final_path)
+            replace(self.tmpfile.name, self.final_path)
         else:
             self.tmpfile.delete = True
             result = self.tmpfile.__exit__(exc_type, exc_val, exc_tb)
@@ -0,0 +1,201 @@
+'''
+    qobuz.util.metrics
+    ~~~~~~~~~~~~~~~~~~
+
+    Minimal metrics (counter, gauge, histogram) rendered in Prometheus
+    text format, we don't want prometheus_client as a dependency.
+
+    Objects already counting with stat* attributes are exposed through
+    collectors evaluated at scrape time, so nothing is paid on hot paths.
+
+    ::example
+        from qobuz.util.metrics import metrics
+        requests = metrics.counter('qobuz_foo_total', 'Foo', ['kind'])
+        requests.inc(kind='bar')
+        print(metrics.render())
+
+    :part_of: kodi-qobuz
+    :copyright: (c) 2012-2018 by Joachim Basmaison, Cyril Leclerc
+    :license: GPLv3, see LICENSE for more details.
+'''
+import threading
+
+from qobuz.debug import getLogger
+
+logger = getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace(
+        '\n', r'\n')
+
+
+def format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (k, _escape(v)) for k, v in pairs)
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric(object):
+    kind = None
+
+    def __init__(self, name, description, labels=None):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels or [])
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, ka):
+        return tuple(ka.get(label, '') for label in self.labels)
+
+    def header(self):
+        return ['# HELP %s %s' % (self.name, self.description),
+                '# TYPE %s %s' % (self.name, self.kind)]
+
+    def samples(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        return [(self.name, format_labels(self.labels, key), value)
+                for key, value in items]
+
+    def render(self):
+        lines = self.header()
+        for name, labels, value in self.samples():
+            lines.append('%s%s %s' % (name, labels, format_value(value)))
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **ka):
+        key = self._key(ka)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount=1, **ka):
+        self.inc(-amount, **ka)
+
+    def set(self, value, **ka):
+        with self.lock:
+            self.values[self._key(ka)] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, description, labels=None,
+                 buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'), )
+
+    def observe(self, value, **ka):
+        key = self._key(ka)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += 1
+            entry[2] += value
+
+    def samples(self):
+        with self.lock:
+            items = sorted((k, (list(v[0]), v[1], v[2]))
+                           for k, v in self.values.items())
+        samples = []
+        for key, (counts, count, total) in items:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                samples.append(('%s_bucket' % self.name,
+                                format_labels(self.labels, key,
+                                              ('le', format_value(bound))),
+                                cumulative))
+            labels = format_labels(self.labels, key)
+            samples.append(('%s_count' % self.name, labels, count))
+            samples.append(('%s_sum' % self.name, labels, total))
+        return samples
+
+
+class Collected(Metric):
+    '''Values read from a callback at render time, callback return a list
+    of (labels dict, value)'''
+
+    def __init__(self, name, description, callback, kind='gauge',
+                 labels=None):
+        super(Collected, self).__init__(name, description, labels)
+        self.kind = kind
+        self.callback = callback
+
+    def samples(self):
+        try:
+            values = self.callback()
+        except Exception as e:
+            logger.warn('MetricCollectError %s %s', self.name, e)
+            return []
+        return [(self.name, format_labels(self.labels, self._key(ka)),
+                 value) for ka, value in values]
+
+
+class MetricRegistry(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def _register(self, metric):
+        with self.lock:
+            if metric.name not in self.metrics:
+                self.metrics[metric.name] = metric
+            return self.metrics[metric.name]
+
+    def counter(self, name, description, labels=None):
+        return self._register(Counter(name, description, labels))
+
+    def gauge(self, name, description, labels=None):
+        return self._register(Gauge(name, description, labels))
+
+    def histogram(self, name, description, labels=None,
+                  buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, description, labels, buckets))
+
+    def collect(self, name, description, callback, kind='gauge',
+                labels=None):
+        '''Register (or replace) a metric computed at render time'''
+        metric = Collected(name, description, callback, kind, labels)
+        with self.lock:
+            self.metrics[name] = metric
+        return metric
+
+    def render(self):
+        with self.lock:
+            metrics = sorted(self.metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricRegistry()
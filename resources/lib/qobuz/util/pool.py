@@ -0,0 +1,116 @@
+'''
+    qobuz.util.pool
+    ~~~~~~~~~~~~~~~
+
+    Small thread pool, python 2.7 doesn't ship concurrent.futures
+
+    Workers are spawned on demand and exit once the queue stay empty for
+    idle_timeout seconds, so a pool never keep the interpreter alive after
+    its work is done.
+
+    :part_of: kodi-qobuz
+    :copyright: (c) 2012-2018 by Joachim Basmaison, Cyril Leclerc
+    :license: GPLv3, see LICENSE for more details.
+'''
+import Queue
+import threading
+
+from qobuz.debug import getLogger
+
+logger = getLogger(__name__)
+
+
+class Job(object):
+    def __init__(self, func, a, ka):
+        self.func = func
+        self.a = a
+        self.ka = ka
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def run(self):
+        try:
+            self.result = self.func(*self.a, **self.ka)
+        except Exception as e:
+            logger.error('JobError %s: %s', self.func.__name__, e)
+            self.error = e
+        finally:
+            self.done.set()
+
+    def wait(self, timeout=None):
+        self.done.wait(timeout)
+        return self.result
+
+
+class WorkerPool(object):
+    def __init__(self, size=4, name='pool', idle_timeout=0.5, daemon=False):
+        self.size = size
+        self.name = name
+        self.idle_timeout = idle_timeout
+        self.daemon = daemon
+        self.queue = Queue.Queue()
+        self.lock = threading.Lock()
+        self.workers = []
+
+    def get_pending(self):
+        return self.queue.qsize()
+
+    pending = property(get_pending)
+
+    def get_active(self):
+        return len(self.workers)
+
+    active = property(get_active)
+
+    def submit(self, func, *a, **ka):
+        job = Job(func, a, ka)
+        self.queue.put(job)
+        self._spawn()
+        return job
+
+    def map(self, func, items):
+        '''Run func against each item, results are returned in order'''
+        jobs = [self.submit(func, item) for item in items]
+        return [job.wait() for job in jobs]
+
+    def join(self):
+        self.queue.join()
+
+    def close(self):
+        '''Ask idle workers to exit now instead of after idle_timeout'''
+        with self.lock:
+            count = len(self.workers)
+        for _ in range(count):
+            self.queue.put(None)
+
+    def _spawn(self):
+        with self.lock:
+            if len(self.workers) >= self.size:
+                return
+            worker = threading.Thread(
+                target=self._work,
+                name='%s-%s' % (self.name, len(self.workers)))
+            worker.daemon = self.daemon
+            self.workers.append(worker)
+            worker.start()
+
+    def _work(self):
+        while True:
+            try:
+                job = self.queue.get(timeout=self.idle_timeout)
+            except Queue.Empty:
+                with self.lock:
+                    if self.queue.empty():
+                        self.workers.remove(threading.current_thread())
+                        return
+                continue
+            if job is None:
+                with self.lock:
+                    self.workers.remove(threading.current_thread())
+                self.queue.task_done()
+                return
+            try:
+                job.run()
+            finally:
+                self.queue.task_done()
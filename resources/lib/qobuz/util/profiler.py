@@ -0,0 +1,106 @@
+'''
+    qobuz.util.profiler
+    ~~~~~~~~~~~~~~~~~~~
+
+    Sampling profiler, a thread snapshots every thread stacks at a fixed
+    interval. Stacks are aggregated in the folded format understood by
+    flamegraph.pl / speedscope ("frame;frame;frame count").
+
+    ::example
+        from qobuz.util.profiler import profiler
+        profiler.start(interval=0.005)
+        ...
+        open('out.folded', 'w').write(profiler.stop())
+
+    :part_of: kodi-qobuz
+    :copyright: (c) 2012-2018 by Joachim Basmaison, Cyril Leclerc
+    :license: GPLv3, see LICENSE for more details.
+'''
+import os
+import sys
+import threading
+import time
+
+from qobuz.debug import getLogger
+
+logger = getLogger(__name__)
+
+DEFAULT_INTERVAL = 0.01
+MAX_DEPTH = 128
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return '%s (%s:%s)' % (code.co_name, os.path.basename(code.co_filename),
+                           code.co_firstlineno)
+
+
+def fold(frame):
+    stack = []
+    while frame is not None and len(stack) < MAX_DEPTH:
+        stack.append(frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+
+class SamplingProfiler(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread = None
+        self.running = False
+        self.interval = DEFAULT_INTERVAL
+        self.stacks = {}
+        self.started_on = None
+        self.statSample = 0
+
+    def is_running(self):
+        return self.running
+
+    def start(self, interval=DEFAULT_INTERVAL):
+        with self.lock:
+            if self.running:
+                return False
+            self.interval = interval
+            self.stacks = {}
+            self.statSample = 0
+            self.started_on = time.time()
+            self.running = True
+            self.thread = threading.Thread(target=self._sample,
+                                           name='profiler')
+            self.thread.daemon = True
+            self.thread.start()
+        logger.info('Profiler started (interval %s)', interval)
+        return True
+
+    def stop(self):
+        '''Stop sampling and return folded stacks'''
+        with self.lock:
+            thread = self.thread
+            self.running = False
+            self.thread = None
+        if thread is not None:
+            thread.join()
+        return self.dump()
+
+    def dump(self):
+        with self.lock:
+            stacks = sorted(self.stacks.items())
+        return ''.join('%s %s\n' % (stack, count) for stack, count in stacks)
+
+    def _sample(self):
+        own = threading.current_thread().ident
+        names = {}
+        while self.running:
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = '%s;%s' % (names.get(ident, ident), fold(frame))
+                with self.lock:
+                    self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            self.statSample += 1
+            time.sleep(self.interval)
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,168 @@
+'''
+    qobuz.util.trace
+    ~~~~~~~~~~~~~~~~
+
+    Lightweight tracing of hot paths (api, cache, node population, list
+    item creation, Kodi calls)
+
+    When disabled span() return a shared no-op context manager and traced
+    functions only pay one attribute lookup. When enabled (debug flag) each
+    span is recorded, a summary is logged at the end of the invocation and
+    a Chrome trace (chrome://tracing, Perfetto) can be written.
+
+    ::example
+        from qobuz.util.trace import tracer
+
+        @tracer.traced('node.populating')
+        def populating(self, options=None):
+            with tracer.span('node.fetch'):
+                ...
+
+    :part_of: kodi-qobuz
+    :copyright: (c) 2012-2018 by Joachim Basmaison, Cyril Leclerc
+    :license: GPLv3, see LICENSE for more details.
+'''
+from functools import wraps
+import json
+import os
+import threading
+import time
+
+from qobuz.debug import getLogger
+
+logger = getLogger(__name__)
+
+MAX_EVENTS = 100000
+
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+    __slots__ = ('tracer', 'name', 'started_on')
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+        self.started_on = None
+
+    def __enter__(self):
+        self.started_on = time.time()
+        return self
+
+    def __exit__(self, *a):
+        self.tracer.record(self.name, self.started_on,
+                           time.time() - self.started_on)
+        return False
+
+
+class Tracer(object):
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.events = []
+        self.started_on = None
+        self.statDropped = 0
+
+    def enable(self):
+        with self.lock:
+            self.enabled = True
+            self.events = []
+            self.statDropped = 0
+            self.started_on = time.time()
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, name):
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, name)
+
+    def traced(self, name=None):
+        '''Decorator, span named after the function by default'''
+        that = self
+
+        def decorator(func):
+            span_name = name or func.__name__
+
+            @wraps(func)
+            def wrapped(*a, **ka):
+                if not that.enabled:
+                    return func(*a, **ka)
+                with _Span(that, span_name):
+                    return func(*a, **ka)
+
+            return wrapped
+
+        return decorator
+
+    def record(self, name, started_on, duration):
+        with self.lock:
+            if len(self.events) >= MAX_EVENTS:
+                self.statDropped += 1
+                return
+            self.events.append((name, started_on, duration,
+                                threading.current_thread().ident))
+
+    def summary(self):
+        '''Return [(name, count, total, max)] sorted by total time'''
+        stats = {}
+        with self.lock:
+            events = list(self.events)
+        for name, _started_on, duration, _tid in events:
+            stat = stats.setdefault(name, [0, 0.0, 0.0])
+            stat[0] += 1
+            stat[1] += duration
+            stat[2] = max(stat[2], duration)
+        return sorted(((name, s[0], s[1], s[2]) for name, s in stats.items()),
+                      key=lambda s: s[2], reverse=True)
+
+    def format_summary(self, label=''):
+        elapsed = time.time() - (self.started_on or time.time())
+        lines = ['Trace %s (%.1f ms, %s spans, %s dropped)' % (
+            label, elapsed * 1000, len(self.events), self.statDropped)]
+        lines.append('%-28s %7s %10s %10s %10s' % (
+            'span', 'count', 'total ms', 'mean ms', 'max ms'))
+        for name, count, total, longest in self.summary():
+            lines.append('%-28s %7d %10.2f %10.3f %10.2f' % (
+                name, count, total * 1000, total * 1000 / count,
+                longest * 1000))
+        return '\n'.join(lines)
+
+    def chrome_trace(self):
+        pid = os.getpid()
+        with self.lock:
+            events = list(self.events)
+        return {
+            'traceEvents': [{
+                'name': name,
+                'cat': name.split('.')[0],
+                'ph': 'X',
+                'ts': int(started_on * 1000000),
+                'dur': int(duration * 1000000),
+                'pid': pid,
+                'tid': tid
+            } for name, started_on, duration, tid in events],
+            'displayTimeUnit': 'ms'
+        }
+
+    def dump(self, path):
+        try:
+            with open(path, 'w') as handle:
+                json.dump(self.chrome_trace(), handle)
+            return True
+        except Exception as e:
+            logger.warn('TraceDumpError %s %s', path, e)
+            return False
+
+
+tracer = Tracer()
@@ -0,0 +1,71 @@
+import threading
+import unittest
+import fixtures  # noqa
+
+from qobuz.api.raw import RawApi
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self.reason = 'Reason %s' % status_code
+        self.payload = payload
+        self.content = 'x' * 64
+
+    def json(self):
+        return self.payload
+
+
+class FakeSession(object):
+    '''Both requests are in flight before any of them return'''
+
+    def __init__(self, concurrency=2):
+        self.lock = threading.Lock()
+        self.waiting = concurrency
+        self.all_in = threading.Event()
+
+    def post(self, url, data=None, headers=None, timeout=None):
+        with self.lock:
+            self.waiting -= 1
+            if self.waiting == 0:
+                self.all_in.set()
+        self.all_in.wait(5)
+        if data['album_id'] == 'missing':
+            return FakeResponse(404, None)
+        return FakeResponse(200, {'id': data['album_id']})
+
+
+class TestRawApi(unittest.TestCase):
+    def test_concurrent_calls_keep_their_state(self):
+        api = RawApi()
+        api.session = FakeSession()
+        results = {}
+
+        def call(album_id):
+            data = api.album_get(album_id=album_id)
+            results[album_id] = (data, api.status_code, api.error,
+                                 api.last_response)
+
+        threads = [threading.Thread(target=call, args=(album_id, ))
+                   for album_id in ['42', 'missing']]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        data, status_code, error, response = results['42']
+        self.assertEqual(data, {'id': '42'})
+        self.assertEqual(status_code, 200)
+        self.assertIsNone(error)
+        self.assertTrue(response.ok)
+        self.assertEqual(response.endpoint, '/album/get')
+        data, status_code, error, response = results['missing']
+        self.assertIsNone(data)
+        self.assertEqual(status_code, 404)
+        self.assertIn('404', error)
+        self.assertFalse(response.ok)
+        self.assertIsNone(api.last_response)
+        self.assertEqual(api.statTotalRequest, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
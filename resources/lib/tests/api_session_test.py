@@ -0,0 +1,69 @@
+import shutil
+import tempfile
+import unittest
+import fixtures  # noqa
+
+from qobuz.api.session import SessionManager
+from qobuz.api.user import User
+
+
+class FakeApi(object):
+    def __init__(self):
+        self.calls = 0
+        self.status_code = 200
+        self.error = None
+
+    def get(self, *a, **ka):
+        self.calls += 1
+        return {
+            'user': {'id': 42, 'country_code': 'FR', 'credential': {
+                'parameters': {'hires_streaming': True}}},
+            'user_auth_token': 'token-%s' % self.calls
+        }
+
+
+class TestSessionManager(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filename = '%s/session.local' % self.path
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_restore_without_network(self):
+        api = FakeApi()
+        SessionManager(self.filename).login(api, User(), 'foo', 'bar')
+        self.assertEqual(api.calls, 1)
+        user = User()
+        session = SessionManager(self.filename)
+        self.assertTrue(session.restore(api, user, 'foo', 'bar'))
+        self.assertEqual(api.calls, 1)
+        self.assertTrue(user.logged)
+        self.assertEqual(user.get_id(), 42)
+        self.assertEqual(user.get_token(), 'token-1')
+        # Persisted with the session, stream_format doesn't login
+        self.assertEqual(user.get_property('user/country_code'), 'FR')
+        self.assertTrue(user.get_property(
+            'user/credential/parameters/hires_streaming'))
+        self.assertEqual(api.calls, 1)
+
+    def test_expired_or_other_credentials(self):
+        api = FakeApi()
+        SessionManager(self.filename).login(api, User(), 'foo', 'bar')
+        session = SessionManager(self.filename)
+        self.assertFalse(session.restore(api, User(), 'foo', 'baz'))
+        session.ttl = -1
+        self.assertFalse(session.restore(api, User(), 'foo', 'bar'))
+
+    def test_reauthenticate(self):
+        api = FakeApi()
+        session = SessionManager(self.filename)
+        user = User()
+        session.login(api, user, 'foo', 'bar')
+        self.assertTrue(session.reauthenticate(api, user))
+        self.assertEqual(session.load('foo', 'bar')['token'], 'token-2')
+        self.assertEqual(user.get_token(), 'token-2')
+
+
+if __name__ == '__main__':
+    unittest.main()
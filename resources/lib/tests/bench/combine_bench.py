@@ -0,0 +1,104 @@
+'''
+    Benchmark image._combine_pil (wall time and peak RSS)
+
+    Usage: python tests/bench/combine_bench.py [rounds]
+
+    Each mode run in its own process so peak RSS is not shared:
+        legacy: full decode + ANTIALIAS resize (previous pipeline)
+        draft:  draft/reduce decoding, thumbnail cache cold
+        warm:   draft/reduce decoding, thumbnail variants already cached
+'''
+from os import path as P
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+qobuzPath = P.abspath(P.join(P.dirname(__file__), P.pardir, P.pardir))
+sys.path.append(qobuzPath)
+
+COVER_SIZE = (1200, 1200)
+COVERS = 4
+
+
+class _Registry(object):
+    def get(self, key, to='raw', default=None):
+        return {'image_default_size': 'large',
+                'image_create_mosaic': True}.get(key, default)
+
+
+class _Struct(object):
+    pass
+
+
+def make_covers(path):
+    from PIL import Image
+    covers = []
+    for i in range(COVERS):
+        noise = Image.effect_noise(COVER_SIZE, 40 + i * 10)
+        cover = Image.merge('RGB', (noise, noise.rotate(90), noise))
+        cover_path = P.join(path, 'cover-%s.jpg' % i)
+        cover.save(cover_path, 'JPEG', quality=92)
+        covers.append(cover_path)
+    return covers
+
+
+def legacy_resize(img_path, thumb_size_w):
+    from PIL import Image
+    part = Image.open(img_path)
+    new_height = thumb_size_w * part.height / part.width
+    return part.resize((thumb_size_w, new_height), Image.ANTIALIAS)
+
+
+def run(mode, path, rounds):
+    from qobuz import config
+    config.app = _Struct()
+    config.app.registry = _Registry()
+    config.path = _Struct()
+    config.path.combined_covers = path
+    from qobuz.cache import cover_cache
+    cover_cache.base_path = path
+    from qobuz import image
+    if mode == 'legacy':
+        image._resize_image = legacy_resize
+    covers = sorted(P.join(path, name) for name in os.listdir(path)
+                    if name.startswith('cover-'))
+    if mode == 'warm':
+        image._combine_pil('warmup', images=covers)
+        image._mosaic_queue.join()
+    elapsed = 0
+    for i in range(rounds):
+        if mode == 'draft':
+            for name in os.listdir(path):
+                if name.startswith('thumb-'):
+                    os.unlink(P.join(path, name))
+        started = time.time()
+        image._combine_pil('%s-%s' % (mode, i), images=covers)
+        image._mosaic_queue.join()
+        elapsed += time.time() - started
+    elapsed = elapsed / rounds
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print('%-6s %8.1f ms/mosaic  peak RSS %6.1f MB' % (
+        mode, elapsed * 1000, peak / 1024.0))
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    for mode in ['legacy', 'draft', 'warm']:
+        path = tempfile.mkdtemp()
+        try:
+            make_covers(path)
+            subprocess.check_call([sys.executable, __file__, '--run', mode,
+                                   path, str(rounds)])
+        finally:
+            shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--run':
+        run(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+    else:
+        main()
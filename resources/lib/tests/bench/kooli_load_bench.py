@@ -0,0 +1,140 @@
+'''
+    Load test for the kooli HTTP service, simulate a Kodi library scan
+
+    Usage:
+        python tests/bench/kooli_load_bench.py [--url URL] [--clients N]
+            [--albums N] [--tracks N] [album_id ...]
+
+    Without --url a local server is started with each backend and a stub
+    application (fixed latency per route), so backends can be compared
+    without Qobuz credentials. With --url a running kooli service is hit,
+    album ids must then be given on the command line.
+
+    For every album a scanner does what Kodi does: HEAD/GET the directory,
+    album.nfo, artist.nfo, folder.jpg then HEAD each track.
+'''
+from os import path as P
+import argparse
+import re
+import sys
+import threading
+import time
+
+qobuzPath = P.abspath(P.join(P.dirname(__file__), P.pardir, P.pardir))
+sys.path.append(qobuzPath)
+sys.path.append(P.join(qobuzPath, 'qobuz', 'extension', 'kooli'))
+
+import requests  # noqa
+
+STUB_LATENCY = 0.005
+
+
+def stub_application(tracks):
+    def app(environ, start_response):
+        path = environ['PATH_INFO']
+        time.sleep(STUB_LATENCY)
+        if path.endswith('/'):
+            body = ''.join('<a href="%s.mpc">t</a>' % i
+                           for i in range(tracks))
+        elif path.endswith('.mpc'):
+            body = ''
+        else:
+            body = 'x' * 2048
+        start_response('200 OK', [('Content-Type', 'text/html'),
+                                  ('Content-Length', str(len(body)))])
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return [b'']
+        return [body.encode('ascii')]
+
+    return app
+
+
+def scan_album(session, base_url, album_id, latencies):
+    def hit(method, path):
+        started = time.time()
+        response = session.request(method, '%s/qobuz/%s' % (base_url, path))
+        latencies.append(time.time() - started)
+        return response
+
+    hit('HEAD', '%s/' % album_id)
+    listing = hit('GET', '%s/' % album_id).text
+    for name in ['album.nfo', 'artist.nfo']:
+        hit('GET', '%s/%s' % (album_id, name))
+    hit('HEAD', '%s/folder.jpg' % album_id)
+    for track in sorted(set(re.findall(r'href="([^"/]+\.mpc)"', listing))):
+        hit('HEAD', '%s/%s' % (album_id, track))
+
+
+def run_scan(base_url, albums, clients):
+    latencies = []
+    errors = []
+    todo = list(albums)
+    lock = threading.Lock()
+
+    def scanner():
+        session = requests.Session()
+        while True:
+            with lock:
+                if not todo:
+                    return
+                album_id = todo.pop()
+            try:
+                scan_album(session, base_url, album_id, latencies)
+            except Exception as e:
+                errors.append(e)
+
+    started = time.time()
+    threads = [threading.Thread(target=scanner) for _ in range(clients)]
+    _ = [t.start() for t in threads]
+    _ = [t.join() for t in threads]
+    return time.time() - started, sorted(latencies), errors
+
+
+def report(name, elapsed, latencies, errors, metrics=None):
+    count = len(latencies)
+
+    def pct(p):
+        return latencies[min(int(count * p), count - 1)] * 1000 if count \
+            else 0
+
+    print('%-9s %6d req %7.1f req/s  p50 %6.1f ms  p99 %6.1f ms  '
+          'errors %d' % (name, count, count / elapsed, pct(0.5), pct(0.99),
+                         len(errors)))
+    if metrics:
+        print('          %s' % metrics)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default=None)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--albums', type=int, default=200)
+    parser.add_argument('--tracks', type=int, default=12)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('album_ids', nargs='*')
+    args = parser.parse_args()
+    if args.url is not None:
+        elapsed, latencies, errors = run_scan(
+            args.url.rstrip('/'), args.album_ids, args.clients)
+        report('remote', elapsed, latencies, errors)
+        return
+    from kooli.server import make_server
+    albums = ['album%s' % i for i in range(args.albums)]
+    for backend in ['werkzeug', 'pool']:
+        server = make_server('127.0.0.1', 0, stub_application(args.tracks),
+                             backend=backend, workers=args.workers)
+        port = getattr(server, 'server', server).server_address[1]
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            elapsed, latencies, errors = run_scan(
+                'http://127.0.0.1:%s' % port, albums, args.clients)
+            metrics = server.get_metrics()
+        finally:
+            server.shutdown()
+            thread.join()
+        report(backend, elapsed, latencies, errors, metrics)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+'''
+    Benchmark plugin url build + parse (qobuz.route) for many nodes
+
+    Usage: python tests/bench/route_bench.py [nodes]
+
+        legacy: hand made url concatenation and dog.kv_is_ok per pair
+                (previous make_url / get_checked_parameters)
+        route:  qobuz.route.build / qobuz.route.parse
+
+    Every url is parsed back and compared to the parameters used to build
+    it, legacy fails the round trip as soon as a value need quoting.
+'''
+from os import path as P
+import re
+import sys
+import time
+import urllib
+
+qobuzPath = P.abspath(P.join(P.dirname(__file__), P.pardir, P.pardir))
+sys.path.append(qobuzPath)
+
+BASE = 'plugin://plugin.audio.qobuz/'
+
+
+def make_params(count):
+    params = []
+    for i in range(count):
+        param = {
+            'mode': 1,
+            'nt': 1 << (2 + i % 20),
+            'nid': str(100000 + i),
+            'offset': (i % 5) * 50,
+        }
+        if i % 3 == 0:
+            param['search-type'] = 'albums'
+        # Children of a search carry the same query
+        if i % 7 == 0:
+            param['query'] = urllib.quote_plus('Artist %s & friends' %
+                                               (i / 100))
+        elif i % 11 == 0:
+            param['query'] = 'AC/DC & co %s' % (i / 100)
+        params.append(param)
+    return params
+
+
+def expected(param):
+    return dict((k, str(v)) for k, v in param.items()
+                if v is not None and str(v).strip() != '')
+
+
+def legacy_build(ka):
+    url = BASE + '?'
+    for key in sorted(ka):
+        value = ka[key]
+        if value is None:
+            continue
+        value = str(value).strip()
+        if value == '':
+            continue
+        url += key + '=' + value + '&'
+    return url[:-1]
+
+
+from qobuz import route  # noqa: E402
+
+_legacy_keys = dict((k, re.compile(v)) for k, v in route.SCHEMA.items())
+
+
+def legacy_parse(paramstring):
+    rparam = {}
+    for pair in paramstring.replace('?', '').split('&'):
+        split = pair.split('=')
+        if len(split) == 2:
+            if split[0] in _legacy_keys and \
+                    _legacy_keys[split[0]].match(split[1]) is not None:
+                rparam[split[0]] = split[1]
+    return rparam
+
+
+def route_build(ka):
+    return route.build(BASE, ka)
+
+
+def route_parse(paramstring):
+    return route.parse(paramstring)
+
+
+def run(label, build, parse, params, rounds=5):
+    '''Best of rounds'''
+    params = [dict(param, offset=param['offset'] or None)
+              for param in params]
+    timing = None
+    for _ in range(rounds):
+        started = time.time()
+        urls = [build(param) for param in params]
+        built = time.time()
+        parsed = [parse(url.split('?', 1)[1]) for url in urls]
+        done = time.time()
+        if timing is None or done - started < timing[2] - timing[0]:
+            timing = (started, built, done)
+    started, built, done = timing
+    failed = sum(1 for param, result in zip(params, parsed)
+                 if result != expected(param))
+    print('%-8s build %7.1f ms  parse %7.1f ms  total %7.1f ms  '
+          'round trip failures %s' % (
+              label, (built - started) * 1000, (done - built) * 1000,
+              (done - started) * 1000, failed))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    params = make_params(count)
+    print('%s nodes' % count)
+    run('legacy', legacy_build, legacy_parse, params)
+    run('route', route_build, route_parse, params)
+
+
+if __name__ == '__main__':
+    main()
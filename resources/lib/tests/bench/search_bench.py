@@ -0,0 +1,118 @@
+'''
+    Benchmark SearchIndex query latency with many indexed tracks
+
+    Usage: python tests/bench/search_bench.py [tracks]
+
+    Tracks are made of random words (a few accented) and fed 500 per
+    payload like api responses, then the index is loaded again from its
+    snapshot as a new plugin run would. Queries are one or two whole words
+    and prefixes of the last word, latency is given for the first 50
+    results.
+'''
+from os import path as P
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+qobuzPath = P.abspath(P.join(P.dirname(__file__), P.pardir, P.pardir))
+sys.path.append(qobuzPath)
+
+from qobuz.cache.search_index import SearchIndex  # noqa: E402
+
+PAYLOAD_SIZE = 500
+QUERIES = 1000
+SYLLABLES = ['ba', 'ko', 'ri', 'ne', 'tu', 'sa', 'mi', 'lo', 'de', 'vy',
+             u'\xe9', u'\xf6']
+
+
+def make_words(count, rand):
+    words = set()
+    while len(words) < count:
+        words.add(u''.join(rand.choice(SYLLABLES)
+                           for _ in range(rand.randint(2, 5))))
+    return sorted(words)
+
+
+def make_payloads(count, rand):
+    words = make_words(20000, rand)
+    artists = [u' '.join(rand.sample(words, 2)) for _ in range(5000)]
+    labels = [rand.choice(words) for _ in range(300)]
+    items = []
+    for i in range(count):
+        items.append({
+            'id': i,
+            'title': u' '.join(rand.sample(words, rand.randint(1, 4))),
+            'performer': {'name': rand.choice(artists)},
+            'composer': {'name': rand.choice(artists)},
+            'album': {
+                'title': u' '.join(rand.sample(words, 2)),
+                'label': {'name': rand.choice(labels)},
+            },
+        })
+        if len(items) == PAYLOAD_SIZE:
+            yield {'tracks': {'items': items}}
+            items = []
+    if items:
+        yield {'tracks': {'items': items}}
+
+
+def percentile(values, ratio):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * ratio))]
+
+
+def measure(index, label, queries):
+    timings = []
+    results = 0
+    for query in queries:
+        started = time.time()
+        results += len(index.search(query, kind='track', limit=50))
+        timings.append((time.time() - started) * 1000)
+    print('%-14s p50 %6.3f ms  p99 %6.3f ms  max %6.3f ms  '
+          'results/query %.1f' % (label, percentile(timings, 0.5),
+                                  percentile(timings, 0.99), max(timings),
+                                  float(results) / len(queries)))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rand = random.Random(42)
+    root = tempfile.mkdtemp()
+    try:
+        index = SearchIndex(root)
+        index.load()
+        started = time.time()
+        for payload in make_payloads(count, rand):
+            index.add_payload('/playlist/get', payload)
+        added = time.time()
+        index.compact()
+        compacted = time.time()
+        index = SearchIndex(root)
+        index.load()
+        loaded = time.time()
+        print('%s tracks, %s tokens, snapshot %.1f MB' % (
+            count, len(index.tokens),
+            P.getsize(P.join(root, 'index.snapshot')) / 1048576.0))
+        print('add %.0f ms  compact %.0f ms  load %.0f ms' % (
+            (added - started) * 1000, (compacted - added) * 1000,
+            (loaded - compacted) * 1000))
+        titles = [index.titles[rand.randrange(len(index.titles))]
+                  for _ in range(QUERIES)]
+        words = [title.split()[0] for title in titles]
+        measure(index, 'word', words)
+        measure(index, 'two words', [
+            u'%s %s' % (words[i], rand.choice(titles[i].split()))
+            for i in range(QUERIES)])
+        measure(index, 'prefix 2', [word[:2] for word in words])
+        measure(index, 'prefix 4', [word[:4] for word in words])
+        measure(index, 'word prefix', [
+            u'%s %s' % (words[i], titles[i].split()[-1][:3])
+            for i in range(QUERIES)])
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
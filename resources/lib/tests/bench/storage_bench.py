@@ -0,0 +1,115 @@
+'''
+    Benchmark TimedStorage with many entries, half of them expired on load
+    and a quarter expiring while the storage is open
+
+    Usage: python tests/bench/storage_bench.py [entries]
+
+        legacy: datetime comparison per item on load and access, expired
+                items stay until touched (previous TimedStorage)
+        heap:   qobuz.storage.TimedStorage, expiry heap purged in bulk
+
+    Both load the same file, wait for the quarter to expire, read the keys
+    still fresh then sync, sync time include the json dump of what is left
+    (legacy keep expired items nobody touched).
+'''
+from datetime import datetime, timedelta
+from os import path as P
+import json
+import shutil
+import sys
+import tempfile
+import time
+
+qobuzPath = P.abspath(P.join(P.dirname(__file__), P.pardir, P.pardir))
+sys.path.append(qobuzPath)
+
+from qobuz.storage import Storage, TimedStorage  # noqa: E402
+
+TTL = timedelta(hours=1)
+EXPIRE_IN = 5
+
+
+class LegacyTimedStorage(Storage):
+    def __init__(self, filename, file_format='json', TTL=None):
+        self.TTL = TTL
+        Storage.__init__(self, filename, file_format=file_format)
+
+    def __setitem__(self, key, val, raw=False):
+        if raw:
+            self._items[key] = val
+        else:
+            self._items[key] = (val, time.time())
+
+    def __getitem__(self, key):
+        val, timestamp = self._items[key]
+        if self.TTL and (
+                datetime.utcnow() - datetime.utcfromtimestamp(timestamp) >
+                self.TTL):
+            del self._items[key]
+            return self._items[key][0]  # Will raise KeyError
+        return val
+
+    def initial_update(self, mapping):
+        for key, val in mapping.items():
+            _, timestamp = val
+            if not self.TTL or (
+                    datetime.utcnow() - datetime.utcfromtimestamp(timestamp) <
+                    self.TTL):
+                self.__setitem__(key, val, raw=True)
+
+
+def make_file(path, count):
+    now = time.time()
+    data = {}
+    for i in range(count):
+        if i % 2:
+            age = 7200
+        elif i % 4:
+            age = TTL.total_seconds() - EXPIRE_IN
+        else:
+            age = 60
+        data['track-%s' % i] = [{'size': i, 'type': 'audio/flac'},
+                                int(now - age)]
+    with open(path, 'w') as handle:
+        json.dump(data, handle)
+
+
+def run(label, cls, path, count):
+    # Made again, timestamps age while the previous run wait
+    make_file(path, count)
+    started = time.time()
+    storage = cls(path, TTL=TTL)
+    loaded = time.time()
+    time.sleep(EXPIRE_IN + 1)
+    waited = time.time()
+    hits = 0
+    for i in range(0, count, 4):
+        try:
+            storage['track-%s' % i]
+            hits += 1
+        except KeyError:
+            pass
+    read = time.time()
+    storage.filename = path + '.' + label
+    storage.sync()
+    done = time.time()
+    print('%-7s load %7.1f ms  read %7.1f ms  sync %7.1f ms  '
+          'hits %s  kept %s' % (label, (loaded - started) * 1000,
+                                (read - waited) * 1000,
+                                (done - read) * 1000, hits, len(storage)))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    root = tempfile.mkdtemp()
+    try:
+        path = P.join(root, 'timed.local')
+        print('%s entries, half expired, quarter expiring' % count)
+        run('legacy', LegacyTimedStorage, path, count)
+        run('heap', TimedStorage, path, count)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+import fixtures  # noqa
+
+from qobuz.cache.entity_cache import EntityStore
+from qobuz.cache.qobuz_cache import QobuzCache
+
+
+def make_track(nid, **ka):
+    track = {'id': nid, 'title': 'Track %s' % nid, 'duration': 180}
+    track.update(ka)
+    return track
+
+
+class TestEntityStore(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_round_trip_keeps_list_fields(self):
+        entities = EntityStore(self.path)
+        playlist = {
+            'id': 7,
+            'tracks': {
+                'offset': 0,
+                'items': [
+                    make_track(1, playlist_track_id=10, position=1),
+                    make_track(2, playlist_track_id=11, position=2),
+                    make_track(1, playlist_track_id=12, position=3)
+                ]
+            }
+        }
+        favorites = {'tracks': {'items': [make_track(2)]}, 'albums': None}
+        skeletons = [entities.normalize(playlist),
+                     entities.normalize(favorites)]
+        self.assertEqual(entities.statWrite, 2)
+        self.assertEqual(len(os.listdir(self.path)), 2)
+        self.assertEqual(skeletons[0]['tracks']['items'][2],
+                         {'$ref': 'track/1', 'playlist_track_id': 12,
+                          'position': 3})
+        entities = EntityStore(self.path)
+        self.assertEqual(entities.denormalize(skeletons[0]), playlist)
+        self.assertEqual(entities.denormalize(skeletons[1]), favorites)
+
+    def test_memory_store_bounded(self):
+        entities = EntityStore(self.path, store_size=2)
+        entities.normalize({'tracks': {'items': [
+            make_track(1), make_track(2), make_track(3)]}})
+        self.assertEqual(list(entities.store), [('track', '2'),
+                                                ('track', '3')])
+        self.assertEqual(entities.get('track', 1)['title'], 'Track 1')
+        self.assertEqual(list(entities.store), [('track', '3'),
+                                                ('track', '1')])
+
+    def test_cache_miss_when_entity_missing(self):
+        cache = QobuzCache()
+        cache.base_path = self.path
+        cache.get_ttl = lambda *a, **ka: 3600
+        cache.entities = EntityStore(os.path.join(self.path, 'entities'))
+        os.mkdir(cache.entities.base_path)
+        response = {'id': 3, 'tracks': {'items': [make_track(1)]}}
+        key = cache.make_key('/album/get', album_id=3)
+        self.assertEqual(cache.fill(key, response, '/album/get',
+                                    album_id=3), response)
+        self.assertEqual(cache.load_fresh(key, '/album/get', album_id=3),
+                         response)
+        entities_path = cache.entities.base_path
+        for name in os.listdir(entities_path):
+            os.unlink(os.path.join(entities_path, name))
+        cache.entities = EntityStore(entities_path)
+        self.assertIsNone(cache.load_fresh(key, '/album/get', album_id=3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import fixtures  # noqa
+
+from qobuz.cache.file_cache import FileCache
+
+PROCESSES = 4
+KEYS = 16
+
+
+class Fetcher(object):
+    def __init__(self, path, log_path):
+        self.log_path = log_path
+        self.cache = FileCache()
+        self.cache.base_path = path
+        self.cache.shared = True
+        self.get = self.cache.cached(Fetcher.fetch).__get__(self)
+
+    def fetch(self, key):
+        # Slow remote, widen the window where processes race on a key
+        time.sleep(0.01)
+        with open(self.log_path, 'a') as handle:
+            handle.write('%s\n' % key)
+        return {'key': key}
+
+
+def hammer(path, log_path, seed):
+    fetcher = Fetcher(path, log_path)
+    keys = ['/key/%s' % ((i * 7 + seed) % KEYS) for i in range(KEYS * 3)]
+    for key in keys:
+        if fetcher.get(key) != {'key': key}:
+            os._exit(1)
+    os._exit(0)
+
+
+def rewrite(path, rounds):
+    cache = FileCache()
+    cache.base_path = path
+    key = cache.make_key('/hot')
+    for i in range(rounds):
+        cache.fill(key, {'round': i}, '/hot')
+    os._exit(0)
+
+
+def read(path, rounds):
+    cache = FileCache()
+    cache.base_path = path
+    key = cache.make_key('/hot')
+    for _ in range(rounds):
+        if cache.load_fresh(key, '/hot') is None:
+            os._exit(1)
+    os._exit(0)
+
+
+class TestSharedFileCache(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.path, 'fetches.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def run_processes(self, targets):
+        processes = [multiprocessing.Process(target=target, args=args)
+                     for target, args in targets]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(60)
+        return [process.exitcode for process in processes]
+
+    def test_one_fetch_per_key(self):
+        codes = self.run_processes(
+            [(hammer, (self.path, self.log_path, seed))
+             for seed in range(PROCESSES)])
+        self.assertEqual(codes, [0] * PROCESSES)
+        with open(self.log_path) as handle:
+            fetches = handle.read().split()
+        self.assertEqual(sorted(fetches),
+                         sorted('/key/%s' % i for i in range(KEYS)))
+
+    def test_no_miss_while_rewriting(self):
+        cache = FileCache()
+        cache.base_path = self.path
+        cache.fill(cache.make_key('/hot'), {'round': -1}, '/hot')
+        codes = self.run_processes([(rewrite, (self.path, 200))] +
+                                   [(read, (self.path, 500))] * 3)
+        self.assertEqual(codes, [0] * 4)
+
+    def test_nested_fill_same_key(self):
+        fetcher = Fetcher(self.path, self.log_path)
+        calls = []
+
+        def login(that, key):
+            calls.append(key)
+            if len(calls) == 1:
+                # 401 while logging in, login again (reauthenticate)
+                fetcher.cache.forget(key)
+                return fetcher.get(key)
+            return {'key': key}
+
+        fetcher.get = fetcher.cache.cached(login).__get__(fetcher)
+        started = time.time()
+        self.assertEqual(fetcher.get('/user/login'), {'key': '/user/login'})
+        self.assertLess(time.time() - started, 1)
+
+    def test_keys_dont_wait_each_other(self):
+        fetcher = Fetcher(self.path, self.log_path)
+        keys = [fetcher.cache.make_key('/key/%s' % i) for i in range(512)]
+        held = fetcher.cache.lock(keys[0])
+        held.acquire()
+        try:
+            # Many keys share the first two characters of the held one
+            for key in keys[1:]:
+                lock = fetcher.cache.lock(key)
+                lock.timeout = 0
+                self.assertTrue(lock.acquire())
+                lock.release()
+        finally:
+            held.release()
+        from qobuz.cache import cache_util
+        fetcher.get('/key/0')
+        self.assertEqual(cache_util.clean_old(fetcher.cache), True)
+        self.assertEqual(len(os.listdir(os.path.join(self.path, 'locks'))),
+                         1)
+
+
+    def test_clean_keeps_lock_of_key_being_filled(self):
+        from qobuz.cache import cache_util
+        fetcher = Fetcher(self.path, self.log_path)
+        key = fetcher.cache.make_key('/key/0')
+        lock = fetcher.cache.lock(key)
+        lock.acquire()  # Filling, no entry yet
+        try:
+            cache_util.clean_old(fetcher.cache)
+            self.assertTrue(os.path.exists(lock.path))
+        finally:
+            lock.release()
+        cache_util.clean_old(fetcher.cache)
+        self.assertFalse(os.path.exists(lock.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
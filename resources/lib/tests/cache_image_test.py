@@ -0,0 +1,123 @@
+import os
+import shutil
+import tempfile
+import unittest
+import fixtures  # noqa
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, content=b'', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def iter_content(self, _size):
+        yield self.content
+
+
+class FakeSession(object):
+    def __init__(self):
+        self.requests = []
+
+    def get(self, url, headers=None, **ka):
+        self.requests.append((url, headers))
+        if headers and headers.get('If-None-Match') == url:
+            return FakeResponse(304)
+        return FakeResponse(200, b'x' * 10, {'etag': url})
+
+
+class TestImageCache(unittest.TestCase):
+    def setUp(self):
+        from qobuz.cache.image_cache import ImageCache
+        self.path = tempfile.mkdtemp()
+        self.cache = ImageCache(base_path=self.path, budget=25)
+        self.cache.session = FakeSession()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_download_once(self):
+        path = self.cache.get('http://a')
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(self.cache.get('http://a'), path)
+        self.assertEqual(len(self.cache.session.requests), 1)
+
+    def test_lru_eviction(self):
+        first = self.cache.get('http://a')
+        self.cache.get('http://b')
+        self.cache.get('http://c')
+        self.assertFalse(os.path.exists(first))
+        self.assertEqual(len(self.cache.index), 2)
+
+    def test_revalidation(self):
+        from qobuz.cache.image_cache import REVALIDATE_AFTER
+        path = self.cache.get('http://a')
+        for entry in self.cache.index.values():
+            entry['checked'] -= REVALIDATE_AFTER + 1
+        self.assertEqual(self.cache.get('http://a'), path)
+        _url, headers = self.cache.session.requests[-1]
+        self.assertEqual(headers['If-None-Match'], 'http://a')
+
+    def test_revalidation_of_missing_file(self):
+        from qobuz.cache.image_cache import REVALIDATE_AFTER
+        path = self.cache.get('http://a')
+        os.unlink(path)
+        for entry in self.cache.index.values():
+            entry['checked'] -= REVALIDATE_AFTER + 1
+        self.assertEqual(self.cache.get('http://a'), path)
+        self.assertTrue(os.path.exists(path))
+        _url, headers = self.cache.session.requests[-1]
+        self.assertEqual(headers, {})
+
+    def test_timeout(self):
+        from qobuz.api.raw import REQUEST_TIMEOUT
+        calls = []
+        get = self.cache.session.get
+
+        def timed_get(url, headers=None, **ka):
+            calls.append(ka.get('timeout'))
+            return get(url, headers=headers, **ka)
+
+        self.cache.session.get = timed_get
+        self.cache.get('http://a')
+        self.assertEqual(calls, [REQUEST_TIMEOUT])
+
+    def test_index_persisted(self):
+        from qobuz.cache.image_cache import ImageCache
+        path = self.cache.get('http://a')
+        cache = ImageCache(base_path=self.path, budget=25)
+        cache.session = FakeSession()
+        self.assertEqual(cache.get('http://a'), path)
+        self.assertEqual(len(cache.session.requests), 0)
+
+    def test_shared_between_processes(self):
+        from qobuz.cache.image_cache import ImageCache
+        self.cache.budget = 100
+        path_a = self.cache.get('http://a')
+        other = ImageCache(base_path=self.path, budget=25)
+        other.session = FakeSession()
+        other.get('http://b')
+        other.get('http://c')  # Evicts a, indexed by both
+        self.assertFalse(os.path.exists(path_a))
+        # Not synced yet, hits trust the index
+        self.assertEqual(self.cache.get('http://a'), path_a)
+        self.assertEqual(len(self.cache.session.requests), 1)
+        # Opening it failed, fetched again
+        self.assertEqual(self.cache.recover(path_a), path_a)
+        self.assertTrue(os.path.exists(path_a))
+        self.cache.get('http://d')
+        self.cache.sync()
+        cache = ImageCache(base_path=self.path, budget=100)
+        self.assertEqual(len(cache.index), 4)  # Merged, not overwritten
+
+    def test_derived_files_in_budget(self):
+        thumb = os.path.join(self.path, 'thumb-a-10.jpg')
+        with open(thumb, 'wb') as handle:
+            handle.write(b'y' * 10)
+        self.assertFalse(self.cache.touch(thumb))
+        self.assertTrue(self.cache.add(thumb))
+        self.assertTrue(self.cache.touch(thumb))
+        self.cache.get('http://a')
+        self.cache.get('http://b')  # Over budget, thumbnail used least
+        self.assertFalse(os.path.exists(thumb))
+        self.assertFalse(self.cache.touch(thumb))
@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import fixtures  # noqa
+
+from qobuz.cache import cache_util
+from qobuz.cache.connectivity import Connectivity
+from qobuz.cache.qobuz_cache import QobuzCache
+
+
+class FakeApi(object):
+    '''Remote answering when up, flagging the cache unreachable else'''
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.up = True
+        self.calls = 0
+
+    def fetch(self, *a, **ka):
+        self.calls += 1
+        if not self.up:
+            self.cache.connectivity.set_unreachable()
+            return None
+        self.cache.connectivity.set_reachable()
+        return {'call': self.calls}
+
+
+class TestOffline(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.cache = QobuzCache()
+        self.cache.base_path = self.path
+        self.cache.tags.base_path = os.path.join(self.path, 'tags')
+        self.cache.pins_path = os.path.join(self.path, 'pins.local')
+        self.cache.connectivity.path = os.path.join(self.path, 'offline')
+        self.ttl = 3600
+        self.cache.get_ttl = lambda *a, **ka: self.ttl
+        self.api = FakeApi(self.cache)
+        self.get = self.cache.cached(FakeApi.fetch).__get__(self.api)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_connectivity(self):
+        connectivity = Connectivity(os.path.join(self.path, 'marker'),
+                                    retry_after=0.05)
+        self.assertFalse(connectivity.offline)
+        connectivity.set_unreachable()
+        # Shared with other processes through the marker file
+        self.assertTrue(Connectivity(connectivity.path).offline)
+        time.sleep(0.06)
+        self.assertFalse(connectivity.offline)  # Time to retry remote
+        self.assertTrue(connectivity.set_reachable())
+        self.assertFalse(connectivity.set_reachable())
+        connectivity.forced = True
+        self.assertTrue(connectivity.offline)
+
+    def test_serve_stale_when_unreachable(self):
+        self.ttl = 0.001
+        self.assertEqual(self.get('/album/get', album_id=1), {'call': 1})
+        time.sleep(0.01)
+        self.api.up = False
+        self.assertEqual(self.get('/album/get', album_id=1), {'call': 1})
+        self.assertEqual(self.api.calls, 2)
+        # Degraded, other calls don't wait for remote
+        self.assertEqual(self.get('/album/get', album_id=1,
+                                  noRemote=True), {'call': 1})
+        self.assertIsNone(self.get('/album/get', album_id=2))
+        self.assertEqual(self.api.calls, 2)
+        self.cache.connectivity.retry_after = 0  # Time to retry remote
+        self.api.up = True
+        self.assertEqual(self.get('/album/get', album_id=1), {'call': 3})
+
+    def test_pinned_entries_are_not_evicted(self):
+        pinned = self.cache.make_key('/playlist/get', playlist_id=42)
+        other = self.cache.make_key('/playlist/get', playlist_id=43)
+        self.ttl = 0.05
+        self.get('/playlist/get', playlist_id=42)
+        self.get('/playlist/get', playlist_id=43)
+        self.cache.pin('playlist:42')
+        self.assertEqual(self.cache.get_stale_pinned(), [])
+        time.sleep(0.06)
+        cache_util.clean_old(self.cache)
+        self.assertTrue(os.path.exists(self.cache._make_path(pinned)))
+        self.assertFalse(os.path.exists(self.cache._make_path(other)))
+        self.assertEqual([(list(a), ka) for a, ka in
+                          self.cache.get_stale_pinned()],
+                         [(['/playlist/get'], {'playlist_id': 42})])
+        self.cache.unpin('playlist:42')
+        self.assertEqual(self.cache.get_stale_pinned(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
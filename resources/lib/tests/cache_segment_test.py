@@ -0,0 +1,123 @@
+import shutil
+import tempfile
+import unittest
+import fixtures  # noqa
+
+TRACK = b''.join(chr(i % 256) for i in range(100))
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, content=b'', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def iter_content(self, size):
+        for i in range(0, len(self.content), size):
+            yield self.content[i:i + size]
+
+    def close(self):
+        pass
+
+
+class FakeSession(object):
+    def __init__(self):
+        self.ranges = []
+        self.timeouts = []
+        self.ignore_range = False
+
+    def get(self, url, headers=None, **ka):
+        self.timeouts.append(ka.get('timeout'))
+        if self.ignore_range:
+            self.ranges.append(None)
+            return FakeResponse(200, TRACK, {
+                'content-type': 'audio/flac',
+                'content-length': str(len(TRACK))})
+        start, end = headers['Range'][len('bytes='):].split('-')
+        start, end = int(start), min(int(end), len(TRACK) - 1)
+        self.ranges.append((start, end))
+        return FakeResponse(206, TRACK[start:end + 1], {
+            'content-type': 'audio/flac',
+            'content-range': 'bytes %s-%s/%s' % (start, end, len(TRACK))})
+
+
+class TestSegmentCache(unittest.TestCase):
+    def setUp(self):
+        from qobuz.cache.segment_cache import SegmentCache
+        self.path = tempfile.mkdtemp()
+        self.cache = SegmentCache(base_path=self.path, segment_size=30,
+                                  budget=1000, read_ahead=0)
+        self.cache.session = FakeSession()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def read(self, start, end):
+        meta = self.cache.open('http://a', '1', 6, start=start)
+        self.assertEqual(meta['size'], len(TRACK))
+        return b''.join(self.cache.read('http://a', '1', 6, start, end,
+                                        chunk_size=7))
+
+    def test_range_reuse_segments(self):
+        self.assertEqual(self.read(35, 70), TRACK[35:71])
+        self.assertEqual(self.cache.session.ranges, [(30, 59), (60, 89)])
+        self.assertEqual(self.read(0, 99), TRACK)
+        self.assertEqual(self.cache.session.ranges,
+                         [(30, 59), (60, 89), (0, 29), (90, 99)])
+
+    def test_evict_lru(self):
+        self.cache.budget = 60
+        self.read(0, 99)
+        self.assertEqual(len(self.cache.segments), 2)
+        self.assertLessEqual(self.cache._total, 60)
+        self.assertEqual(self.read(60, 99), TRACK[60:])
+        self.assertEqual(len(self.cache.session.ranges), 4)
+
+    def test_read_ahead(self):
+        self.cache.read_ahead = 2
+        self.read(0, 10)
+        self.cache.pool.join()
+        self.assertEqual(sorted(self.cache.session.ranges),
+                         [(0, 29), (30, 59), (60, 89)])
+
+    def test_timeout(self):
+        from qobuz.api.raw import REQUEST_TIMEOUT
+        self.read(0, 10)
+        self.assertEqual(self.cache.session.timeouts, [REQUEST_TIMEOUT])
+
+    def test_range_ignored_by_upstream(self):
+        from qobuz.cache.segment_cache import RangeNotSupported
+        self.cache.session.ignore_range = True
+        for _ in range(2):
+            self.assertRaises(RangeNotSupported, self.cache.open,
+                              'http://a', '1', 6, start=40)
+        # Nothing stored inline, known afterward without request
+        self.assertEqual(self.cache.session.ranges, [None])
+        self.assertEqual(len(self.cache.segments), 0)
+
+    def test_evicted_before_open(self):
+        self.read(0, 29)
+        ensure = self.cache.ensure
+
+        def evicting_ensure(*a):
+            path = ensure(*a)
+            if len(self.cache.session.ranges) == 1:
+                self.cache.evict(budget=0)  # Another reader meanwhile
+            return path
+
+        self.cache.ensure = evicting_ensure
+        self.assertEqual(b''.join(self.cache.read('http://a', '1', 6, 0, 29)),
+                         TRACK[:30])
+        self.assertEqual(self.cache.session.ranges, [(0, 29), (0, 29)])
+
+    def test_segment_size_changed(self):
+        self.read(0, 99)
+        self.cache.segment_size = 40
+        # Offsets of 30 bytes segments would be wrong, fetched again
+        self.assertEqual(self.read(35, 70), TRACK[35:71])
+        self.assertEqual(self.cache.session.ranges[4:], [(0, 39), (40, 79)])
+        self.assertEqual(len(self.cache.segments), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
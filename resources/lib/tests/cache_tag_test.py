@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import unittest
+import fixtures  # noqa
+
+from qobuz.cache import tag_index
+from qobuz.cache.qobuz_cache import QobuzCache
+
+
+class TestTagInvalidation(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.cache = QobuzCache()
+        self.cache.base_path = self.path
+        self.cache.tags.base_path = os.path.join(self.path, 'tags')
+        self.cache.get_ttl = lambda *a, **ka: 3600
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def fill(self, *a, **ka):
+        key = self.cache.make_key(*a, **ka)
+        self.cache.fill(key, {'ok': True}, *a, **ka)
+        return key
+
+    def cached(self, key):
+        return os.path.exists(self.cache._make_path(key))
+
+    def test_invalidate_only_tagged_entries(self):
+        pages = [self.fill('/playlist/get', playlist_id=1, offset=offset)
+                 for offset in (0, 100)]
+        other = self.fill('/playlist/get', playlist_id=2)
+        favorites = [self.fill('/favorite/getUserFavorites', user_id=7,
+                               type=kind) for kind in ('albums', 'tracks')]
+        album = self.fill('/album/get', album_id=3)
+        self.assertEqual(self.cache.invalidate('playlist:1'), 2)
+        self.assertFalse(any(self.cached(key) for key in pages))
+        self.assertTrue(self.cached(other))
+        self.assertEqual(self.cache.invalidate('favorites:7'), 2)
+        self.assertFalse(any(self.cached(key) for key in favorites))
+        self.assertTrue(self.cached(album))
+        self.assertEqual(self.cache.invalidate('playlist:1'), 0)
+
+    def test_compact(self):
+        size = tag_index.COMPACT_SIZE
+        tag_index.COMPACT_SIZE = 1024
+        try:
+            for _ in range(100):
+                key = self.fill('/playlist/get', playlist_id=1)
+        finally:
+            tag_index.COMPACT_SIZE = size
+        path = self.cache.tags._make_path('playlist:1')
+        self.assertLess(os.path.getsize(path), 1024)
+        self.assertEqual(self.cache.tags.keys('playlist:1'), set([key]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -24,4 +24,23 @@ util_property_data = {
             }
         }
     }
-}
\ No newline at end of file
+}
+
+class FakeAddon(object):
+    def getLocalizedString(self, langId):
+        return 'lang-%s' % langId
+
+
+def install_app():
+    '''Nodes read the registry and strings at import time, give them an app
+    when none is running'''
+    from qobuz import config
+    from qobuz.registry import Registry
+
+    class FakeApp(object):
+        registry = Registry(None)
+        addon = FakeAddon()
+
+    if config.app is None:
+        config.app = FakeApp()
+    return config.app
@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+import unittest
+import fixtures  # noqa
+
+# Cold import budget of the VIEW path in ms, generous so slow CI boxes pass
+BUDGET = float(os.environ.get('QOBUZ_IMPORT_BUDGET', 400))
+
+HEAVY_MODULES = ['requests', 'PIL', 'HTMLParser', 'qobuz.player']
+
+SCRIPT = r'''
+import sys, time, types
+sys.path.insert(0, %(mock)r)
+sys.path.insert(0, %(lib)r)
+import xbmc, xbmcaddon, xbmcgui, xbmcplugin
+kodi_six = types.ModuleType('kodi_six')
+kodi_six.xbmc, kodi_six.xbmcaddon = xbmc, xbmcaddon
+kodi_six.xbmcgui, kodi_six.xbmcplugin = xbmcgui, xbmcplugin
+sys.modules['kodi_six'] = kodi_six
+sys.path.remove(%(mock)r)
+for name in ['xbmc', 'xbmcaddon', 'xbmcgui', 'xbmcplugin']:
+    del sys.modules[name]
+started = time.time()
+from qobuz.application import Application
+sys.argv = ['plugin://plugin.audio.qobuz/', '0', '?nt=2&mode=1']
+Application()
+import qobuz.renderer
+import qobuz.node.root, qobuz.node.inode, qobuz.node.album, qobuz.node.track
+elapsed = (time.time() - started) * 1000
+loaded = [m for m in %(heavy)r if sys.modules.get(m) is not None]
+sys.stdout.write('\n%%.1f|%%s\n' %% (elapsed, ','.join(loaded)))
+'''
+
+
+class TestImportTime(unittest.TestCase):
+    def test_view_path_cold_import(self):
+        lib = fixtures.qobuzPath
+        script = SCRIPT % {
+            'lib': lib,
+            'mock': os.path.join(lib, 'tests', 'mock'),
+            'heavy': HEAVY_MODULES
+        }
+        output = subprocess.check_output([sys.executable, '-c', script],
+                                         cwd=lib)
+        elapsed, loaded = output.strip().splitlines()[-1].split('|')
+        self.assertEqual(loaded, '',
+                         'heavy modules imported: %s' % loaded)
+        self.assertLess(float(elapsed), BUDGET)
+
+
+if __name__ == '__main__':
+    unittest.main()
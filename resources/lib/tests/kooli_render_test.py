@@ -0,0 +1,69 @@
+from os import path as P
+import sys
+import unittest
+import fixtures  # noqa
+
+from flask import Flask
+from jinja2 import DictLoader
+
+sys.path.append(P.join(P.dirname(P.abspath(__file__)), P.pardir, 'qobuz',
+                       'extension', 'kooli', 'kooli'))
+import render  # noqa: E402
+
+
+class TestRenderCache(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.jinja_loader = DictLoader({'album.j2': '{{ title }}'})
+        self.cache = render.RenderCache(size=2)
+        self.contexts = 0
+
+    def context(self):
+        self.contexts += 1
+        return {'title': 'Abbey Road'}
+
+    def respond(self, versions, image_size=600, method='GET', headers=None):
+        with self.app.test_request_context('/', method=method,
+                                           headers=headers):
+            return self.cache.respond('album.j2', '42', versions, image_size,
+                                      self.context)
+
+    def test_eviction(self):
+        for nid in ['1', '2', '3']:
+            self.cache.set('album.j2', nid, 'etag-%s' % nid, nid)
+        self.assertEqual(self.cache.statEvict, 1)
+        self.assertIsNone(self.cache.get('album.j2', '1', 'etag-1'))
+        self.assertEqual(self.cache.get('album.j2', '2', 'etag-2'), '2')
+        # 2 is most recent now, 3 goes first
+        self.cache.set('album.j2', '4', 'etag-4', '4')
+        self.assertIsNone(self.cache.get('album.j2', '3', 'etag-3'))
+        self.assertEqual(self.cache.get('album.j2', '2', 'etag-2'), '2')
+
+    def test_etag_changes(self):
+        etag = self.respond([100]).get_etag()[0]
+        self.assertEqual(self.respond([100]).get_etag()[0], etag)
+        self.assertNotEqual(self.respond([101]).get_etag()[0], etag)
+        self.assertNotEqual(self.respond([100], image_size=300).get_etag()[0],
+                            etag)
+
+    def test_if_none_match(self):
+        response = self.respond([100])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_data(), 'Abbey Road')
+        etag = response.get_etag()[0]
+        response = self.respond([100],
+                                headers={'If-None-Match': '"%s"' % etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.contexts, 1)
+
+    def test_head_not_rendered(self):
+        response = self.respond([100], method='HEAD')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.get_etag()[0])
+        self.assertEqual(self.respond(None, method='HEAD'), '')
+        self.assertEqual(self.contexts, 0)
+        self.assertEqual(self.cache.statMiss, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+from os import path as P
+import socket
+import sys
+import threading
+import time
+import unittest
+import fixtures  # noqa
+
+sys.path.append(P.join(P.dirname(P.abspath(__file__)), P.pardir, 'qobuz',
+                       'extension', 'kooli', 'kooli'))
+import server  # noqa: E402
+
+REQUEST = b'GET / HTTP/1.1\r\nHost: localhost\r\n\r\n'
+
+
+def wait_for(predicate, timeout=2):
+    deadline = time.time() + timeout
+    while not predicate():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class TestThreadPoolServer(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.blocking = True
+        self.server = server.ThreadPoolWSGIServer(
+            '127.0.0.1', 0, self.app, workers=1, queue_size=1)
+        self.port = self.server.socket.getsockname()[1]
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.sockets = []
+
+    def tearDown(self):
+        self.release.set()
+        for sock in self.sockets:
+            sock.close()
+        if self.thread.is_alive():
+            self.server.shutdown(timeout=1)
+
+    def app(self, environ, start_response):
+        if self.blocking:
+            self.release.wait(5)
+        start_response('200 OK', [('Content-Length', '2')])
+        return [b'ok']
+
+    def connect(self):
+        sock = socket.create_connection(('127.0.0.1', self.port))
+        sock.settimeout(3)
+        sock.sendall(REQUEST)
+        self.sockets.append(sock)
+        return sock
+
+    @classmethod
+    def read_all(cls, sock):
+        data = b''
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                return data
+            data += chunk
+
+    def test_busy_when_queue_full(self):
+        self.connect()
+        self.assertTrue(wait_for(lambda: self.server.statBusy == 1))
+        self.connect()  # Queued
+        self.assertTrue(wait_for(lambda: self.server.pool.pending == 1))
+        rejected = self.connect()
+        self.assertTrue(self.read_all(rejected).startswith(
+            b'HTTP/1.1 503'))
+        self.assertEqual(self.server.statRejected, 1)
+        self.assertFalse(self.server.drain(timeout=0.1))
+        start = time.time()
+        self.server.shutdown(timeout=0.5)
+        self.assertLess(time.time() - start, 2)
+        self.thread.join(1)
+        self.assertFalse(self.thread.is_alive())
+
+    def test_keep_alive_timeout(self):
+        self.blocking = False
+        saved = server.RequestHandler.timeout
+        server.RequestHandler.timeout = 0.2
+        try:
+            sock = self.connect()
+            start = time.time()
+            data = self.read_all(sock)  # Closed by the server when idle
+        finally:
+            server.RequestHandler.timeout = saved
+        self.assertTrue(data.startswith(b'HTTP/1.1 200'))
+        self.assertTrue(data.endswith(b'ok'))
+        self.assertLess(time.time() - start, 2)
+        self.assertTrue(self.server.drain(timeout=1))
+        self.server.shutdown(timeout=1)
+        self.assertTrue(wait_for(lambda: self.server.pool.active == 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+from os import path as P
+import sys
+import unittest
+import fixtures  # noqa
+
+from flask import Flask
+
+sys.path.append(P.join(P.dirname(P.abspath(__file__)), P.pardir, 'qobuz',
+                       'extension', 'kooli', 'kooli'))
+import stream  # noqa: E402
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.closed = False
+
+    def iter_content(self, chunk_size=1):
+        for index in range(0, len(self.content), chunk_size):
+            yield self.content[index:index + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession(object):
+    def __init__(self, response):
+        self.response = response
+        self.calls = []
+
+    def get(self, url, **ka):
+        self.calls.append((url, ka))
+        return self.response
+
+
+class TestParseRange(unittest.TestCase):
+    def test_parse_range(self):
+        self.assertIsNone(stream.parse_range(None, 100))
+        self.assertIsNone(stream.parse_range('items=0-1', 100))
+        self.assertEqual(stream.parse_range('bytes=10-19', 100), (10, 19))
+        # Open ended, suffix and clamped to size
+        self.assertEqual(stream.parse_range('bytes=10-', 100), (10, 99))
+        self.assertEqual(stream.parse_range('bytes=-30', 100), (70, 99))
+        self.assertEqual(stream.parse_range('bytes=-300', 100), (0, 99))
+        self.assertEqual(stream.parse_range('bytes=90-200', 100), (90, 99))
+        # Unsatisfiable
+        self.assertIs(stream.parse_range('bytes=-0', 100), False)
+        self.assertIs(stream.parse_range('bytes=100-', 100), False)
+        self.assertIs(stream.parse_range('bytes=20-10', 100), False)
+
+
+class TestProxy(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.saved = stream.upstream
+
+    def tearDown(self):
+        stream.upstream = self.saved
+
+    def test_range_forwarded(self):
+        response = FakeResponse(206, {
+            'Content-Type': 'audio/flac',
+            'Content-Range': 'bytes 2-5/10',
+            'Content-Length': '4',
+            'Set-Cookie': 'secret',
+        }, b'2345')
+        stream.upstream = FakeSession(response)
+        with self.app.test_request_context('/'):
+            result = stream.proxy('http://cdn/track', {
+                'Range': 'bytes=2-5',
+                'If-Range': '"etag"',
+                'Cookie': 'kodi',
+            }, chunk_size=3)
+            body = b''.join(result.response)
+        url, ka = stream.upstream.calls[0]
+        self.assertEqual(url, 'http://cdn/track')
+        self.assertEqual(ka['headers'], {'Range': 'bytes=2-5',
+                                         'If-Range': '"etag"'})
+        self.assertEqual(ka['timeout'], stream.REQUEST_TIMEOUT)
+        self.assertEqual(result.status_code, 206)
+        self.assertEqual(result.headers['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(result.headers['Content-Length'], '4')
+        self.assertNotIn('Set-Cookie', result.headers)
+        self.assertEqual(body, b'2345')
+        self.assertTrue(response.closed)
+
+    def test_upstream_error(self):
+        response = FakeResponse(403, {}, b'')
+        stream.upstream = FakeSession(response)
+        with self.app.test_request_context('/'):
+            result = stream.proxy('http://cdn/track', {})
+        self.assertEqual(result.status_code, 403)
+        self.assertTrue(response.closed)
+
+
+if __name__ == '__main__':
+    unittest.main()
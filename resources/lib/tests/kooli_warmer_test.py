@@ -0,0 +1,141 @@
+from os import path as P
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+import fixtures  # noqa
+
+from qobuz.api.user import User
+from qobuz.cache.qobuz_cache import QobuzCache
+
+sys.path.append(P.join(P.dirname(P.abspath(__file__)), P.pardir, 'qobuz',
+                       'extension', 'kooli', 'kooli'))
+import warmer  # noqa: E402
+
+
+class FakeApi(object):
+    def __init__(self, cache):
+        self.calls = []
+        self.get = cache.cached(FakeApi.fetch).__get__(self)
+
+    def fetch(self, *a, **ka):
+        self.calls.append((a, ka))
+        return {'call': len(self.calls)}
+
+
+class TestCacheWarmer(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.cache = QobuzCache()
+        self.cache.base_path = self.path
+        self.cache.tags.base_path = os.path.join(self.path, 'tags')
+        self.cache.pins_path = os.path.join(self.path, 'pins.local')
+        self.ttl = 3600
+        self.cache.get_ttl = lambda *a, **ka: self.ttl
+        self.api = FakeApi(self.cache)
+        self.user = User()
+        self.user.restore({'id': 7}, 'token')
+        self.saved = warmer.cache, warmer.api, warmer.user
+        warmer.cache, warmer.api, warmer.user = \
+            self.cache, self.api, self.user
+
+    def tearDown(self):
+        warmer.cache, warmer.api, warmer.user = self.saved
+        shutil.rmtree(self.path)
+
+    def make_warmer(self, **ka):
+        service = warmer.CacheWarmer(**ka)
+        service.get_tags = lambda: ['favorites:7', 'featured:new-releases']
+        return service
+
+    @staticmethod
+    def step(service, now):
+        '''Step and wait for the api call made in background'''
+        done = service.step(now)
+        service.join()
+        return done
+
+    def test_refresh_expiring_entries_within_budget(self):
+        self.ttl = 60
+        for offset in range(3):
+            self.api.get('/favorite/getUserFavorites', user_id=7,
+                         offset=offset)
+        self.ttl = 3600
+        self.api.get('/album/getFeatured', type='new-releases')
+        self.api.get('/album/get', album_id=42)  # Not warmed
+        del self.api.calls[:]
+        service = self.make_warmer(budget=2, gc_interval=3600)
+        now = time.time()
+        service.collected_on = now  # Not garbage time
+        self.assertTrue(self.step(service, now))
+        self.assertTrue(self.step(service, now + 1))
+        self.assertFalse(self.step(service, now + 2))  # Budget spent
+        self.assertEqual(len(self.api.calls), 2)
+        self.assertTrue(self.step(service, now + 10))  # New idle window
+        self.assertFalse(self.step(service, now + 11))  # Nothing left to warm
+        self.assertEqual(sorted(ka['offset'] for _, ka in self.api.calls),
+                         [0, 1, 2])
+        self.assertEqual(service.statRefresh, 3)
+        # Refreshed entries are fresh for ttl again
+        self.assertEqual(service.scan(now + 12), 0)
+
+    def test_refresh_expired_pinned_entries_first(self):
+        self.ttl = 60
+        self.api.get('/favorite/getUserFavorites', user_id=7, offset=0)
+        self.ttl = 0.01
+        self.api.get('/playlist/get', playlist_id=42)
+        self.cache.pin('playlist:42')
+        time.sleep(0.02)
+        del self.api.calls[:]
+        service = self.make_warmer(budget=1)
+        now = time.time()
+        self.assertEqual(service.scan(now), 2)
+        self.assertTrue(self.step(service, now))
+        self.assertEqual(self.api.calls,
+                         [(('/playlist/get',), {'playlist_id': 42})])
+        self.assertEqual(self.cache.get_stale_pinned(), [])
+
+    def test_login_before_warming_user_entries(self):
+        self.ttl = 60
+        self.api.get('/favorite/getUserFavorites', user_id=7, offset=0)
+        del self.api.calls[:]
+        self.user.init_states()
+        service = warmer.CacheWarmer()
+        service.get_tags = lambda: ['favorites:%s' % self.user.get_id()]
+        logins = []
+
+        def login():
+            logins.append(True)
+            self.user.restore({'id': 7}, 'token')
+            return True
+
+        service.login = login
+        now = time.time()
+        self.assertTrue(self.step(service, now))
+        self.assertEqual((len(logins), self.api.calls), (1, []))
+        self.assertTrue(self.step(service, now + 1))
+        self.assertEqual(self.api.calls, [(
+            ('/favorite/getUserFavorites', ), {'user_id': 7, 'offset': 0})])
+        self.assertEqual(len(logins), 1)
+
+    def test_incremental_garbage_collection(self):
+        self.ttl = 0.01
+        for album_id in range(5):
+            self.api.get('/album/get', album_id=album_id)
+        time.sleep(0.02)
+        service = self.make_warmer(budget=0, gc_batch=2, gc_interval=0)
+        now = time.time()
+        for i in range(2):
+            self.assertTrue(self.step(service, now + i))
+            self.assertIsNotNone(service.collector)
+        self.assertTrue(self.step(service, now + 2))
+        self.assertIsNone(service.collector)
+        self.assertEqual(service.statCollect, 5)
+        self.assertEqual([name for name in os.listdir(self.path)
+                          if name.endswith('.dat')], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
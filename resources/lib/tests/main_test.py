@@ -49,3 +49,14 @@ class TestMain(unittest.TestCase):
         self.assertEqual(registry.get('streamtype'), 'flac')
         self.assertRaises(ConfigParser.NoOptionError,
                           registry.get, 'UnknownKey')
+
+    def test_module_registry_cache(self):
+        from qobuz.registry import Registry
+        registry = Registry(None)
+        self.assertEqual(registry.get('pagination_limit', to='int'), 100)
+        self.assertEqual(registry.get('pagination_limit', to='int'), 100)
+        self.assertEqual(registry.get('pagination_limit'), '100')
+        self.assertEqual(registry.statBackendRead, 1)
+        registry.invalidate()
+        self.assertEqual(registry.get('pagination_limit'), '100')
+        self.assertEqual(registry.statBackendRead, 2)
@@ -0,0 +1,41 @@
+import unittest
+import fixtures  # noqa
+
+fixtures.install_app()
+from qobuz.node.friend import Node_friend  # noqa: E402
+from qobuz.node.friends import Node_friends  # noqa: E402
+from qobuz.node.inode import context_menu  # noqa: E402
+
+
+class FakeMenu(object):
+    def __init__(self):
+        self.entries = []
+
+    def add(self, **ka):
+        self.entries.append(ka)
+
+
+class TestContextMenu(unittest.TestCase):
+    def menu(self, node):
+        menu = FakeMenu()
+        context_menu.attach_context_menu(node, None, menu)
+        return [entry['cmd'] for entry in menu.entries]
+
+    def test_friends_under_same_parent(self):
+        parent = Node_friends()
+        alice = Node_friend(parent=parent).set_name('alice')
+        bob = Node_friend(parent=parent).set_name('bob')
+        self.assertNotEqual(context_menu._template_key(alice),
+                            context_menu._template_key(bob))
+        alice_cmds = self.menu(alice)
+        bob_cmds = self.menu(bob)
+        self.assertTrue(bob_cmds)
+        self.assertTrue(all('query=alice' in cmd for cmd in alice_cmds))
+        self.assertTrue(all('query=bob' in cmd for cmd in bob_cmds))
+        # Same friend again is served from its template
+        again = Node_friend(parent=parent).set_name('bob')
+        self.assertEqual(self.menu(again), bob_cmds)
+
+
+if __name__ == '__main__':
+    unittest.main()
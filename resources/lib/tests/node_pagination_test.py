@@ -0,0 +1,83 @@
+import threading
+import time
+import unittest
+import fixtures  # noqa
+
+fixtures.install_app()
+from qobuz.node.inode.pagination import FETCH_ALL_WORKERS  # noqa: E402
+from qobuz.node.inode.pagination import iter_fetched  # noqa: E402
+from qobuz.node.inode.pagination import remaining_offsets  # noqa: E402
+from qobuz.node.inode.pagination import submit_pages  # noqa: E402
+from qobuz.node.inode import pagination  # noqa: E402
+from qobuz.util.pool import WorkerPool  # noqa: E402
+
+
+class FakeNode(object):
+    def __init__(self, pagination_next=None, offset=0, limit=None,
+                 total=None):
+        self.pagination_next = pagination_next
+        self.pagination_next_offset = offset
+        self.pagination_limit = limit
+        self.pagination_total = total
+
+
+class FakePage(object):
+    def __init__(self, offset, delay=0, failed=False):
+        self.offset = offset
+        self.delay = delay
+        self.failed = failed
+        self.started = threading.Event()
+
+    def fetch(self, options=None):
+        self.started.set()
+        time.sleep(self.delay)
+        if self.failed:
+            return None
+        return {'offset': self.offset}
+
+
+class TestPagination(unittest.TestCase):
+    def test_remaining_offsets(self):
+        self.assertEqual(remaining_offsets(FakeNode()), [])
+        node = FakeNode('url', offset=50, limit=50, total=180)
+        self.assertEqual(remaining_offsets(node), [50, 100, 150])
+        node = FakeNode('url', offset=50, limit='50', total='100')
+        self.assertEqual(remaining_offsets(node), [50])
+        node = FakeNode('url', offset=50, limit=0, total=100)
+        self.assertEqual(remaining_offsets(node), [])
+
+    def test_pages_fetched_before_waiting(self):
+        pages = [FakePage(offset, delay=0.05) for offset in (50, 100)]
+        jobs = submit_pages(pages, None)
+        # Nothing waited yet, the caller populates the first page meanwhile
+        for page in pages:
+            self.assertTrue(page.started.wait(1))
+        self.assertEqual([data['offset'] for _, data in iter_fetched(jobs)],
+                         [50, 100])
+
+    def test_merged_in_order(self):
+        pages = [FakePage(50, delay=0.1), FakePage(100), FakePage(150)]
+        fetched = list(iter_fetched(submit_pages(pages, None)))
+        self.assertEqual([page.offset for page, _ in fetched], [50, 100, 150])
+        self.assertEqual([data['offset'] for _, data in fetched],
+                         [50, 100, 150])
+
+    def test_failed_page_skipped(self):
+        pages = [FakePage(50), FakePage(100, failed=True), FakePage(150)]
+        jobs = submit_pages(pages, None, WorkerPool(size=1))
+        fetched = list(iter_fetched(jobs))
+        self.assertEqual([page.offset for page, _ in fetched], [50, 150])
+
+    def test_bounded_across_directories(self):
+        # Nested directories of a depth -1 listing share the same workers
+        jobs = []
+        for _ in range(3):
+            pages = [FakePage(offset, delay=0.05) for offset in (50, 100)]
+            jobs.append(submit_pages(pages, None))
+        self.assertLessEqual(pagination._fetch_pool.active, FETCH_ALL_WORKERS)
+        for directory in jobs:
+            self.assertEqual(len(list(iter_fetched(directory))), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
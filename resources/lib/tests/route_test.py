@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import urllib
+import unittest
+import fixtures  # noqa
+
+from qobuz import route
+
+
+class TestRoute(unittest.TestCase):
+    def test_round_trip(self):
+        params = {
+            'mode': 1,
+            'nt': 256,
+            'nid': '4242',
+            'query': urllib.quote_plus('AC/DC & co=1+1 ?'),
+            'asLocalUrl': True,
+            'offset': None,
+            'nm': ''
+        }
+        url = route.build('plugin://plugin.audio.qobuz/', params)
+        base, paramstring = url.split('?', 1)
+        self.assertEqual(base, 'plugin://plugin.audio.qobuz/')
+        self.assertEqual(route.parse(paramstring), {
+            'mode': '1',
+            'nt': '256',
+            'nid': '4242',
+            'query': params['query'],
+            'asLocalUrl': 'True'
+        })
+        query = route.build('', {'query': u'Bj\xf6rk'}).split('?', 1)[1]
+        self.assertEqual(route.parse(query)['query'], 'Bj\xc3\xb6rk')
+
+    def test_invalid_parameters_dropped(self):
+        self.assertEqual(
+            route.parse('?nt=foo&nid=12&bar=1&search-type=albums&depth'),
+            {'nid': '12', 'search-type': 'albums'})
+        self.assertEqual(route.parse(''), {})
+
+    def test_cached_search_source(self):
+        self.assertEqual(route.parse('search-type=albums&source=cache'),
+                         {'search-type': 'albums', 'source': 'cache'})
+        self.assertEqual(route.parse('source=remote'), {'source': 'remote'})
+        self.assertEqual(route.parse('source=foo'), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
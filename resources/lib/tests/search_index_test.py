@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+import fixtures  # noqa
+
+from qobuz.cache.entity_cache import EntityStore
+from qobuz.cache.qobuz_cache import QobuzCache
+from qobuz.cache.search_index import SearchIndex, tokenize
+
+ALBUMS = {
+    'albums': {
+        'items': [
+            {'id': 'a1', 'title': u'Homogenic',
+             'artist': {'name': u'Björk'},
+             'label': {'name': u'One Little Indian'}},
+            {'id': 'a2', 'title': u'Abbey Road',
+             'artist': {'name': u'The Beatles'},
+             'label': {'name': u'Apple'}},
+            {'id': 'a3', 'title': u'Beatles For Sale',
+             'artist': {'name': u'The Beatles'}},
+        ]
+    }
+}
+FAVORITES = {
+    'tracks': {
+        'items': [
+            {'id': 7, 'title': u'Goldberg Variations: Aria',
+             'performer': {'name': u'Glenn Gould'},
+             'composer': {'name': u'Johann Sebastian Bach'}},
+        ]
+    }
+}
+
+
+class TestSearchIndex(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.index = SearchIndex(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize(u'Björk - Jóga'), [u'bjork', u'joga'])
+        self.assertEqual(tokenize('Bj\xc3\xb6rk'), [u'bjork'])  # utf8
+
+    def test_search(self):
+        self.assertEqual(self.index.add_payload('/album/search', ALBUMS), 3)
+        self.assertEqual(self.index.add_payload('/album/search', ALBUMS), 0)
+        search = self.index.search
+        self.assertEqual(search('bjork'), [('album', 'a1')])
+        self.assertEqual(search('indian'), [('album', 'a1')])
+        # Last word is a prefix, titles starting with the query first
+        self.assertEqual(search('beatl'), [('album', 'a3'), ('album', 'a2')])
+        self.assertEqual(search('beatles abb'), [('album', 'a2')])
+        self.assertEqual(search('beatles abb', kind='track'), [])
+        self.assertEqual(search('b'), [])  # Too short for a prefix
+        self.assertEqual(search('zappa'), [])
+
+    def test_persistence(self):
+        self.index.add_payload('/album/search', ALBUMS)
+        self.index.add_payload('/favorite/getUserFavorites', FAVORITES)
+        index = SearchIndex(self.path, compact_lines=2)
+        # Journal longer than compact_lines, merged into the snapshot
+        self.assertEqual(index.search('gould bach'), [('track', '7')])
+        self.assertEqual(index.statCompact, 1)
+        index.add_payload('/search/getResults', {
+            'artists': {'items': [{'id': 9, 'name': u'Glenn Miller'}]}})
+        self.assertEqual(len(index.search('glenn')), 2)  # Loaded, updated
+        index = SearchIndex(self.path)
+        self.assertEqual(index.search('glenn', kind='artist'),
+                         [('artist', '9')])
+        self.assertEqual(index.search('glenn', owned=True), [('track', '7')])
+        self.assertEqual(index.search('beatles sale'), [('album', 'a3')])
+
+    def test_compacted_by_another_process(self):
+        other = SearchIndex(self.path)
+        self.index.add_payload('/album/search', ALBUMS)
+        self.assertEqual(other.search('bjork'), [('album', 'a1')])
+        self.index.compact()
+        # Journal truncated, shorter than what other has read so far
+        self.index.add_payload('/favorite/getUserFavorites', FAVORITES)
+        self.assertEqual(other.search('gould'), [('track', '7')])
+        other.add_payload('/search/getResults', {
+            'artists': {'items': [{'id': 9, 'name': u'Glenn Miller'}]}})
+        other.compact()
+        self.assertEqual(len(self.index.search('glenn')), 2)
+        index = SearchIndex(self.path)
+        self.assertEqual(index.search('glenn', owned=True), [('track', '7')])
+        self.assertEqual(index.search('glenn', kind='artist'),
+                         [('artist', '9')])
+        self.assertEqual(len(index.search('beatles')), 2)
+
+    def test_search_local(self):
+        cache = QobuzCache()
+        cache.entities = EntityStore(self.path)
+        self.assertEqual(cache.search_local('album', 'apple'), [])
+        cache.search.base_path = os.path.join(self.path, 'search')
+        cache.entities.normalize(ALBUMS)
+        cache.search.add_payload('/album/search', ALBUMS)
+        cache.search.add_payload('/album/search', FAVORITES)  # No entity
+        cache.entities.store.clear()
+        items = cache.search_local('album', 'apple')
+        self.assertEqual(items, [ALBUMS['albums']['items'][1]])
+        self.assertEqual(cache.search_local('track', 'aria'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
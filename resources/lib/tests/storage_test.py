@@ -0,0 +1,164 @@
+from datetime import timedelta
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import fixtures  # noqa
+
+from qobuz.storage import (JournaledStorage, Storage, StorageView,
+                           TimedStorage, import_legacy)
+
+
+class TestJournaledStorage(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, 'userdata.local')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_sync_append_changes_only(self):
+        storage = JournaledStorage(self.filename)
+        for i in range(100):
+            storage['node-%s' % i] = {'image': ['http://x/%s.jpg' % i]}
+        storage.sync()
+        size = os.path.getsize(self.filename)
+        storage['node-0'] = {'image': []}
+        del storage['node-1']
+        storage.sync()
+        self.assertLess(os.path.getsize(self.filename) - size, 100)
+        self.assertTrue(storage.sync())  # Nothing pending, no write
+        with open(self.filename, 'ab') as handle:
+            handle.write('{"k": "node-2", "v"')  # Crash while writing
+        storage = JournaledStorage(self.filename)
+        self.assertEqual(len(storage), 99)
+        self.assertEqual(storage['node-0'], {'image': []})
+        self.assertNotIn('node-1', storage)
+        self.assertEqual(storage['node-2'], {'image': ['http://x/2.jpg']})
+
+    def test_compaction(self):
+        storage = JournaledStorage(self.filename, compact_min=10)
+        for i in range(50):
+            storage['current'] = i
+            storage.sync()
+        self.assertGreater(storage.statCompact, 0)
+        with open(self.filename) as handle:
+            self.assertLessEqual(len(handle.readlines()), 10)
+        self.assertEqual(JournaledStorage(self.filename)['current'], 49)
+
+    def test_compaction_keeps_other_process_changes(self):
+        first = JournaledStorage(self.filename, compact_min=10)
+        first['user-1/current_playlist'] = 1
+        first['user-1/gone'] = True
+        first.sync()
+        other = JournaledStorage(self.filename)
+        other['user-1/current_playlist'] = 2
+        del other['user-1/gone']
+        other.sync()
+        for i in range(20):  # Compacts with a stale view of other's keys
+            first['user-1/counter'] = i
+            first.sync()
+        self.assertGreater(first.statCompact, 0)
+        storage = JournaledStorage(self.filename)
+        self.assertEqual(storage['user-1/current_playlist'], 2)
+        self.assertNotIn('user-1/gone', storage)
+        self.assertEqual(first['user-1/current_playlist'], 2)
+
+    def test_import_legacy(self):
+        legacy = Storage(os.path.join(self.path, 'user-7.local'))
+        legacy['current_playlist'] = 3
+        legacy.sync()
+        legacy = Storage(os.path.join(self.path,
+                                      'userdata-7-favorite-42.local'))
+        legacy['image'] = ['a']
+        legacy.sync()
+        patterns = [(r'^user-(\w+)\.local$', 'user-{0}'),
+                    (r'^userdata-(\w+-\w+-\w+)\.local$', '{0}')]
+        storage = JournaledStorage(self.filename)
+        self.assertEqual(import_legacy(storage, self.path, patterns, 'done'),
+                         2)
+        self.assertEqual(sorted(os.listdir(self.path)),
+                         ['userdata.local', 'userdata.local.lock'])
+        storage = JournaledStorage(self.filename)
+        self.assertEqual(import_legacy(storage, self.path, patterns, 'done'),
+                         0)
+        self.assertEqual(storage['user-7/current_playlist'], 3)
+        self.assertEqual(storage['7-favorite-42/image'], ['a'])
+
+    def test_import_legacy_synced_first(self):
+        path = os.path.join(self.path, 'user-7.local')
+        legacy = Storage(path)
+        legacy['current_playlist'] = 3
+        legacy.sync()
+        storage = JournaledStorage(self.filename)
+        sync = storage.sync
+        synced = []
+
+        def racing_sync():
+            # Legacy file still there, removed meanwhile by another process
+            synced.append(os.path.exists(path))
+            os.unlink(path)
+            return sync()
+
+        storage.sync = racing_sync
+        patterns = [(r'^user-(\w+)\.local$', 'user-{0}')]
+        self.assertEqual(import_legacy(storage, self.path, patterns, 'done'),
+                         1)
+        self.assertEqual(synced, [True])
+        storage = JournaledStorage(self.filename)
+        self.assertEqual(storage['user-7/current_playlist'], 3)
+
+    def test_view(self):
+        storage = JournaledStorage(self.filename)
+        favorite = StorageView(storage, '1-favorite-42')
+        playlist = StorageView(storage, '1-playlist-42')
+        favorite['image'] = ['a']
+        playlist['image'] = ['b']
+        favorite.sync()
+        self.assertEqual(list(favorite), ['image'])
+        playlist.clear()
+        playlist.sync()
+        storage = JournaledStorage(self.filename)
+        self.assertEqual(dict(StorageView(storage, '1-favorite-42')),
+                         {'image': ['a']})
+        self.assertEqual(len(StorageView(storage, '1-playlist-42')), 0)
+        self.assertEqual(os.listdir(self.path).count('userdata.local'), 1)
+
+
+class TestTimedStorage(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, 'timed.local')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_expire(self):
+        storage = TimedStorage(self.filename, TTL=timedelta(seconds=60))
+        now = storage.now()
+        for i in range(10):
+            storage.__setitem__('old-%s' % i, ('x', now - 120), raw=True)
+            storage['new-%s' % i] = 'y'
+        storage.__setitem__('old-0', ('x', now), raw=True)  # Set again
+        with self.assertRaises(KeyError):
+            storage['old-1']
+        self.assertEqual(len(storage), 11)
+        self.assertEqual(storage['old-0'], 'x')
+        storage.sync()
+        with open(self.filename) as handle:
+            data = json.load(handle)
+        data['gone'] = ['z', now - 61]
+        data['legacy'] = ['z', now + 0.5]  # Float timestamps still load
+        with open(self.filename, 'w') as handle:
+            json.dump(data, handle)
+        storage = TimedStorage(self.filename, TTL=timedelta(seconds=60))
+        self.assertEqual(sorted(storage), ['legacy', 'new-0', 'new-1',
+                                           'new-2', 'new-3', 'new-4', 'new-5',
+                                           'new-6', 'new-7', 'new-8', 'new-9',
+                                           'old-0'])
+        self.assertEqual(storage.statExpired, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
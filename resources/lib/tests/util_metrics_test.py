@@ -0,0 +1,38 @@
+import unittest
+import fixtures  # noqa
+
+
+class TestMetrics(unittest.TestCase):
+    def test_render(self):
+        from qobuz.util.metrics import MetricRegistry
+        metrics = MetricRegistry()
+        counter = metrics.counter('foo_total', 'Foo', ['kind'])
+        counter.inc(kind='a')
+        counter.inc(2, kind='a')
+        histogram = metrics.histogram('bar_seconds', 'Bar', buckets=[0.1, 1])
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        metrics.collect('baz', 'Baz', lambda: [({}, 7)])
+        text = metrics.render()
+        self.assertIn('# TYPE foo_total counter\nfoo_total{kind="a"} 3\n',
+                      text)
+        self.assertIn('bar_seconds_bucket{le="0.1"} 1\n', text)
+        self.assertIn('bar_seconds_bucket{le="1"} 2\n', text)
+        self.assertIn('bar_seconds_bucket{le="+Inf"} 2\n', text)
+        self.assertIn('bar_seconds_count 2\nbar_seconds_sum 0.55\n', text)
+        self.assertIn('baz 7\n', text)
+
+    def test_profiler(self):
+        import time
+        from qobuz.util.profiler import SamplingProfiler
+        profiler = SamplingProfiler()
+        profiler.start(interval=0.001)
+        time.sleep(0.05)
+        stacks = profiler.stop()
+        self.assertIn('test_profiler (util_metrics_test.py', stacks)
+        line = stacks.splitlines()[0]
+        self.assertTrue(line.rsplit(' ', 1)[1].isdigit())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import threading
+import time
+import unittest
+import fixtures  # noqa
+
+
+class TestUtilPool(unittest.TestCase):
+    def test_map_keep_order(self):
+        from qobuz.util.pool import WorkerPool
+        pool = WorkerPool(size=3, idle_timeout=0.1)
+        self.assertEqual(pool.map(lambda x: x * 2, range(10)),
+                         [x * 2 for x in range(10)])
+
+    def test_job_error(self):
+        from qobuz.util.pool import WorkerPool
+        pool = WorkerPool(size=1, idle_timeout=0.1)
+
+        def fail():
+            raise ValueError('boom')
+
+        job = pool.submit(fail)
+        self.assertIsNone(job.wait())
+        self.assertIsInstance(job.error, ValueError)
+
+    def test_workers_exit_when_idle(self):
+        from qobuz.util.pool import WorkerPool
+        pool = WorkerPool(size=2, idle_timeout=0.05)
+        event = threading.Event()
+        pool.submit(event.set).wait()
+        pool.join()
+        for _i in range(100):
+            if pool.active == 0:
+                break
+            time.sleep(0.01)
+        self.assertEqual(pool.active, 0)
@@ -0,0 +1,50 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import fixtures  # noqa
+
+
+class TestTracer(unittest.TestCase):
+    def test_disabled(self):
+        from qobuz.util.trace import Tracer, NULL_SPAN
+        tracer = Tracer()
+        self.assertIs(tracer.span('foo'), NULL_SPAN)
+
+        @tracer.traced('bar')
+        def bar():
+            return 42
+
+        self.assertEqual(bar(), 42)
+        self.assertEqual(tracer.events, [])
+
+    def test_summary_and_chrome_trace(self):
+        from qobuz.util.trace import Tracer
+        tracer = Tracer()
+        tracer.enable()
+
+        @tracer.traced()
+        def populate():
+            with tracer.span('fetch'):
+                pass
+
+        populate()
+        populate()
+        names = dict((s[0], s[1]) for s in tracer.summary())
+        self.assertEqual(names, {'populate': 2, 'fetch': 2})
+        self.assertIn('populate', tracer.format_summary())
+        path = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(path, 'trace.json')
+            self.assertTrue(tracer.dump(filename))
+            with open(filename) as handle:
+                events = json.load(handle)['traceEvents']
+            self.assertEqual(len(events), 4)
+            self.assertEqual(events[0]['ph'], 'X')
+        finally:
+            shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    unittest.main()